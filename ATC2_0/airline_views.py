@@ -1,6 +1,8 @@
-from django.views.generic import CreateView, DeleteView, UpdateView, ListView
+from django.views.generic import CreateView, DeleteView, UpdateView
 from django.forms import ModelForm, ModelMultipleChoiceField
 from django.urls import reverse_lazy
+from .list_cache import CachedList
+from .pagination import KeysetListView
 from .models import Airline, Airport
 
 FIELDS = ["name", "airports"]
@@ -43,8 +45,10 @@ class AirlineForm(ModelForm):
         return instance
 
 
-class AirlineList(ListView):
-    queryset = Airline.objects.order_by("name")
+class AirlineList(CachedList, KeysetListView):
+    model = Airline
+    depends_on = (Airline,)
+    key = "name"
     template_name = "airline/index.html"
 
 
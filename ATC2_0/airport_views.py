@@ -1,6 +1,8 @@
-from django.views.generic import CreateView, DeleteView, UpdateView, ListView
+from django.views.generic import CreateView, DeleteView, UpdateView
 from django.forms import ModelForm, ModelMultipleChoiceField
 from django.urls import reverse_lazy
+from .list_cache import CachedList
+from .pagination import KeysetListView
 from .models import Airport, Airline
 
 FIELDS = ["name", "x", "y", "airlines"]
@@ -14,8 +16,10 @@ class AirportForm(ModelForm):
     airlines = ModelMultipleChoiceField(required=False, queryset=Airline.objects.all())
 
 
-class AirportList(ListView):
-    queryset = Airport.objects.order_by("name")
+class AirportList(CachedList, KeysetListView):
+    model = Airport
+    depends_on = (Airport,)
+    key = "name"
     template_name = "airport/index.html"
 
 
@@ -0,0 +1,593 @@
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from threading import RLock, local
+from time import monotonic
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import list_cache, metrics
+from .authorization import AuthorizationMatrix
+from .bulk_load import batches
+from .changes import ChangeJournal
+from .flight_windows import FlightWindowIndex, GateTimeline, OccupancyIndex
+from .geometry import geometry
+from .models import AirspaceChange, Plane, Airport, Gate, Runway
+
+PLANE_FIELDS = ("identifier", "size", "currentPassengerCount", "maxPassengerCount", "airline_id", "gate_id",
+                "runway_id", "take_off_airport_id", "land_airport_id", "heading", "speed", "take_off_time",
+                "landing_time", "arrive_at_gate_time", "arrive_at_runway_time")
+TIME_FIELDS = ("take_off_time", "landing_time", "arrive_at_gate_time", "arrive_at_runway_time")
+AIRPORT_FIELDS = ("name", "x", "y")
+SPOT_FIELDS = ("identifier", "size", "airport_id")
+# seconds a missing change id is looked for again, it may belong to a transaction that has not committed yet
+CHANGE_GAP_TIMEOUT = 30
+MAX_CHANGE_GAPS = 1000
+
+
+def pk_of(record):
+    return None if record is None else record.pk
+
+
+def aware(moment):
+    if moment is not None and settings.USE_TZ and timezone.is_naive(moment):
+        return timezone.make_aware(moment)
+    return moment
+
+
+class PlaneRecord:
+    __slots__ = ("pk",) + PLANE_FIELDS
+
+    def __init__(self, pk, **fields):
+        self.pk = pk
+        for field in PLANE_FIELDS:
+            setattr(self, field, fields.get(field))
+
+    @property
+    def take_off_airport(self):
+        return airspace.airport_by_pk(self.take_off_airport_id)
+
+    @property
+    def land_airport(self):
+        return airspace.airport_by_pk(self.land_airport_id)
+
+    @property
+    def route(self):
+        return self.take_off_airport_id, self.land_airport_id
+
+    def __repr__(self):
+        return f"<PlaneRecord {self.identifier}>"
+
+
+class AirportRecord:
+    __slots__ = ("pk",) + AIRPORT_FIELDS
+
+    def __init__(self, pk, name, x, y):
+        self.pk = pk
+        self.name = name
+        self.x = x
+        self.y = y
+
+
+class SpotRecord:
+    """A gate or a runway."""
+    __slots__ = ("pk",) + SPOT_FIELDS
+
+    def __init__(self, pk, identifier, size, airport_id):
+        self.pk = pk
+        self.identifier = identifier
+        self.size = size
+        self.airport_id = airport_id
+
+
+class AirspaceStore:
+    """Process-resident copy of the flight state the publish handlers read.
+
+    Loaded from the database on first use and written through on every publish via save_plane. Changes made
+    elsewhere in this process (forms, admin) reach it through the model signals in signals.py.
+
+    Every write, here or through the signals, is also logged as an AirspaceChange row. sync(), run before each
+    publish, reads the rows logged since the last one and so catches up on what other processes wrote: the planes
+    they changed are read again and any change to the airports, gates or runways loads everything again. The row ids
+    are the versions of the snapshot API, the same in every process.
+    """
+
+    def __init__(self):
+        self.lock = RLock()
+        self._deferred = local()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self._loaded = False
+            self._planes = {}
+            self._plane_pks = {}
+            self._airports = {}
+            self._airport_pks = {}
+            self._gates = {}
+            self._gate_pks = {}
+            self._runways = {}
+            self._runway_pks = {}
+            self._by_route = defaultdict(set)
+            self._by_gate = defaultdict(set)
+            self._by_runway = defaultdict(set)
+            self.windows = FlightWindowIndex()
+            self.runway_slots = OccupancyIndex()
+            self.gate_timeline = GateTimeline()
+            self.authorizations = AuthorizationMatrix()
+            self.journal = ChangeJournal()
+            # this store's own rows in the change log, which it has applied already
+            self.source = uuid.uuid4().hex
+            self._seen = 0
+            self._gaps = {}
+            self._removed = {}
+            self._synced = self._pruned = monotonic()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def load(self):
+        with self.lock:
+            if self._loaded:
+                return
+            self.clear()
+            # routes are cached by airport pk, the airports read below may have moved since
+            geometry.clear()
+            # read first, what is logged while the rows are read is applied again by the next sync
+            seen = AirspaceChange.objects.aggregate(latest=Max("pk"))["latest"] or 0
+            for row in Airport.objects.values("pk", *AIRPORT_FIELDS):
+                self._put_airport(AirportRecord(**row))
+            self._load_airlines()
+            for row in Gate.objects.values("pk", *SPOT_FIELDS):
+                self._put_spot(SpotRecord(**row), self._gates, self._gate_pks)
+            for row in Runway.objects.values("pk", *SPOT_FIELDS):
+                self._put_spot(SpotRecord(**row), self._runways, self._runway_pks)
+            for row in Plane.objects.values("pk", *PLANE_FIELDS):
+                self._index_plane(PlaneRecord(**row))
+            self._seen = seen
+            self.journal.reset(seen)
+            self._loaded = True
+
+    def _load_airlines(self, airport_pks=None):
+        through = Airport.airlines.through.objects.all()
+        if airport_pks is None:
+            self.authorizations.load(through.values_list("airport_id", "airline_id"))
+            return
+        airline_ids = defaultdict(list)
+        for airport_id, airline_id in through.filter(airport_id__in=airport_pks).values_list("airport_id",
+                                                                                             "airline_id"):
+            airline_ids[airport_id].append(airline_id)
+        for pk in airport_pks:
+            self.authorizations.set_airport(pk, airline_ids[pk])
+
+    # lookups, falling back to the database for rows created by another process
+
+    def plane(self, identifier):
+        with self.lock:
+            self.load()
+            record = self._planes.get(identifier)
+            if record is None:
+                row = Plane.objects.filter(identifier=identifier).values("pk", *PLANE_FIELDS).first()
+                if row is not None:
+                    record = PlaneRecord(**row)
+                    self._index_plane(record)
+            return record
+
+    def planes(self):
+        with self.lock:
+            self.load()
+            return list(self._plane_pks.values())
+
+    def airport(self, name):
+        with self.lock:
+            self.load()
+            record = self._airports.get(name)
+            if record is None:
+                row = Airport.objects.filter(name=name).values("pk", *AIRPORT_FIELDS).first()
+                if row is not None:
+                    record = self._put_airport(AirportRecord(**row))
+                    self._load_airlines([record.pk])
+            return record
+
+    def airport_by_pk(self, pk):
+        if pk is None:
+            return None
+        with self.lock:
+            self.load()
+            return self._airport_pks.get(pk)
+
+    def gate(self, identifier):
+        return self._spot(identifier, Gate, self._gates, self._gate_pks)
+
+    def runway(self, identifier):
+        return self._spot(identifier, Runway, self._runways, self._runway_pks)
+
+    def _spot(self, identifier, model, spots, spot_pks):
+        with self.lock:
+            self.load()
+            record = spots.get(identifier)
+            if record is None:
+                row = model.objects.filter(identifier=identifier).values("pk", *SPOT_FIELDS).first()
+                if row is not None:
+                    record = self._put_spot(SpotRecord(**row), spots, spot_pks)
+            return record
+
+    def in_flight(self, moment=None):
+        """Planes airborne at `moment`, now by default. Reads what is loaded without loading, for the gauges."""
+        moment = moment or timezone.now()
+        with self.lock:
+            return len(self.windows.overlapping(moment, moment, padding=timedelta(0)))
+
+    def tracked(self):
+        with self.lock:
+            return len(self._plane_pks)
+
+    # snapshots
+
+    def version(self):
+        """The version of the planes, "<low>.<high>", which changes with every change to any of them.
+
+        high is the last change applied and low the last one before which none can still be missing, the same as
+        high unless a change logged before one already read has not committed yet.
+        """
+        with self.lock:
+            self.sync()
+            high = self._seen
+            low = min(self._gaps) - 1 if self._gaps else high
+            return f"{low}.{high}"
+
+    def snapshot(self, since=None):
+        """(version, planes, removed, full) for the snapshot API: the planes as plain dicts and the identifiers of
+        the planes deleted.
+
+        Given the version a client has, only the planes changed after it are returned, and removed lists those
+        deleted since; `full` says whether it is every plane instead, as it is when the version is from before the
+        store was last loaded or the airports, gates or runways the planes refer to changed.
+        """
+        with self.lock:
+            version = self.version()
+            changed = None
+            if since is not None:
+                try:
+                    changed = self.journal.since(int(since.partition(".")[0]))
+                except ValueError:
+                    pass
+            if changed is None:
+                planes, removed = list(self._plane_pks.values()), []
+            else:
+                planes = [self._plane_pks[pk] for pk, _ in changed if pk in self._plane_pks]
+                removed = [identifier for pk, identifier in changed if pk not in self._plane_pks]
+            return version, [self._describe(plane) for plane in planes], removed, changed is None
+
+    def _describe(self, plane: PlaneRecord):
+        origin = self._airport_pks.get(plane.take_off_airport_id)
+        destination = self._airport_pks.get(plane.land_airport_id)
+        gate = self._gate_pks.get(plane.gate_id)
+        runway = self._runway_pks.get(plane.runway_id)
+        return {
+            "identifier": plane.identifier,
+            "size": plane.size,
+            "origin": origin and origin.name,
+            "destination": destination and destination.name,
+            "heading": plane.heading,
+            "speed": plane.speed,
+            "gate": gate and gate.identifier,
+            "runway": runway and runway.identifier,
+            "take_off_time": plane.take_off_time,
+            "landing_time": plane.landing_time,
+            "arrive_at_gate_time": plane.arrive_at_gate_time,
+            "arrive_at_runway_time": plane.arrive_at_runway_time,
+            "passengers": plane.currentPassengerCount,
+        }
+
+    # airport authorizations
+
+    def authorized(self, airline_id, airport_id):
+        """Whether the airline may land at the airport."""
+        with self.lock:
+            self.load()
+            return self.authorizations.allowed(airline_id, airport_id)
+
+    def wrong_airport(self, planes):
+        """The planes whose airline may not land at their land airport, checked in one go."""
+        planes = list(planes)
+        with self.lock:
+            self.load()
+            allowed = self.authorizations.allowed_many([plane.airline_id for plane in planes],
+                                                       [plane.land_airport_id for plane in planes])
+        return [plane for plane, ok in zip(planes, allowed) if not ok]
+
+    # collision candidates
+
+    def flying(self, pks):
+        return [plane for plane in (self._plane_pks[pk] for pk in pks) if plane.landing_time is not None]
+
+    def head_on(self, plane: PlaneRecord):
+        with self.lock:
+            return self.flying(self._by_route.get((plane.land_airport_id, plane.take_off_airport_id), ()))
+
+    def behind(self, plane: PlaneRecord):
+        with self.lock:
+            return [other for other in self.flying(self._by_route.get(plane.route, ()))
+                    if other.landing_time > plane.landing_time]
+
+    def crossing(self, plane: PlaneRecord):
+        with self.lock:
+            routes = {plane.route, (plane.land_airport_id, plane.take_off_airport_id)}
+            return [other for other in self.flying(self.windows.overlapping(plane.take_off_time, plane.landing_time))
+                    if other.route not in routes]
+
+    def gate_conflicts(self, plane: PlaneRecord):
+        """Planes at the plane's gate arriving at the same time or not yet given a runway time, the plane included."""
+        with self.lock:
+            pks = self.gate_timeline.occupying(plane.gate_id)
+            pks.update(self.gate_timeline.arriving(plane.gate_id, plane.arrive_at_gate_time))
+            return [self._plane_pks[pk] for pk in sorted(pks)]
+
+    def runway_neighbours(self, plane: PlaneRecord, delta):
+        """Other planes due at the plane's runway less than `delta` from it."""
+        with self.lock:
+            return [self._plane_pks[pk] for pk in self.runway_slots.near(plane.runway_id, plane.arrive_at_runway_time,
+                                                                         delta) if pk != plane.pk]
+
+    # writes
+
+    def save_plane(self, plane: PlaneRecord, **fields):
+        """Write the given fields through to the database, then apply them here.
+
+        Inside deferred_writes() the database write is held back and done in bulk when the block exits.
+        """
+        for field in TIME_FIELDS:
+            if field in fields:
+                fields[field] = aware(fields[field])
+        pending = getattr(self._deferred, "pending", None)
+        if pending is None:
+            Plane.objects.filter(pk=plane.pk).update(**fields)
+            self.log(Plane, plane.pk)
+            list_cache.changed(Plane)
+        else:
+            pending.setdefault(plane.pk, (plane, set()))[1].update(fields)
+        with self.lock:
+            self._unindex_plane(plane)
+            for field, value in fields.items():
+                setattr(plane, field, value)
+            self._index_plane(plane)
+
+    @contextmanager
+    def deferred_writes(self, batch_size=500):
+        """Collect the save_plane writes made in this block and flush them in one transaction with bulk_update."""
+        if getattr(self._deferred, "pending", None) is not None:
+            yield
+            return
+        self._deferred.pending = pending = {}
+        try:
+            yield
+        finally:
+            # whatever was applied before an error is written too, as it would have been one message at a time
+            self._deferred.pending = None
+            self._flush(pending, batch_size)
+
+    def _flush(self, pending, batch_size):
+        if not pending:
+            return
+        by_fields = defaultdict(list)
+        for plane, fields in pending.values():
+            by_fields[tuple(sorted(fields))].append(plane)
+        try:
+            with transaction.atomic():
+                for fields, planes in by_fields.items():
+                    Plane.objects.bulk_update([Plane(pk=plane.pk, **{field: getattr(plane, field) for field in fields})
+                                               for plane in planes], fields, batch_size=batch_size)
+                AirspaceChange.objects.bulk_create([self._change(Plane, pk) for pk in pending], batch_size=batch_size)
+                list_cache.changed(Plane)
+        except Exception:
+            # the records are already ahead of the database, start over from what was committed
+            self.clear()
+            raise
+
+    # the change log
+
+    def _change(self, model, pk=None):
+        return AirspaceChange(kind=model._meta.model_name, object_pk=pk, source=self.source)
+
+    def log(self, model, pk=None):
+        """Log a write to a row of `model`, or to all of them without a pk, for the other processes to catch up on."""
+        self._change(model, pk).save()
+
+    def sync(self):
+        """Catch up on the changes logged since the last sync, loading everything on first use.
+
+        This store's own changes are only given their versions. The planes others changed are read again, unless
+        this thread has writes to them held back by deferred_writes(), which then win as the later ones. Anything
+        else they changed, or not having caught up for longer than the log is kept, loads everything again.
+        """
+        with self.lock:
+            retention = getattr(settings, "AIRSPACE_CHANGE_RETENTION", 3600)
+            now = monotonic()
+            if now - self._pruned > retention / 10:
+                self._pruned = now
+                AirspaceChange.objects.filter(created__lt=timezone.now() - timedelta(seconds=retention)).delete()
+            if self._loaded and now - self._synced > retention / 2:
+                self._loaded = False
+            if not self._loaded:
+                self.load()
+                return
+            changes = Q(pk__gt=self._seen)
+            if self._gaps:
+                changes |= Q(pk__in=list(self._gaps))
+            rows = list(AirspaceChange.objects.filter(changes).order_by("pk")
+                        .values_list("pk", "source", "kind", "object_pk"))
+            self._synced = now
+            plane = Plane._meta.model_name
+            pending = getattr(self._deferred, "pending", None) or {}
+            reread = {}
+            for version, source, kind, pk in rows:
+                self._gaps.pop(version, None)
+                if kind != plane:
+                    if source != self.source:
+                        self._loaded = False
+                        self.load()
+                        return
+                    self.journal.reset(max(version, self.journal.version))
+                elif source != self.source and pk not in pending:
+                    reread[pk] = version
+                elif pk in self._plane_pks:
+                    self.journal.touch(pk, self._plane_pks[pk].identifier, version)
+                elif pk in self._removed:
+                    self.journal.touch(pk, self._removed.pop(pk), version)
+            for chunk in batches(reread, 500):
+                found = {row["pk"]: row for row in Plane.objects.filter(pk__in=chunk).values("pk", *PLANE_FIELDS)}
+                for pk in chunk:
+                    current = self._plane_pks.get(pk)
+                    if current is not None:
+                        self._unindex_plane(current)
+                    if pk in found:
+                        current = PlaneRecord(**found[pk])
+                        self._index_plane(current)
+                    if current is not None:
+                        self.journal.touch(pk, current.identifier, reread[pk])
+            latest = max([self._seen] + [version for version, *_ in rows])
+            read = {version for version, *_ in rows}
+            for missing in range(self._seen + 1, latest):
+                if missing not in read:
+                    self._gaps[missing] = now + CHANGE_GAP_TIMEOUT
+            self._seen = latest
+            self._gaps = dict(sorted((version, expires) for version, expires in self._gaps.items()
+                                     if expires > now)[-MAX_CHANGE_GAPS:])
+
+    def _index_plane(self, plane: PlaneRecord):
+        self._planes[plane.identifier] = plane
+        self._plane_pks[plane.pk] = plane
+        self._by_route[plane.route].add(plane.pk)
+        if plane.gate_id is not None:
+            self._by_gate[plane.gate_id].add(plane.pk)
+        if plane.runway_id is not None:
+            self._by_runway[plane.runway_id].add(plane.pk)
+        self.windows.set(plane.pk, plane.take_off_time, plane.landing_time)
+        self.runway_slots.set(plane.pk, plane.runway_id, plane.arrive_at_runway_time)
+        self.gate_timeline.set(plane.pk, plane.gate_id, plane.arrive_at_gate_time, plane.arrive_at_runway_time)
+
+    def _unindex_plane(self, plane: PlaneRecord):
+        self._planes.pop(plane.identifier, None)
+        self._plane_pks.pop(plane.pk, None)
+        self._by_route[plane.route].discard(plane.pk)
+        if plane.gate_id is not None:
+            self._by_gate[plane.gate_id].discard(plane.pk)
+        if plane.runway_id is not None:
+            self._by_runway[plane.runway_id].discard(plane.pk)
+        self.windows.discard(plane.pk)
+        self.runway_slots.discard(plane.pk)
+        self.gate_timeline.discard(plane.pk)
+
+    def _put_airport(self, airport: AirportRecord):
+        current = self._airport_pks.get(airport.pk)
+        if current is None:
+            current = airport
+        else:
+            # planes hold on to airport records, so update in place
+            self._airports.pop(current.name, None)
+            current.name, current.x, current.y = airport.name, airport.x, airport.y
+        self._airports[current.name] = current
+        self._airport_pks[current.pk] = current
+        return current
+
+    @staticmethod
+    def _put_spot(spot: SpotRecord, spots, spot_pks):
+        current = spot_pks.pop(spot.pk, None)
+        if current is not None:
+            spots.pop(current.identifier, None)
+        spots[spot.identifier] = spot
+        spot_pks[spot.pk] = spot
+        return spot
+
+    # signal hooks, only needed once loaded as the first load reads the current rows anyway
+
+    def plane_changed(self, instance: Plane):
+        with self.lock:
+            if not self._loaded:
+                return
+            current = self._plane_pks.get(instance.pk)
+            if current is not None:
+                self._unindex_plane(current)
+            record = PlaneRecord(instance.pk, **{field: getattr(instance, field) for field in PLANE_FIELDS})
+            for field in TIME_FIELDS:
+                setattr(record, field, aware(getattr(record, field)))
+            self._index_plane(record)
+
+    def plane_deleted(self, pk):
+        with self.lock:
+            current = self._plane_pks.get(pk)
+            if current is not None:
+                self._unindex_plane(current)
+                # for the journal, once sync reads the change back
+                self._removed[pk] = current.identifier
+
+    def airport_changed(self, instance: Airport):
+        with self.lock:
+            if self._loaded:
+                self._put_airport(AirportRecord(instance.pk, instance.name, instance.x, instance.y))
+
+    def airport_deleted(self, pk):
+        with self.lock:
+            current = self._airport_pks.pop(pk, None)
+            if current is None:
+                return
+            self._airports.pop(current.name, None)
+            self.authorizations.discard_airport(pk)
+            # mirrors on_delete=SET_NULL, which does not send post_save for the planes
+            for plane in list(self._plane_pks.values()):
+                if pk in plane.route:
+                    self._unindex_plane(plane)
+                    if plane.take_off_airport_id == pk:
+                        plane.take_off_airport_id = None
+                    if plane.land_airport_id == pk:
+                        plane.land_airport_id = None
+                    self._index_plane(plane)
+
+    def airlines_changed(self, airport_pks=None):
+        with self.lock:
+            if self._loaded:
+                self._load_airlines(airport_pks)
+
+    def gate_changed(self, instance: Gate):
+        with self.lock:
+            if self._loaded:
+                self._put_spot(SpotRecord(instance.pk, instance.identifier, instance.size, instance.airport_id),
+                               self._gates, self._gate_pks)
+
+    def runway_changed(self, instance: Runway):
+        with self.lock:
+            if self._loaded:
+                self._put_spot(SpotRecord(instance.pk, instance.identifier, instance.size, instance.airport_id),
+                               self._runways, self._runway_pks)
+
+    def gate_deleted(self, pk):
+        with self.lock:
+            for plane_pk in self._by_gate.get(pk, ()):
+                self.gate_timeline.discard(plane_pk)
+        self._spot_deleted(pk, self._gates, self._gate_pks, self._by_gate, "gate_id")
+
+    def runway_deleted(self, pk):
+        with self.lock:
+            for plane_pk in self._by_runway.get(pk, ()):
+                self.runway_slots.discard(plane_pk)
+        self._spot_deleted(pk, self._runways, self._runway_pks, self._by_runway, "runway_id")
+
+    def _spot_deleted(self, pk, spots, spot_pks, by_spot, field):
+        with self.lock:
+            current = spot_pks.pop(pk, None)
+            if current is None:
+                return
+            spots.pop(current.identifier, None)
+            for plane_pk in by_spot.pop(pk, ()):
+                setattr(self._plane_pks[plane_pk], field, None)
+
+
+airspace = AirspaceStore()
+metrics.PLANES_IN_FLIGHT.set_function(airspace.in_flight)
+metrics.PLANES_TRACKED.set_function(airspace.tracked)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class Atc20Config(AppConfig):
     name = 'ATC2_0'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,83 @@
+from collections import defaultdict
+
+import numpy as np
+
+
+class AuthorizationMatrix:
+    """Which airlines serve which airports, as a boolean airline by airport matrix built from the Airport.airlines
+    table.
+
+    Airlines and airports get a row and a column the first time they are seen and the matrix grows by doubling, so
+    a single check is two dict lookups and an array read, and a whole batch of flights is checked with one fancy
+    index. Not thread safe; the owner locks.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._rows = {}
+        self._columns = {}
+        self._matrix = np.zeros((8, 8), dtype=bool)
+
+    def _grow(self, rows, columns):
+        height, width = self._matrix.shape
+        if rows <= height and columns <= width:
+            return
+        matrix = np.zeros((max(height * 2, rows), max(width * 2, columns)), dtype=bool)
+        matrix[:height, :width] = self._matrix
+        self._matrix = matrix
+
+    def _row(self, airline_id):
+        row = self._rows.get(airline_id)
+        if row is None:
+            row = self._rows[airline_id] = len(self._rows)
+            self._grow(len(self._rows), len(self._columns))
+        return row
+
+    def _column(self, airport_id):
+        column = self._columns.get(airport_id)
+        if column is None:
+            column = self._columns[airport_id] = len(self._columns)
+            self._grow(len(self._rows), len(self._columns))
+        return column
+
+    def load(self, pairs):
+        """Replaces everything with the given (airport_id, airline_id) pairs."""
+        self.clear()
+        airline_ids = defaultdict(list)
+        for airport_id, airline_id in pairs:
+            airline_ids[airport_id].append(airline_id)
+        for airport_id, airlines in airline_ids.items():
+            self.set_airport(airport_id, airlines)
+
+    def set_airport(self, airport_id, airline_ids):
+        column = self._column(airport_id)
+        rows = [self._row(airline_id) for airline_id in airline_ids]
+        self._matrix[:, column] = False
+        self._matrix[rows, column] = True
+
+    def discard_airport(self, airport_id):
+        column = self._columns.get(airport_id)
+        if column is not None:
+            self._matrix[:, column] = False
+
+    def airline_ids(self, airport_id):
+        column = self._columns.get(airport_id)
+        if column is None:
+            return set()
+        return {airline_id for airline_id, row in self._rows.items() if self._matrix[row, column]}
+
+    def allowed(self, airline_id, airport_id):
+        row = self._rows.get(airline_id)
+        column = self._columns.get(airport_id)
+        return row is not None and column is not None and bool(self._matrix[row, column])
+
+    def allowed_many(self, airline_ids, airport_ids):
+        """allowed() for every (airline, airport) pair, as a boolean array."""
+        rows = np.array([self._rows.get(airline_id, -1) for airline_id in airline_ids], dtype=np.intp)
+        columns = np.array([self._columns.get(airport_id, -1) for airport_id in airport_ids], dtype=np.intp)
+        known = (rows >= 0) & (columns >= 0)
+        allowed = np.zeros(len(rows), dtype=bool)
+        allowed[known] = self._matrix[rows[known], columns[known]]
+        return allowed
@@ -0,0 +1,175 @@
+import csv
+import io
+import os
+from itertools import islice
+
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+from .models import Airport, Airline, Gate, Runway, Plane
+
+
+def read_csv(path):
+    """(line number, row) for every row of a CSV, read as it goes."""
+    with open(path, newline="") as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Table:
+    """How one CSV maps onto a model: `key` are the fields a row is matched on, `fields` the ones written on
+    insert and `update` the ones an upsert overwrites."""
+
+    def __init__(self, model, key, fields, update=()):
+        self.model = model
+        self.key = key
+        self.fields = fields
+        self.update = update
+
+    def column(self, field):
+        return self.model._meta.get_field(field).column
+
+
+AIRPORTS = Table(Airport, ("name",), ("name", "x", "y"), update=("x", "y"))
+AIRLINES = Table(Airline, ("name",), ("name",))
+LINKS = Table(Airport.airlines.through, ("airport", "airline"), ("airport", "airline"))
+GATES = Table(Gate, ("identifier",), ("identifier", "airport", "size"), update=("airport", "size"))
+RUNWAYS = Table(Runway, ("identifier",), ("identifier", "airport", "size"), update=("airport", "size"))
+# flight state and passenger counts are only ever set by publishes, so a refresh leaves them alone
+PLANES = Table(Plane, ("identifier",), ("identifier", "airline", "size", "currentPassengerCount",
+                                       "maxPassengerCount"), update=("airline", "size", "maxPassengerCount"))
+
+
+class BulkLoader:
+    """Loads the datasets/ CSVs a batch at a time, resolving airport and airline names from in-memory maps.
+
+    Rows already in the database (matched on name or identifier) are left alone unless `upsert` is set, in which
+    case their columns are refreshed from the CSV; links between airports and airlines are only ever added. On
+    PostgreSQL every batch is COPYed into a staging table and merged with INSERT ... ON CONFLICT, elsewhere the ORM's
+    bulk_create and bulk_update are used. Bulk writes send no model signals.
+    """
+
+    def __init__(self, directory="datasets", batch_size=5000, upsert=False, copy=True):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.copy = copy and connection.vendor == "postgresql"
+        self.airports = {}
+        self.airlines = {}
+
+    def load(self):
+        """Rows read and rows written per table."""
+        counts = {}
+        with transaction.atomic():
+            counts["airports"] = self.write(AIRPORTS, self.rows("airport", lambda row: (
+                row["name"], float(row["x"]), float(row["y"]))))
+            counts["airlines"] = self.write(AIRLINES, self.rows("airline", lambda row: (row["name"],)))
+            self.airports = dict(Airport.objects.values_list("name", "pk"))
+            self.airlines = dict(Airline.objects.values_list("name", "pk"))
+            counts["airport / airlines"] = self.write(LINKS, self.rows("airport_airline", lambda row: (
+                self.airport(row["airport"]), self.airline(row["airline"]))))
+            counts["gates"] = self.write(GATES, self.rows("gate", lambda row: (
+                row["id"], self.airport(row["airport"]), row["size"])))
+            counts["runways"] = self.write(RUNWAYS, self.rows("runway", lambda row: (
+                row["id"], self.airport(row["airport"]), row["size"])))
+            counts["planes"] = self.write(PLANES, self.rows("plane", lambda row: (
+                row["id"], self.airline(row["airline"]), row["size"], 0, int(row["maxPassenger"]))))
+        return counts
+
+    def rows(self, name, convert):
+        path = os.path.join(self.directory, f"{name}.csv")
+        for line, row in read_csv(path):
+            try:
+                yield convert(row)
+            except (KeyError, ValueError) as error:
+                raise CommandError(f"{path}:{line}: {error}")
+
+    def airport(self, name):
+        try:
+            return self.airports[name]
+        except KeyError:
+            raise ValueError(f"unknown airport {name!r}")
+
+    def airline(self, name):
+        try:
+            return self.airlines[name]
+        except KeyError:
+            raise ValueError(f"unknown airline {name!r}")
+
+    def write(self, table, rows):
+        read = written = 0
+        for batch in batches(rows, self.batch_size):
+            read += len(batch)
+            # the last row for a key wins, as it would loading the rows one at a time
+            batch = list({tuple(row[table.fields.index(field)] for field in table.key): row
+                          for row in batch}.values())
+            written += self._copy(table, batch) if self.copy else self._bulk(table, batch)
+        return read, written
+
+    def _bulk(self, table, batch):
+        model = table.model
+        names = [f"{field}_id" if model._meta.get_field(field).is_relation else field for field in table.fields]
+        objects = [model(**dict(zip(names, row))) for row in batch]
+        key = [names[table.fields.index(field)] for field in table.key]
+        if len(key) > 1:
+            # the airport / airline links are only ever added
+            before = model.objects.count()
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+            return model.objects.count() - before
+        update = [names[table.fields.index(field)] for field in table.update]
+        existing = {}
+        # in chunks that stay under SQLite's limit on query parameters
+        for chunk in batches((getattr(obj, key[0]) for obj in objects), 900):
+            for values in model.objects.filter(**{f"{key[0]}__in": chunk}).values_list(key[0], "pk", *update):
+                existing[values[0]] = values[1:]
+        new = [obj for obj in objects if getattr(obj, key[0]) not in existing]
+        model.objects.bulk_create(new)
+        if not self.upsert or not update:
+            return len(new)
+        # only the rows that differ from the CSV are written
+        changed = []
+        for obj in objects:
+            current = existing.get(getattr(obj, key[0]))
+            if current is not None and tuple(current[1:]) != tuple(getattr(obj, name) for name in update):
+                obj.pk = current[0]
+                changed.append(obj)
+        model.objects.bulk_update(changed, update)
+        return len(new) + len(changed)
+
+    def _copy(self, table, batch):
+        quote = connection.ops.quote_name
+        target = quote(table.model._meta.db_table)
+        staging = quote(f"{table.model._meta.db_table}_staging")
+        columns = ", ".join(quote(table.column(field)) for field in table.fields)
+        key = ", ".join(quote(table.column(field)) for field in table.key)
+        if self.upsert and table.update:
+            update = [quote(table.column(field)) for field in table.update]
+            conflict = "DO UPDATE SET " + ", ".join(f"{column} = EXCLUDED.{column}" for column in update)
+            # leaves the rows that already match alone
+            current = ", ".join(f"{target}.{column}" for column in update)
+            loaded = ", ".join(f"EXCLUDED.{column}" for column in update)
+            conflict += f" WHERE ({current}) IS DISTINCT FROM ({loaded})"
+        else:
+            conflict = "DO NOTHING"
+        data = io.StringIO()
+        csv.writer(data).writerows(batch)
+        data.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TEMPORARY TABLE {staging} AS "
+                           f"SELECT {columns} FROM {target} WITH NO DATA")
+            cursor.copy_expert(f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)", data)
+            cursor.execute(f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {staging} "
+                           f"ON CONFLICT ({key}) {conflict}")
+            written = cursor.rowcount
+            cursor.execute(f"DROP TABLE {staging}")
+        return written
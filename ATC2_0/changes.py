@@ -0,0 +1,39 @@
+from collections import OrderedDict
+
+
+class ChangeJournal:
+    """Remembers the version of the latest change to each plane so that a client can ask for the ones after the
+    version it has.
+
+    Versions are AirspaceChange ids, so they mean the same in every process. Only the latest change to each plane is
+    kept, in version order, so the journal is never bigger than the number of planes and reading the changes after a
+    version only looks at those. Nothing before `start` is known; reset() moves it up, after which every client with
+    an older version needs everything again. Not thread safe; the owner locks.
+    """
+
+    def __init__(self, start=0):
+        self.reset(start)
+
+    def reset(self, start=0):
+        self.start = start
+        self.version = start
+        self._changes = OrderedDict()
+
+    def touch(self, pk, identifier, version):
+        # a change read late, after one with a higher version, takes the highest version so the order stays that
+        self.version = max(self.version, version)
+        self._changes.pop(pk, None)
+        self._changes[pk] = (self.version, identifier)
+
+    def since(self, version):
+        """(pk, identifier) of the planes changed after `version`, oldest change first, or None when the journal
+        does not go back that far and the client has to start over."""
+        if not self.start <= version <= self.version:
+            return None
+        changed = []
+        for pk, (changed_at, identifier) in reversed(self._changes.items()):
+            if changed_at <= version:
+                break
+            changed.append((pk, identifier))
+        changed.reverse()
+        return changed
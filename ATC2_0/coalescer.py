@@ -0,0 +1,77 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, local
+from time import monotonic
+
+from django.conf import settings
+
+
+def warning_key(data):
+    return data.get("team_id"), data.get("error"), data.get("obj_type"), data.get("id")
+
+
+class WarningCoalescer:
+    """Collapses repeats of the same (team_id, error, obj_type, id) warning.
+
+    A warning is let through once per `ttl` seconds, and at most once inside a publish() block whatever the ttl.
+    Entries all live for the same ttl, so the OrderedDict is also in expiry order and expiring is popping its front.
+    """
+
+    def __init__(self, ttl=None, clock=monotonic):
+        self._ttl = ttl
+        self.clock = clock
+        self._lock = Lock()
+        self._expires = OrderedDict()
+        self._publish = local()
+
+    @property
+    def ttl(self):
+        return getattr(settings, "WARNING_COALESCE_TTL", 60) if self._ttl is None else self._ttl
+
+    def clear(self):
+        with self._lock:
+            self._expires.clear()
+
+    @contextmanager
+    def publish(self):
+        if getattr(self._publish, "sent", None) is not None:
+            yield
+            return
+        self._publish.sent = set()
+        try:
+            yield
+        finally:
+            self._publish.sent = None
+
+    def should_send(self, data):
+        key = warning_key(data)
+        sent = getattr(self._publish, "sent", None)
+        if sent is not None:
+            if key in sent:
+                return False
+            sent.add(key)
+        now = self.clock()
+        with self._lock:
+            while self._expires:
+                oldest, expires = next(iter(self._expires.items()))
+                if expires > now:
+                    break
+                del self._expires[oldest]
+            if key in self._expires:
+                return False
+            if self.ttl > 0:
+                self._expires[key] = now + self.ttl
+        return True
+
+
+coalescer = WarningCoalescer()
+
+
+def one_publish(function):
+    """Run `function` as a single publish, sending each distinct warning from it at most once."""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with coalescer.publish():
+            return function(*args, **kwargs)
+    return wrapper
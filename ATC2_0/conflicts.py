@@ -0,0 +1,221 @@
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from math import floor, inf, nan
+from types import SimpleNamespace
+
+import numpy as np
+
+from .flight_windows import PADDING, to_utc
+from .geometry import geometry
+from .helpers import arrive_at_intersection_at_same_minute
+
+ROUTE_FIELDS = ("identifier", "take_off_airport_id", "take_off_airport__x", "take_off_airport__y", "land_airport_id",
+                "land_airport__x", "land_airport__y", "speed", "take_off_time")
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+US_PER_MINUTE = 60 * 10 ** 6
+US_PER_HOUR = 60 * US_PER_MINUTE
+MIN_US = (datetime.min - EPOCH) // MICROSECOND
+MAX_US = (datetime.max - EPOCH) // MICROSECOND
+
+# timedelta rounds to the microsecond and numpy does not, so any arrival this close to a minute boundary (or to the
+# ends of the datetime range) is handed back to the per-pair helper to keep the results identical
+BOUNDARY_US = 1000
+
+
+def wall_clock_us(moment: datetime):
+    if moment is None:
+        return nan
+    return float((moment.replace(tzinfo=None) - EPOCH) // MICROSECOND)
+
+
+def _column(values):
+    return np.array([nan if value is None else value for value in values], dtype=np.float64)
+
+
+def _airport(pk, x, y):
+    return None if pk is None else SimpleNamespace(pk=pk, x=x, y=y)
+
+
+class RouteBatch:
+    """Candidate planes for the T-bone check as (identifier, origin, destination, speed, take_off_time) rows."""
+    __slots__ = ("rows", "identifiers", "speed", "take_off")
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.identifiers = [row[0] for row in self.rows]
+        self.speed = _column(row[3] for row in self.rows)
+        self.take_off = np.array([wall_clock_us(row[4]) for row in self.rows], dtype=np.float64)
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        return cls((identifier, _airport(origin, x1, y1), _airport(destination, x2, y2), speed, take_off_time)
+                   for identifier, origin, x1, y1, destination, x2, y2, speed, take_off_time
+                   in queryset.values_list(*ROUTE_FIELDS))
+
+    @classmethod
+    def from_planes(cls, planes):
+        return cls((plane.identifier, plane.take_off_airport, plane.land_airport, plane.speed, plane.take_off_time)
+                   for plane in planes)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def by_route(self):
+        routes = defaultdict(list)
+        for index, (_, origin, destination, _, _) in enumerate(self.rows):
+            if origin is not None and destination is not None:
+                routes[(origin.pk, destination.pk)].append(index)
+        return routes
+
+    def as_plane(self, index):
+        identifier, origin, destination, speed, take_off_time = self.rows[index]
+        return SimpleNamespace(identifier=identifier, take_off_airport=origin, land_airport=destination, speed=speed,
+                               take_off_time=take_off_time)
+
+
+def _near_boundary(arrive):
+    offset = np.mod(arrive, US_PER_MINUTE)
+    return (offset < BOUNDARY_US) | (offset > US_PER_MINUTE - BOUNDARY_US) | \
+           (arrive < MIN_US + US_PER_MINUTE) | (arrive > MAX_US - US_PER_MINUTE)
+
+
+def tbone_conflicts(plane, batch: RouteBatch):
+    """Identifiers in `batch` that arrive_at_intersection_at_same_minute(plane, other) is true for.
+
+    Route intersections come from the geometry cache, one lookup per distinct candidate route; the arrival minutes
+    of every candidate are then computed in one vectorized pass.
+    """
+    if not len(batch):
+        return []
+    try:
+        speed = float(plane.speed)
+        take_off = wall_clock_us(plane.take_off_time)
+        route = geometry.route(plane.take_off_airport, plane.land_airport)
+    except (AttributeError, TypeError, ValueError):
+        # the per-pair helper fails on every candidate in these cases
+        return []
+    if route is None or speed == 0 or take_off != take_off:
+        return []
+
+    p1dist = np.full(len(batch), nan)
+    p2dist = np.full(len(batch), nan)
+    for indices in batch.by_route().values():
+        first = batch.rows[indices[0]]
+        crossing = geometry.crossing(route, geometry.route(first[1], first[2]))
+        if crossing is not None:
+            p1dist[indices] = crossing.distance
+            p2dist[indices] = crossing.other_distance
+
+    with np.errstate(all="ignore"):
+        p1arrive = take_off + p1dist / speed * US_PER_HOUR
+        p2arrive = batch.take_off + p2dist / batch.speed * US_PER_HOUR
+
+        valid = np.isfinite(p1arrive) & np.isfinite(p2arrive)
+        same_minute = valid & (np.floor(p1arrive / US_PER_MINUTE) == np.floor(p2arrive / US_PER_MINUTE))
+        recheck = valid & (_near_boundary(p1arrive) | _near_boundary(p2arrive))
+
+    conflicts = []
+    for index in np.flatnonzero(same_minute | recheck):
+        if recheck[index]:
+            if not arrive_at_intersection_at_same_minute(plane, batch.as_plane(index)):
+                continue
+        conflicts.append(batch.identifiers[index])
+    return conflicts
+
+
+HEAD_ON = "HEAD_ON"
+REAR = "REAR"
+INTERSECTION = "INTERSECTION"
+
+
+class Conflict(namedtuple("Conflict", ["kind", "first", "second"])):
+    """Two planes in conflict, by identifier. For REAR conflicts `second` lands later."""
+
+
+def _arrival_minutes(plane, distance):
+    """Minute buckets the plane may reach the point `distance` along its route in, two when close to a boundary."""
+    try:
+        arrive = wall_clock_us(plane.take_off_time) + distance / plane.speed * US_PER_HOUR
+    except (TypeError, ZeroDivisionError):
+        return ()
+    if arrive != arrive or arrive in (inf, -inf):
+        return ()
+    minute = floor(arrive / US_PER_MINUTE)
+    offset = arrive - minute * US_PER_MINUTE
+    if offset < BOUNDARY_US:
+        return minute, minute - 1
+    if offset > US_PER_MINUTE - BOUNDARY_US:
+        return minute, minute + 1
+    return minute,
+
+
+def _windows_overlap(plane, other):
+    return to_utc(other.take_off_time) <= to_utc(plane.landing_time) + PADDING and \
+           to_utc(other.landing_time) >= to_utc(plane.take_off_time) - PADDING
+
+
+def _crossing_conflicts(planes, others):
+    """Same-minute arrivals between two crossing routes, found with a hash join on the arrival minute."""
+    first, second = planes[0], others[0]
+    crossing = geometry.crossing(geometry.route(first.take_off_airport, first.land_airport),
+                                 geometry.route(second.take_off_airport, second.land_airport))
+    if crossing is None:
+        return
+    arrivals = defaultdict(list)
+    for other in others:
+        for minute in _arrival_minutes(other, crossing.other_distance):
+            arrivals[minute].append(other)
+    for plane in planes:
+        seen = set()
+        for minute in _arrival_minutes(plane, crossing.distance):
+            for other in arrivals.get(minute, ()):
+                if other.pk not in seen and _windows_overlap(plane, other) and \
+                        arrive_at_intersection_at_same_minute(plane, other):
+                    seen.add(other.pk)
+                    yield Conflict(INTERSECTION, *sorted((plane.identifier, other.identifier)))
+
+
+def scan_airspace(planes):
+    """Every conflict check_set1, check_set2 and check_set3 would report between the given planes.
+
+    Flights are bucketed by route. Head-on and rear conflicts are then pairs of buckets, and intersection conflicts
+    are found by sweeping the routes' overall time spans so that only routes that are airborne together get
+    compared, each such pair with a hash join on the minute its flights reach the crossing point. Apart from the
+    route pairs the work is linear in the number of flights plus the number of conflicts.
+    """
+    by_route = defaultdict(list)
+    for plane in planes:
+        if plane.landing_time is not None and plane.take_off_airport_id is not None and \
+                plane.land_airport_id is not None:
+            by_route[(plane.take_off_airport_id, plane.land_airport_id)].append(plane)
+
+    conflicts = []
+    for (origin, destination), flights in by_route.items():
+        if origin < destination:
+            for plane in flights:
+                for other in by_route.get((destination, origin), ()):
+                    conflicts.append(Conflict(HEAD_ON, *sorted((plane.identifier, other.identifier))))
+        flights = sorted(flights, key=lambda flight: to_utc(flight.landing_time))
+        for index, plane in enumerate(flights):
+            for other in flights[index + 1:]:
+                if other.landing_time > plane.landing_time:
+                    conflicts.append(Conflict(REAR, plane.identifier, other.identifier))
+
+    spans = []
+    for route, flights in by_route.items():
+        flights = [flight for flight in flights if flight.take_off_time is not None]
+        if flights:
+            spans.append((min(to_utc(flight.take_off_time) for flight in flights) - PADDING,
+                          max(to_utc(flight.landing_time) for flight in flights) + PADDING, route, flights))
+    spans.sort(key=lambda span: span[0])
+    active = []
+    for start, end, route, flights in spans:
+        active = [span for span in active if span[1] >= start]
+        for _, _, other_route, others in active:
+            if other_route != (route[1], route[0]):
+                conflicts.extend(_crossing_conflicts(flights, others))
+        active.append((start, end, route, flights))
+
+    return sorted(set(conflicts))
@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.views import View
+
+from .airspace import aware
+from .bulk_load import batches
+from .messages import parse_time
+from .models import Airport, Gate, Runway, Plane
+
+# rows fetched from the server-side cursor at a time, and rows written to the response at a time
+CHUNK_SIZE = 2000
+ROWS_PER_WRITE = 500
+
+
+def plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def csv_chunks(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for batch in batches(rows, ROWS_PER_WRITE):
+        writer.writerows([[plain(value) for value in row] for row in batch])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # an empty export is still a header
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(header, rows):
+    dumps = json.JSONEncoder(default=plain).encode
+    for batch in batches(rows, ROWS_PER_WRITE):
+        yield "".join(dumps(dict(zip(header, row))) + "\n" for row in batch)
+
+
+FORMATS = {
+    "csv": (csv_chunks, "text/csv"),
+    "ndjson": (ndjson_chunks, "application/x-ndjson"),
+}
+
+
+class Export(View):
+    """Streams the rows of `model` as CSV or NDJSON, straight from a server-side cursor so that memory use does not
+    depend on how many rows there are.
+
+    `columns` are (header, lookup) pairs read with values_list(). ?airport= and ?airline= take names, ?since= and
+    ?until= times; what they mean for each model is up to filter(), which ignores them unless overridden.
+    """
+    model = None
+    key = None
+    columns = ()
+
+    def filter(self, queryset, airport, airline, since, until):
+        return queryset
+
+    def get(self, request, fmt):
+        if fmt not in FORMATS:
+            raise Http404(f"no {fmt} export")
+        try:
+            since, until = (aware(parse_time(request.GET[name])) if request.GET.get(name) else None
+                            for name in ("since", "until"))
+        except (ValueError, OverflowError) as error:
+            return HttpResponseBadRequest(f"invalid time: {error}")
+        queryset = self.filter(self.model.objects.all(), request.GET.get("airport"), request.GET.get("airline"),
+                               since, until)
+        header = [name for name, _ in self.columns]
+        rows = queryset.order_by(self.key).values_list(*[lookup for _, lookup in self.columns])
+        chunks, content_type = FORMATS[fmt]
+        response = StreamingHttpResponse(chunks(header, rows.iterator(chunk_size=CHUNK_SIZE)),
+                                         content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{self.model._meta.model_name}s.{fmt}"'
+        return response
+
+
+class PlaneExport(Export):
+    """Planes with their flights. The time window keeps the flights in the air at some point inside it."""
+    model = Plane
+    key = "identifier"
+    columns = (("identifier", "identifier"), ("size", "size"), ("airline", "airline__name"),
+               ("origin", "take_off_airport__name"), ("destination", "land_airport__name"),
+               ("gate", "gate__identifier"), ("runway", "runway__identifier"), ("heading", "heading"),
+               ("speed", "speed"), ("take_off_time", "take_off_time"), ("landing_time", "landing_time"),
+               ("arrive_at_gate_time", "arrive_at_gate_time"), ("arrive_at_runway_time", "arrive_at_runway_time"),
+               ("passengers", "currentPassengerCount"), ("max_passengers", "maxPassengerCount"))
+
+    def filter(self, queryset, airport, airline, since, until):
+        if airport:
+            queryset = queryset.filter(Q(take_off_airport__name=airport) | Q(land_airport__name=airport))
+        if airline:
+            queryset = queryset.filter(airline__name=airline)
+        if since:
+            queryset = queryset.filter(landing_time__gte=since)
+        if until:
+            queryset = queryset.filter(take_off_time__lte=until)
+        return queryset
+
+
+class SpotExport(Export):
+    """Gates or runways. ?airline= keeps the ones at airports the airline serves and the time window the ones a
+    plane arrives at inside it."""
+    key = "identifier"
+    columns = (("identifier", "identifier"), ("size", "size"), ("airport", "airport__name"))
+    arrival = None
+
+    def filter(self, queryset, airport, airline, since, until):
+        if airport:
+            queryset = queryset.filter(airport__name=airport)
+        if airline:
+            queryset = queryset.filter(airport__in=Airport.airlines.through.objects.filter(
+                airline__name=airline).values("airport"))
+        if since or until:
+            spot = self.model._meta.model_name
+            arrivals = Plane.objects.filter(**{f"{spot}__isnull": False})
+            if since:
+                arrivals = arrivals.filter(**{f"{self.arrival}__gte": since})
+            if until:
+                arrivals = arrivals.filter(**{f"{self.arrival}__lte": until})
+            queryset = queryset.filter(pk__in=arrivals.values(spot))
+        return queryset
+
+
+class GateExport(SpotExport):
+    model = Gate
+    arrival = "arrive_at_gate_time"
+
+
+class RunwayExport(SpotExport):
+    model = Runway
+    arrival = "arrive_at_runway_time"
+
+
+class AirportExport(Export):
+    """Airports. ?airline= keeps the ones the airline serves and the time window the ones a flight takes off from
+    or lands at inside it."""
+    model = Airport
+    key = "name"
+    columns = (("name", "name"), ("x", "x"), ("y", "y"))
+
+    def filter(self, queryset, airport, airline, since, until):
+        if airport:
+            queryset = queryset.filter(name=airport)
+        if airline:
+            queryset = queryset.filter(pk__in=Airport.airlines.through.objects.filter(
+                airline__name=airline).values("airport"))
+        if since or until:
+            window = {}
+            if since:
+                window["__gte"] = since
+            if until:
+                window["__lte"] = until
+            take_offs = Plane.objects.filter(**{f"take_off_time{op}": time for op, time in window.items()})
+            landings = Plane.objects.filter(**{f"landing_time{op}": time for op, time in window.items()})
+            queryset = queryset.filter(Q(pk__in=take_offs.values("take_off_airport")) |
+                                       Q(pk__in=landings.values("land_airport")))
+        return queryset
@@ -0,0 +1,168 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import timedelta
+from math import inf
+
+from django.utils import timezone
+
+# arrive_at_intersection_at_same_minute only resolves to the minute, so windows are widened by that much
+PADDING = timedelta(minutes=1)
+
+
+def to_utc(moment):
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return timezone.make_naive(moment, timezone.utc)
+
+
+class FlightWindowIndex:
+    """Airborne take_off_time..landing_time windows keyed by plane, queryable by overlap.
+
+    Windows are kept sorted by start next to a sorted multiset of their lengths, so an overlap query only has to
+    look at windows starting between (start - longest window) and end. Not thread safe; the owner locks.
+    """
+
+    def __init__(self):
+        self._windows = {}
+        self._starts = []
+        self._durations = []
+
+    def __len__(self):
+        return len(self._windows)
+
+    def __contains__(self, key):
+        return key in self._windows
+
+    def clear(self):
+        self._windows = {}
+        self._starts = []
+        self._durations = []
+
+    def set(self, key, take_off_time, landing_time):
+        self.discard(key)
+        if take_off_time is None or landing_time is None:
+            return
+        start = to_utc(take_off_time)
+        end = to_utc(landing_time)
+        self._windows[key] = (start, end)
+        insort(self._starts, (start, key))
+        insort(self._durations, max(end - start, timedelta(0)))
+
+    def discard(self, key):
+        if key not in self._windows:
+            return
+        start, end = self._windows.pop(key)
+        del self._starts[bisect_left(self._starts, (start, key))]
+        del self._durations[bisect_left(self._durations, max(end - start, timedelta(0)))]
+
+    def overlapping(self, take_off_time, landing_time, padding=PADDING):
+        if not self._durations or take_off_time is None or landing_time is None:
+            return []
+        start = to_utc(take_off_time) - padding
+        end = to_utc(landing_time) + padding
+        lo = bisect_left(self._starts, (start - self._durations[-1],))
+        hi = bisect_right(self._starts, (end, inf))
+        return [key for _, key in self._starts[lo:hi] if self._windows[key][1] >= start]
+
+
+class OccupancyIndex:
+    """When planes are due at a spot (a runway or a gate), kept sorted per spot so the planes due around a given time
+    are found with two binary searches. Times are compared on the wall clock, as check_time_delta does, unless
+    `wall_clock` is false. Not thread safe; the owner locks.
+    """
+
+    def __init__(self, wall_clock=True):
+        self.wall_clock = wall_clock
+        self._slots = {}
+        self._by_spot = defaultdict(list)
+
+    def _time(self, moment):
+        return moment.replace(tzinfo=None) if self.wall_clock else to_utc(moment)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def clear(self):
+        self._slots = {}
+        self._by_spot = defaultdict(list)
+
+    def set(self, key, spot, moment):
+        self.discard(key)
+        if spot is None or moment is None:
+            return
+        slot = (self._time(moment), key)
+        self._slots[key] = (spot, slot)
+        insort(self._by_spot[spot], slot)
+
+    def discard(self, key):
+        if key not in self._slots:
+            return
+        spot, slot = self._slots.pop(key)
+        slots = self._by_spot[spot]
+        del slots[bisect_left(slots, slot)]
+        if not slots:
+            del self._by_spot[spot]
+
+    def near(self, spot, moment, delta):
+        """Keys due at `spot` less than `delta` before or after `moment`."""
+        slots = self._by_spot.get(spot)
+        if not slots or moment is None:
+            return []
+        moment = self._time(moment)
+        lo = bisect_right(slots, (moment - delta, inf))
+        hi = bisect_left(slots, (moment + delta, -inf))
+        return [key for _, key in slots[lo:hi]]
+
+    def at(self, spot, moment):
+        """Keys due at `spot` at exactly `moment`."""
+        slots = self._by_spot.get(spot)
+        if not slots or moment is None:
+            return []
+        moment = self._time(moment)
+        return [key for _, key in slots[bisect_left(slots, (moment, -inf)):bisect_right(slots, (moment, inf))]]
+
+
+class GateTimeline:
+    """Who is at each gate. A plane occupies its gate from arrive_at_gate_time until it is given a runway time; the
+    arrivals are kept sorted per gate and the occupancies still open in a set per gate, so neither question
+    check_gate asks has to look through the gate's history. Not thread safe; the owner locks.
+    """
+
+    def __init__(self):
+        self._arrivals = OccupancyIndex(wall_clock=False)
+        self._open = defaultdict(set)
+        self._gates = {}
+
+    def __len__(self):
+        return len(self._gates)
+
+    def clear(self):
+        self._arrivals.clear()
+        self._open = defaultdict(set)
+        self._gates = {}
+
+    def set(self, key, gate, arrive, leave):
+        self.discard(key)
+        if gate is None:
+            return
+        self._gates[key] = gate
+        self._arrivals.set(key, gate, arrive)
+        if leave is None:
+            self._open[gate].add(key)
+
+    def discard(self, key):
+        gate = self._gates.pop(key, None)
+        if gate is None:
+            return
+        self._arrivals.discard(key)
+        occupying = self._open.get(gate)
+        if occupying is not None:
+            occupying.discard(key)
+            if not occupying:
+                del self._open[gate]
+
+    def arriving(self, gate, moment):
+        return self._arrivals.at(gate, moment)
+
+    def occupying(self, gate):
+        return set(self._open.get(gate, ()))
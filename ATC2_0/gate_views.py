@@ -1,6 +1,8 @@
-from django.views.generic import CreateView, DeleteView, UpdateView, ListView
+from django.views.generic import CreateView, DeleteView, UpdateView
 from django.forms import ModelForm, ModelChoiceField
 from django.urls import reverse_lazy
+from .list_cache import CachedList
+from .pagination import KeysetListView
 from .models import Gate, Airport
 
 FIELDS = ["identifier", "size", "airport"]
@@ -14,8 +16,11 @@ class GateForm(ModelForm):
     airport = ModelChoiceField(required=True, queryset=Airport.objects.all())
 
 
-class GateList(ListView):
-    queryset = Gate.objects.order_by("identifier")
+class GateList(CachedList, KeysetListView):
+    model = Gate
+    depends_on = (Gate, Airport)
+    key = "identifier"
+    related = ("airport",)
     template_name = "gate/index.html"
 
 
@@ -0,0 +1,96 @@
+from threading import Lock
+
+from .helpers import calc_distance, calc_heading, get_route_intersection_point, calc_distance_with_tuple
+
+
+class Route:
+    """Geometry of the directed route between two airports.
+
+    The line through both airports is a * x + b * y = c.
+    """
+    __slots__ = ("origin", "destination", "distance", "heading", "a", "b", "c")
+
+    def __init__(self, origin, destination):
+        self.origin = origin
+        self.destination = destination
+        self.distance = calc_distance(origin, destination)
+        self.heading = calc_heading(origin, destination)
+        self.a = destination.y - origin.y
+        self.b = origin.x - destination.x
+        self.c = self.a * origin.x + self.b * origin.y
+
+    @property
+    def key(self):
+        return self.origin.pk, self.destination.pk
+
+
+class Crossing:
+    """Where two routes intersect and how far that is from each origin."""
+    __slots__ = ("x", "y", "distance", "other_distance")
+
+    def __init__(self, point, distance, other_distance):
+        self.x, self.y = point
+        self.distance = distance
+        self.other_distance = other_distance
+
+
+class RouteGeometryCache:
+    """Memoizes Route and Crossing per directed airport pair, keyed by airport pk.
+
+    Airports almost never move, so instead of tracking which entries an Airport touches the whole cache is dropped
+    when any Airport is saved or deleted (see signals.py). Values are computed with the same helpers the per-pair
+    checks use, so cached and uncached results are identical.
+    """
+
+    def __init__(self, max_crossings=1000000):
+        self.max_crossings = max_crossings
+        self._lock = Lock()
+        self._generation = 0
+        self._routes = {}
+        self._crossings = {}
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._routes = {}
+            self._crossings = {}
+
+    def route(self, origin, destination):
+        if origin is None or destination is None:
+            return None
+        key = (origin.pk, destination.pk)
+        route = self._routes.get(key)
+        if route is None:
+            generation = self._generation
+            route = Route(origin, destination)
+            with self._lock:
+                if generation == self._generation:
+                    self._routes[key] = route
+        return route
+
+    def crossing(self, route: Route, other: Route):
+        """The Crossing of both routes, or None when they are parallel or either is missing."""
+        if route is None or other is None:
+            return None
+        key = (route.key, other.key)
+        try:
+            return self._crossings[key]
+        except KeyError:
+            pass
+        generation = self._generation
+        try:
+            point = get_route_intersection_point(route.origin, route.destination, other.origin, other.destination)
+            crossing = Crossing(point, calc_distance_with_tuple(route.origin, point),
+                                calc_distance_with_tuple(other.origin, point))
+        except (ArithmeticError, TypeError):
+            # the per-pair helper treats these (parallel routes above all) as no conflict
+            crossing = None
+        with self._lock:
+            if generation == self._generation:
+                if len(self._crossings) >= self.max_crossings:
+                    self._crossings = {}
+                self._crossings[key] = crossing
+        return crossing
+
+
+geometry = RouteGeometryCache()
@@ -1,13 +1,19 @@
-import requests
-
 from .models import Plane, Airport
+from . import metrics
+from .coalescer import coalescer
+from .outbox import outbox
 from math import sqrt, degrees, atan2
 from datetime import timedelta
 
 
+@metrics.SEND_WARNING_LATENCY.time()
 def send_warning(data):
+    if not coalescer.should_send(data):
+        metrics.WARNINGS.labels("coalesced").inc()
+        return
     print(data)
-    requests.post(url='https://evently.bjucps.dev/app/error_report', json=data)
+    # delivered by the outbox workers so a slow error report never holds up a publish
+    outbox.enqueue(data)
 
 
 def check_time_delta(first, second, max):
@@ -41,14 +47,19 @@ def check_size(plane_size: str, thing_size: str):
 
 
 def get_intersection_point(plane1: Plane, plane2: Plane):
-    x1 = plane1.take_off_airport.x
-    x2 = plane1.land_airport.x
-    x3 = plane2.take_off_airport.x
-    x4 = plane2.land_airport.x
-    y1 = plane1.take_off_airport.y
-    y2 = plane1.land_airport.y
-    y3 = plane2.take_off_airport.y
-    y4 = plane2.land_airport.y
+    return get_route_intersection_point(plane1.take_off_airport, plane1.land_airport,
+                                        plane2.take_off_airport, plane2.land_airport)
+
+
+def get_route_intersection_point(origin1: Airport, dest1: Airport, origin2: Airport, dest2: Airport):
+    x1 = origin1.x
+    x2 = dest1.x
+    x3 = origin2.x
+    x4 = dest2.x
+    y1 = origin1.y
+    y2 = dest1.y
+    y3 = origin2.y
+    y4 = dest2.y
     return (((x1 * y2 - y1 * x2) * (x3 - x4) - (x1 - x2) * (x3 * y4 - y3 * x4)) / (
             (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)),
             ((x1 * y2 - y1 * x2) * (y3 - y4) - (y1 - y2) * (x3 * y4 - y3 * x4)) / (
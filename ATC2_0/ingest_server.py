@@ -0,0 +1,212 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from django.db import close_old_connections
+
+from .airspace import airspace
+from .messages import MessageError, decode, loads
+from .views import PUBLISHERS, stage
+
+logger = logging.getLogger(__name__)
+
+ROUTES = {
+    "/atc/api/counts": "counts",
+    "/atc/api/headings": "headings",
+    "/atc/api/gates": "gates",
+    "/atc/api/runways": "runways",
+}
+# what a request line and its headers may take up, anything longer is answered with a 431
+MAX_HEADER_SIZE = 16 * 1024
+
+
+class BadRequest(Exception):
+    """A request that cannot be read, answered with `status` before the connection is closed."""
+
+    def __init__(self, status, reason=""):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+class Request:
+    __slots__ = ("method", "path", "body", "keep_alive")
+
+    def __init__(self, method, path, body, keep_alive):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.keep_alive = keep_alive
+
+
+def response(status, body=b"", keep_alive=True, headers=()):
+    status = HTTPStatus(status)
+    head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Length: {len(body)}"]
+    if body:
+        head.append("Content-Type: text/plain; charset=utf-8")
+    if not keep_alive:
+        head.append("Connection: close")
+    head.extend(headers)
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def read_request(reader, max_body_size):
+    """The next request on the connection, None once the client has closed it."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as error:
+        if error.partial.strip():
+            raise BadRequest(HTTPStatus.BAD_REQUEST, "incomplete request")
+        return None
+    except asyncio.LimitOverrunError:
+        raise BadRequest(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    if "transfer-encoding" in headers:
+        raise BadRequest(HTTPStatus.LENGTH_REQUIRED, "chunked bodies are not supported, send a Content-Length")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+    if not 0 <= length <= max_body_size:
+        raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    try:
+        body = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "incomplete body")
+    return Request(method, target.split("?", 1)[0], body, keep_alive)
+
+
+def publish(kind, body):
+    """What handle_publish in views.py does for one posted body, as (status, text)."""
+    try:
+        with stage(kind, "decode"):
+            message = decode(kind, loads(body))
+        PUBLISHERS[kind](message)
+    except MessageError as error:
+        return HTTPStatus.BAD_REQUEST, str(error)
+    except Exception:
+        logger.exception("%s publish failed: %r", kind, body)
+        return HTTPStatus.INTERNAL_SERVER_ERROR, ""
+    return HTTPStatus.OK, ""
+
+
+def publish_batch(publishes):
+    """Runs a connection's pipelined publishes in order, their plane writes flushed together."""
+    close_old_connections()
+    results = []
+    try:
+        airspace.sync()
+        with airspace.deferred_writes():
+            for kind, body in publishes:
+                results.append(publish(kind, body))
+    except Exception:
+        logger.exception("writing %s publishes failed", len(publishes))
+        return [(HTTPStatus.INTERNAL_SERVER_ERROR, "")] * len(publishes)
+    return results
+
+
+class IngestServer:
+    """Serves only the four publish endpoints, over HTTP/1.1 on an asyncio loop.
+
+    Connections are kept alive and may pipeline requests. Each connection's requests are handled in the order they
+    came, the ones already waiting handed to the executor together, up to `batch_size`, so their writes go to the
+    database in one transaction. The executor runs at most `workers` batches at once and a connection is not read
+    any further while `batch_size` of its requests are waiting, so a slow database holds the clients back instead
+    of queueing without bound.
+    """
+
+    def __init__(self, host="0.0.0.0", port=8001, workers=4, batch_size=100, max_body_size=1024 * 1024,
+                 executor=None):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_body_size = max_body_size
+        self.executor = executor or ThreadPoolExecutor(workers, thread_name_prefix="ingest")
+        self.slots = None
+        self.server = None
+
+    async def start(self):
+        self.slots = asyncio.Semaphore(self.workers)
+        self.server = await asyncio.start_server(self.serve, self.host, self.port, limit=MAX_HEADER_SIZE)
+        return self
+
+    @property
+    def sockets(self):
+        return self.server.sockets
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    async def serve(self, reader, writer):
+        # requests are read ahead into `waiting` while the ones before them are processed
+        waiting = asyncio.Queue(self.batch_size)
+        reading = asyncio.ensure_future(self.read(reader, waiting))
+        try:
+            await self.answer(waiting, writer)
+        except ConnectionError:
+            pass
+        finally:
+            reading.cancel()
+            writer.close()
+
+    async def read(self, reader, waiting):
+        try:
+            while True:
+                request = await read_request(reader, self.max_body_size)
+                await waiting.put(request)
+                if request is None or not request.keep_alive:
+                    return
+        except BadRequest as error:
+            await waiting.put(error)
+        except ConnectionError:
+            await waiting.put(None)
+
+    async def answer(self, waiting, writer):
+        while True:
+            requests = [await waiting.get()]
+            while len(requests) < self.batch_size and not waiting.empty():
+                requests.append(waiting.get_nowait())
+            last = requests[-1]
+            if not isinstance(last, Request):
+                requests.pop()
+            writer.write(b"".join(await self.handle(requests)))
+            if isinstance(last, BadRequest):
+                writer.write(response(last.status, last.reason.encode(), keep_alive=False))
+            await writer.drain()
+            if not isinstance(last, Request) or not last.keep_alive:
+                return
+
+    async def handle(self, requests):
+        answers = [None] * len(requests)
+        publishes = []
+        for index, request in enumerate(requests):
+            kind = ROUTES.get(request.path)
+            if kind is None:
+                answers[index] = response(HTTPStatus.NOT_FOUND, keep_alive=request.keep_alive)
+            elif request.method != "POST":
+                answers[index] = response(HTTPStatus.METHOD_NOT_ALLOWED, keep_alive=request.keep_alive,
+                                          headers=["Allow: POST"])
+            else:
+                publishes.append((index, kind, request.body))
+        if publishes:
+            async with self.slots:
+                results = await asyncio.get_event_loop().run_in_executor(
+                    self.executor, publish_batch, [(kind, body) for _, kind, body in publishes])
+            for (index, _, _), (status, text) in zip(publishes, results):
+                answers[index] = response(status, text.encode(), keep_alive=requests[index].keep_alive)
+        return answers
@@ -0,0 +1,74 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from . import metrics
+
+
+def version_key(model):
+    return f"atc:version:{model._meta.label_lower}"
+
+
+def versions(models):
+    """The current version of each model's rows. A version that has fallen out of the cache starts over as a new
+    one, never as one a page could already be stored under."""
+    keys = [version_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, uuid.uuid4().hex)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bump(model):
+    cache.set(version_key(model), uuid.uuid4().hex, None)
+
+
+def changed(model):
+    """Retires every cached page showing rows of `model`.
+
+    Done right away, so this process never serves a stale page, and again once the transaction commits, since a page
+    rendered by another process in between still showed what was committed before.
+    """
+    _bump(model)
+    transaction.on_commit(lambda: _bump(model))
+
+
+class CachedList:
+    """Caches the rendered page of a list view per permission set and page.
+
+    `depends_on` are the models whose rows the page shows; saving or deleting any of them (see signals.py) changes
+    their version and so the key every page showing them is stored under. LIST_CACHE_TIMEOUT of 0 turns it off.
+    """
+    depends_on = ()
+
+    def page_versions(self):
+        """The versions a page is stored under, besides the permissions and the query."""
+        return versions(self.depends_on or (self.model,))
+
+    def cache_key(self, request):
+        perms = ",".join(sorted(request.user.get_all_permissions()))
+        query = "&".join(sorted(request.GET.urlencode().split("&")))
+        parts = [perms, query] + self.page_versions()
+        digest = hashlib.md5("|".join(parts).encode()).hexdigest()
+        return f"atc:list:{self.model._meta.model_name}:{digest}"
+
+    def get(self, request, *args, **kwargs):
+        timeout = getattr(settings, "LIST_CACHE_TIMEOUT", 300)
+        if not timeout:
+            return super().get(request, *args, **kwargs)
+        name = self.model._meta.model_name
+        key = self.cache_key(request)
+        content = cache.get(key)
+        if content is not None:
+            metrics.LIST_CACHE.labels(name, "hit").inc()
+            return HttpResponse(content)
+        metrics.LIST_CACHE.labels(name, "miss").inc()
+        response = super().get(request, *args, **kwargs)
+        response.add_post_render_callback(lambda rendered: cache.set(key, rendered.content, timeout))
+        return response
@@ -0,0 +1,151 @@
+import json
+import random
+from datetime import timedelta
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ATC2_0.models import Airline, Airport, Gate, Runway, Plane, SIZES
+
+
+def seed(planes, rng):
+    """Adds `planes` benchmark planes with the airports, gates and runways they use."""
+    airline = Airline.objects.create(name="benchmark airline")
+    Airport.objects.bulk_create(Airport(name=f"benchmark airport {index}", x=rng.uniform(0, 20000),
+                                        y=rng.uniform(0, 20000)) for index in range(40))
+    airports = list(Airport.objects.filter(name__startswith="benchmark airport"))
+    Gate.objects.bulk_create(Gate(identifier=f"benchmark gate {index}", size="LARGE", airport=rng.choice(airports))
+                             for index in range(max(planes // 50, 1)))
+    gates = list(Gate.objects.filter(identifier__startswith="benchmark gate"))
+    Runway.objects.bulk_create(Runway(identifier=f"benchmark runway {index}", size="LARGE",
+                                      airport=rng.choice(airports)) for index in range(max(planes // 200, 1)))
+    runways = list(Runway.objects.filter(identifier__startswith="benchmark runway"))
+
+    start = timezone.now().replace(second=0, microsecond=0)
+    batch = []
+    for index in range(planes):
+        plane = Plane(identifier=f"benchmark plane {index}", size=rng.choice(SIZES)[0], currentPassengerCount=0,
+                      maxPassengerCount=300, airline=airline)
+        roll = rng.random()
+        if roll < .4:
+            plane.take_off_airport, plane.land_airport = rng.sample(airports, 2)
+            plane.take_off_time = start + timedelta(minutes=rng.randrange(0, 7 * 24 * 60))
+            plane.landing_time = plane.take_off_time + timedelta(minutes=rng.randrange(30, 600))
+            plane.heading, plane.speed = 0, 500
+        else:
+            plane.take_off_airport = rng.choice(airports)
+            plane.gate = rng.choice(gates)
+            plane.arrive_at_gate_time = start - timedelta(minutes=rng.randrange(0, 365 * 24 * 60))
+            if roll < .95:
+                plane.runway = rng.choice(runways)
+                plane.arrive_at_runway_time = plane.arrive_at_gate_time + timedelta(minutes=rng.randrange(20, 120))
+        batch.append(plane)
+        if len(batch) == 1000:
+            Plane.objects.bulk_create(batch)
+            batch = []
+    Plane.objects.bulk_create(batch)
+
+
+def hot_queries(plane):
+    """The plane lookups the conflict checks make, for the given plane."""
+    minute = timedelta(minutes=1)
+    return {
+        "head_on": Plane.objects.filter(take_off_airport=plane.land_airport_id, land_airport=plane.take_off_airport_id,
+                                        landing_time__isnull=False),
+        "behind": Plane.objects.filter(take_off_airport=plane.take_off_airport_id,
+                                       land_airport=plane.land_airport_id, landing_time__gt=plane.landing_time),
+        "crossing": Plane.objects.filter(landing_time__isnull=False, take_off_time__lte=plane.landing_time + minute,
+                                         landing_time__gte=plane.take_off_time - minute),
+        "gate": Plane.objects.filter(gate=plane.gate_id).filter(
+            Q(arrive_at_gate_time=plane.arrive_at_gate_time) | Q(arrive_at_runway_time=None)),
+        "runway": Plane.objects.filter(runway=plane.runway_id,
+                                       arrive_at_runway_time__gt=plane.arrive_at_runway_time - minute,
+                                       arrive_at_runway_time__lt=plane.arrive_at_runway_time + minute),
+    }
+
+
+class Sample:
+    """A flying plane's route and times with a parked plane's gate and runway, what hot_queries needs."""
+
+    def __init__(self, flying, parked):
+        self.take_off_airport_id = flying.take_off_airport_id
+        self.land_airport_id = flying.land_airport_id
+        self.take_off_time = flying.take_off_time
+        self.landing_time = flying.landing_time
+        self.gate_id = parked.gate_id
+        self.arrive_at_gate_time = parked.arrive_at_gate_time
+        self.runway_id = parked.runway_id
+        self.arrive_at_runway_time = parked.arrive_at_runway_time
+
+
+def samples(count, rng):
+    flying = list(Plane.objects.filter(identifier__startswith="benchmark plane", landing_time__isnull=False)
+                  .order_by("?")[:count])
+    parked = list(Plane.objects.filter(identifier__startswith="benchmark plane", arrive_at_runway_time__isnull=False)
+                  .order_by("?")[:count])
+    return [Sample(rng.choice(flying), rng.choice(parked)) for _ in range(count)]
+
+
+def analyze():
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {connection.ops.quote_name(Plane._meta.db_table)}")
+
+
+def measure(sample_planes, repeat):
+    results = {}
+    for name in hot_queries(sample_planes[0]):
+        timings = []
+        for _ in range(repeat):
+            for plane in sample_planes:
+                queryset = hot_queries(plane)[name]
+                started = perf_counter()
+                list(queryset.values_list("pk"))
+                timings.append(perf_counter() - started)
+        results[name] = {
+            "ms": median(timings) * 1000,
+            "plan": hot_queries(sample_planes[0])[name].values_list("pk").explain(),
+        }
+    return results
+
+
+class Command(BaseCommand):
+    help = 'seeds benchmark planes and reports plans and timings of the conflict check queries without and with ' \
+           'the Plane indexes; everything is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--planes', type=int, default=100000, help='benchmark planes to seed')
+        parser.add_argument('--samples', type=int, default=20, help='planes each query is run for')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='print the report as JSON')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        report = {}
+        with transaction.atomic():
+            seed(options["planes"], rng)
+            sample_planes = samples(options["samples"], rng)
+            # plain DDL rather than `with schema_editor()`, which SQLite does not allow inside a transaction
+            editor = connection.schema_editor()
+            for index in Plane._meta.indexes:
+                editor.execute(index.remove_sql(Plane, editor))
+            analyze()
+            report["without"] = measure(sample_planes, options["repeat"])
+            for index in Plane._meta.indexes:
+                editor.execute(index.create_sql(Plane, editor))
+            analyze()
+            report["with"] = measure(sample_planes, options["repeat"])
+            transaction.set_rollback(True)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+            return
+        for name in report["with"]:
+            without, indexed = report["without"][name], report["with"][name]
+            self.stdout.write(f"{name}: {without['ms']:.3f}ms without indexes, {indexed['ms']:.3f}ms with")
+            self.stdout.write("  without: " + without["plan"].replace("\n", "\n           "))
+            self.stdout.write("  with:    " + indexed["plan"].replace("\n", "\n           "))
@@ -0,0 +1,43 @@
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from ATC2_0.synthetic import SyntheticAirspace
+from ATC2_0.traffic import TIME_FORMAT
+
+
+class Command(BaseCommand):
+    help = 'writes a synthetic airspace of any size as the datasets/ CSVs, for load_data --bulk --directory, and ' \
+           'a matching message capture for ingest and replay_traffic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='where the CSVs and messages.jsonl are written')
+        parser.add_argument('--airports', type=int, default=1000)
+        parser.add_argument('--airlines', type=int, default=50)
+        parser.add_argument('--planes', type=int, default=100000)
+        parser.add_argument('--gates-per-airport', type=int, default=8)
+        parser.add_argument('--runways-per-airport', type=int, default=3)
+        parser.add_argument('--airlines-per-airport', type=int, default=5)
+        parser.add_argument('--messages', type=int, default=100000, help='messages to write, 0 for none')
+        parser.add_argument('--conflict-rate', type=float, default=0.01,
+                            help='share of the messages that belong to a deliberate conflict')
+        parser.add_argument('--rate', type=float, default=1000, help='recorded messages per second')
+        parser.add_argument('--start', type=lambda value: datetime.strptime(value, TIME_FORMAT),
+                            help=f'earliest message time as {TIME_FORMAT.replace("%", "%%")}, now by default')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        airspace = SyntheticAirspace(options["airports"], options["airlines"], options["planes"],
+                                     options["gates_per_airport"], options["runways_per_airport"],
+                                     options["airlines_per_airport"], options["seed"])
+        airspace.write_datasets(options["directory"])
+        self.stdout.write(f"wrote {airspace.airports} airports, {airspace.airlines} airlines, "
+                          f"{len(airspace.gate_airport)} gates, {len(airspace.runway_airport)} runways and "
+                          f"{airspace.planes} planes to {options['directory']}")
+        if options["messages"] > 0:
+            path = os.path.join(options["directory"], "messages.jsonl")
+            injected = airspace.write_capture(path, options["messages"], options["conflict_rate"], options["rate"],
+                                              options["start"])
+            self.stdout.write(f"wrote {options['messages']} messages to {path} with conflicts " +
+                              ", ".join(f"{kind}: {count}" for kind, count in injected.items()))
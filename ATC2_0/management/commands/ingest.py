@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from ATC2_0.processor import InlineProcessor, PartitionedPool, http_source, jsonl_source, run
+
+
+def messages(location):
+    if location == "-":
+        yield from jsonl_source(sys.stdin)
+    elif location.startswith(("http://", "https://")):
+        yield from http_source(location)
+    else:
+        with open(location) as file:
+            yield from jsonl_source(file)
+
+
+class Command(BaseCommand):
+    help = 'processes counts, headings, gates and runways messages from JSONL files, stdin or an HTTP stream'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='+', help='JSONL file, - for stdin, or an http(s) URL')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='worker processes, messages are partitioned by plane; 0 handles them inline')
+        parser.add_argument('--batch-size', type=int, default=100, help='most messages a worker flushes together')
+
+    def handle(self, *args, **options):
+        if options["workers"] > 0:
+            processor = PartitionedPool(options["workers"], options["batch_size"]).start()
+        else:
+            processor = InlineProcessor()
+        counts = run((message for location in options["sources"] for message in messages(location)), processor)
+        self.stdout.write(f"processed {counts.get('processed', 0)} messages, skipped {counts.get('skipped', 0)}")
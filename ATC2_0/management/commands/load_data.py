@@ -2,6 +2,10 @@ import csv
 
 from django.contrib.auth.models import User
 
+from ATC2_0.airspace import airspace
+from ATC2_0.bulk_load import BulkLoader
+from ATC2_0.geometry import geometry
+from ATC2_0.list_cache import changed
 from ATC2_0.models import Airport, Airline, Gate, Runway, Plane
 from django.core.management.base import BaseCommand
 
@@ -101,7 +105,31 @@ def load_users():
 class Command(BaseCommand):
     help = 'loads data into database if needed'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', action='store_true',
+                            help='stream the CSVs in batches, adding the rows that are not in the database yet')
+        parser.add_argument('--upsert', action='store_true',
+                            help='with --bulk, also refresh the rows already in the database from the CSVs')
+        parser.add_argument('--directory', default='datasets', help='where the CSVs are, for --bulk')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-copy', action='store_true', help='use bulk inserts rather than COPY on PostgreSQL')
+
     def handle(self, *args, **options):
+        if options["bulk"] or options["upsert"]:
+            loader = BulkLoader(options["directory"], options["batch_size"], upsert=options["upsert"],
+                                copy=not options["no_copy"])
+            for table, (read, written) in loader.load().items():
+                print(f"{table}: {read} rows, {written} written")
+            load_users()
+            # bulk writes send no signals, anything cached in this process starts over; the change logged below makes
+            # the other processes load everything again, route geometry included, when they next sync
+            airspace.clear()
+            geometry.clear()
+            for model in (Airport, Airline, Airport.airlines.through, Gate, Runway, Plane):
+                changed(model)
+            airspace.log(Airport)
+            return
+
         loaded_airports = load_airports()
         loaded_airlines = load_airlines()
 
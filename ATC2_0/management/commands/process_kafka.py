@@ -0,0 +1,94 @@
+import json
+import logging
+import signal
+import threading
+from time import monotonic
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ATC2_0 import metrics
+from ATC2_0.airspace import airspace
+from ATC2_0.outbox import outbox
+from ATC2_0.processor import Message, process
+
+logger = logging.getLogger(__name__)
+
+
+def make_consumer(topics):
+    from kafka import KafkaConsumer
+
+    return KafkaConsumer(*topics,
+                         bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
+                         group_id=settings.KAFKA_GROUP_ID,
+                         enable_auto_commit=False,
+                         auto_offset_reset="earliest")
+
+
+def process_record(record, kinds):
+    kind = kinds.get(record.topic)
+    # a malformed or unknown message must not hold up the partition behind it
+    try:
+        handled = process(Message(kind, json.loads(record.value)))
+    except ValueError:
+        logger.error("skipping %s message at %s:%s offset %s", kind, record.topic, record.partition, record.offset)
+        handled = False
+    metrics.KAFKA_MESSAGES.labels(kind, "processed" if handled else "skipped").inc()
+    return handled
+
+
+def consume(consumer, kinds, batch_size, poll_timeout, stop, max_batches=None):
+    """Polls until `stop` is set, handling each batch with its writes flushed together and committing its offsets
+    only once it has been processed. Returns how many records were handled."""
+    handled = 0
+    batches = 0
+    while not stop.is_set() and (max_batches is None or batches < max_batches):
+        polled = consumer.poll(timeout_ms=poll_timeout, max_records=batch_size)
+        records = [record for partition in polled.values() for record in partition]
+        if not records:
+            continue
+        started = monotonic()
+        close_old_connections()
+        # if the flush fails nothing is committed, the batch is delivered again after a restart; its warnings are
+        # only queued once the flush is done, so that they are not sent again with it
+        with outbox.held(), airspace.deferred_writes():
+            for record in records:
+                process_record(record, kinds)
+        consumer.commit()
+        metrics.KAFKA_BATCH_LATENCY.observe(monotonic() - started)
+        handled += len(records)
+        batches += 1
+    return handled
+
+
+class Command(BaseCommand):
+    help = 'consumes counts, headings, gates and runways messages from kafka until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.KAFKA_BATCH_SIZE,
+                            help='most records to process before committing')
+        parser.add_argument('--poll-timeout', type=int, default=settings.KAFKA_POLL_TIMEOUT,
+                            help='milliseconds to wait for records in one poll')
+        parser.add_argument('--max-batches', type=int, default=None, help='stop after this many batches')
+
+    def handle(self, *args, **options):
+        kinds = {topic: kind for kind, topic in settings.KAFKA_TOPICS.items()}
+        stop = threading.Event()
+        previous = {}
+        if threading.current_thread() is threading.main_thread():
+            # finish the batch in hand, commit it and leave the group instead of dying mid-batch
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                previous[signum] = signal.signal(signum, lambda *_: stop.set())
+
+        consumer = make_consumer(list(kinds))
+        try:
+            handled = consume(consumer, kinds, options["batch_size"], options["poll_timeout"], stop,
+                              options["max_batches"])
+        finally:
+            # offsets are committed per batch, never on close
+            consumer.close(autocommit=False)
+            outbox.stop()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(f"processed {handled} messages")
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from ATC2_0.traffic import Replayer, read_capture
+
+
+def speed(value):
+    return 0.0 if value == "max" else float(value.rstrip("x"))
+
+
+class Command(BaseCommand):
+    help = 'replays a traffic capture against a running instance and reports throughput, latency and warnings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture', help='capture written by TrafficRecorderMiddleware or seed_traffic')
+        parser.add_argument('--url', default='http://localhost:8000', help='instance to replay against')
+        parser.add_argument('--speed', type=speed, default=1.0,
+                            help='multiple of the recorded pace such as 1 or 10x, or max for as fast as possible')
+        parser.add_argument('--concurrency', type=int, default=1, help='most requests in flight')
+        parser.add_argument('--json', action='store_true', help='print the report as JSON')
+
+    def handle(self, *args, **options):
+        replayer = Replayer(options["url"], options["speed"], options["concurrency"])
+        with open(options["capture"]) as file:
+            report = replayer.run(read_capture(file))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+            return
+        self.stdout.write(f"{report['requests']} requests in {report['seconds']:.2f}s, "
+                          f"{report['throughput']:.1f}/s")
+        for kind, endpoint in report["endpoints"].items():
+            self.stdout.write(f"{kind:9} {endpoint['requests']:7} requests {endpoint['errors']:5} errors "
+                              f"{endpoint['throughput']:8.1f}/s  p50 {endpoint['p50'] * 1000:8.1f}ms  "
+                              f"p95 {endpoint['p95'] * 1000:8.1f}ms  p99 {endpoint['p99'] * 1000:8.1f}ms")
+        if report["warnings"] is None:
+            self.stdout.write("warnings: /metrics not reachable")
+        else:
+            self.stdout.write("warnings: " + (", ".join(f"{outcome} {count:g}" for outcome, count
+                                                        in sorted(report["warnings"].items())) or "none"))
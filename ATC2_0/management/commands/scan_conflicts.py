@@ -0,0 +1,80 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from ATC2_0.airspace import airspace
+from ATC2_0.conflicts import scan_airspace
+from ATC2_0.helpers import send_warning
+from ATC2_0.views import TEAM_ID
+
+
+def send_warnings(conflicts):
+    warned = set()
+    for conflict in conflicts:
+        for identifier in (conflict.first, conflict.second):
+            if identifier not in warned:
+                warned.add(identifier)
+                send_warning({
+                    "team_id": TEAM_ID,
+                    "error": "COLLISION_IMMINENT",
+                    "obj_type": "PLANE",
+                    "id": identifier
+                })
+    return warned
+
+
+def send_airport_warnings(planes):
+    for plane in planes:
+        send_warning({
+            "team_id": TEAM_ID,
+            "error": "WRONG_AIRPORT",
+            "obj_type": "PLANE",
+            "id": plane.identifier
+        })
+
+
+class Command(BaseCommand):
+    help = 'finds every head-on, rear and intersection conflict in the airspace'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='print the report as JSON')
+        parser.add_argument('--send-warnings', action='store_true',
+                            help='send COLLISION_IMMINENT for every plane involved in a conflict')
+        parser.add_argument('--check-airports', action='store_true',
+                            help='also find flights landing at an airport their airline is not authorized for, '
+                                 'WRONG_AIRPORT is sent for those with --send-warnings')
+
+    def handle(self, *args, **options):
+        # an audit reads what is committed, not whatever this process happened to cache
+        airspace.clear()
+        planes = airspace.planes()
+        conflicts = scan_airspace(planes)
+        wrong_airport = []
+        if options["check_airports"]:
+            wrong_airport = airspace.wrong_airport(plane for plane in planes if plane.landing_time is not None)
+
+        counts = {}
+        for conflict in conflicts:
+            counts[conflict.kind] = counts.get(conflict.kind, 0) + 1
+
+        if options["json"]:
+            report = {
+                "planes": len(planes),
+                "counts": counts,
+                "conflicts": [conflict._asdict() for conflict in conflicts]
+            }
+            if options["check_airports"]:
+                report["wrong_airport"] = sorted(plane.identifier for plane in wrong_airport)
+            self.stdout.write(json.dumps(report))
+        else:
+            for conflict in conflicts:
+                self.stdout.write(f"{conflict.kind} {conflict.first} {conflict.second}")
+            for plane in wrong_airport:
+                self.stdout.write(f"WRONG_AIRPORT {plane.identifier}")
+            self.stdout.write(f"{len(conflicts)} conflicts between {len(planes)} planes " +
+                              ", ".join(f"{kind}: {count}" for kind, count in sorted(counts.items())))
+
+        if options["send_warnings"]:
+            warned = send_warnings(conflicts)
+            send_airport_warnings(wrong_airport)
+            self.stdout.write(f"warned {len(warned)} planes")
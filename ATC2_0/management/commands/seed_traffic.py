@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ATC2_0.traffic import seed_capture
+
+
+class Command(BaseCommand):
+    help = 'writes a replayable capture of the SimulationTests scenarios and random traffic from datasets/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='capture file to append to')
+        parser.add_argument('--messages', type=int, default=1000, help='background messages after the scenarios')
+        parser.add_argument('--rate', type=float, default=50, help='recorded messages per second')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        written = seed_capture(options["path"], options["messages"], options["rate"], options["seed"])
+        self.stdout.write(f"wrote {written} messages to {options['path']}")
@@ -0,0 +1,36 @@
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ATC2_0.ingest_server import IngestServer
+from ATC2_0.outbox import outbox
+
+
+class Command(BaseCommand):
+    help = 'serves the counts, headings, gates and runways publish endpoints from an asyncio server until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=settings.INGEST_PORT)
+        parser.add_argument('--workers', type=int, default=settings.INGEST_WORKERS,
+                            help='threads doing the database work')
+        parser.add_argument('--batch-size', type=int, default=settings.INGEST_BATCH_SIZE,
+                            help='most pipelined requests of one connection handled together')
+
+    def handle(self, *args, **options):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = IngestServer(options["host"], options["port"], options["workers"], options["batch_size"])
+        loop.run_until_complete(server.start())
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, loop.stop)
+        self.stdout.write(f"serving the publish endpoints on {options['host']}:{options['port']}")
+        try:
+            loop.run_forever()
+        finally:
+            # stops accepting, lets the batches in hand finish and the warnings they queued go out
+            loop.run_until_complete(server.close())
+            loop.close()
+            outbox.stop()
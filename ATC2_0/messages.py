@@ -0,0 +1,116 @@
+import json
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from dateutil import parser
+
+# what the four publish endpoints are posted, decoded; times are datetimes, naive unless the message had an offset
+PassengerCount = namedtuple("PassengerCount", ["plane", "passenger_count"])
+GateArrival = namedtuple("GateArrival", ["plane", "gate", "arrive_at_time"])
+RunwayArrival = namedtuple("RunwayArrival", ["plane", "runway", "arrive_at_time"])
+Heading = namedtuple("Heading", ["plane", "direction", "speed", "origin", "destination", "take_off_time",
+                                 "landing_time"])
+
+
+class MessageError(ValueError):
+    """A message that cannot be decoded, or that refers to something unknown. The endpoints answer it with a 400."""
+
+
+ISO_8601 = re.compile(r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6}))?)?"
+                      r"(?:(Z)|([+-])(\d\d):?(\d\d))?$")
+
+
+def parse_time(value):
+    """Reads the "YYYY-MM-DD HH:MM[:SS[.ffffff]][Z|+HH:MM]" times every sender uses without going through dateutil,
+    which takes anything else."""
+    match = ISO_8601.match(value)
+    if match is not None:
+        year, month, day, hour, minute, second, fraction, utc, sign, offset_hours, offset_minutes = match.groups()
+        tzinfo = None
+        if utc:
+            tzinfo = timezone.utc
+        elif sign:
+            offset = timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+            tzinfo = timezone(-offset if sign == "-" else offset)
+        try:
+            return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0),
+                            int(fraction.ljust(6, "0")) if fraction else 0, tzinfo)
+        except ValueError:
+            pass
+    return parser.parse(value)
+
+
+# field decoders, each takes the raw value and returns the decoded one or raises ValueError/TypeError
+
+def text(value):
+    if not isinstance(value, str):
+        raise TypeError("expected a string")
+    return value
+
+
+def number(value):
+    if isinstance(value, bool):
+        raise TypeError("expected a number")
+    return float(value)
+
+
+def integer(value):
+    if isinstance(value, bool):
+        raise TypeError("expected an integer")
+    return int(value)
+
+
+def moment(value):
+    return parse_time(text(value))
+
+
+def optional(decode):
+    def decode_optional(value):
+        return None if value is None else decode(value)
+    decode_optional.optional = True
+    return decode_optional
+
+
+def compile_decoder(message_type, **fields):
+    """A function turning a JSON object into a `message_type`, every field run through its decoder. Fields whose
+    decoder is optional() may be left out."""
+    spec = [(name, fields[name], getattr(fields[name], "optional", False)) for name in message_type._fields]
+
+    def decode(body):
+        if not isinstance(body, dict):
+            raise MessageError("expected a JSON object")
+        values = []
+        for name, decode_field, is_optional in spec:
+            value = body.get(name)
+            if value is None and name not in body and not is_optional:
+                raise MessageError(f"missing {name}")
+            try:
+                values.append(decode_field(value))
+            except (ValueError, TypeError, OverflowError) as error:
+                raise MessageError(f"invalid {name} {value!r}: {error}")
+        return message_type(*values)
+    return decode
+
+
+DECODERS = {
+    "counts": compile_decoder(PassengerCount, plane=text, passenger_count=integer),
+    "gates": compile_decoder(GateArrival, plane=text, gate=optional(text), arrive_at_time=optional(moment)),
+    "runways": compile_decoder(RunwayArrival, plane=text, runway=optional(text), arrive_at_time=optional(moment)),
+    "headings": compile_decoder(Heading, plane=text, direction=number, speed=number, origin=text,
+                                destination=text, take_off_time=moment, landing_time=moment),
+}
+
+
+def decode(kind, body):
+    """Decodes an already parsed message, passing through ones that are decoded already."""
+    if isinstance(body, tuple):
+        return body
+    return DECODERS[kind](body)
+
+
+def loads(raw):
+    try:
+        return json.loads(raw)
+    except ValueError as error:
+        raise MessageError(f"invalid JSON: {error}")
@@ -0,0 +1,29 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# exported on /metrics by django_prometheus along with its own request and model metrics
+
+WARNING_OUTBOX_DEPTH = Gauge("atc_warning_outbox_depth", "Warnings waiting in the outbox for delivery")
+WARNING_BREAKER_OPEN = Gauge("atc_warning_breaker_open", "1 while the error report circuit breaker is open")
+WARNINGS = Counter("atc_warnings_total", "Warnings by what happened to them", ["outcome"])
+WARNING_DELIVERY_LATENCY = Histogram("atc_warning_delivery_latency_seconds",
+                                     "Time from queueing a warning to the error report accepting it",
+                                     buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600))
+WARNING_REQUEST_LATENCY = Histogram("atc_warning_request_latency_seconds", "Duration of one error report request")
+KAFKA_MESSAGES = Counter("atc_kafka_messages_total", "Messages handled by process_kafka", ["kind", "outcome"])
+KAFKA_BATCH_LATENCY = Histogram("atc_kafka_batch_latency_seconds", "Time to process and commit one polled batch")
+
+# publish internals, to tell which part of a slow publish the time went to
+PUBLISH_STAGE_LATENCY = Histogram("atc_publish_stage_latency_seconds", "Time spent in each stage of a publish",
+                                  ["kind", "stage"],
+                                  buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1,
+                                           2.5))
+SEND_WARNING_LATENCY = Histogram("atc_send_warning_latency_seconds",
+                                 "Time a publish spends handing one warning to the outbox",
+                                 buckets=(.00001, .000025, .00005, .0001, .00025, .0005, .001, .0025, .005, .01, .1))
+CONFLICT_CANDIDATES = Histogram("atc_conflict_candidates", "Planes a conflict check had to look at", ["check"],
+                                buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+CONFLICTS = Counter("atc_conflicts_total", "Conflicts found by the publish checks", ["type"])
+PLANES_IN_FLIGHT = Gauge("atc_planes_in_flight", "Planes airborne right now as far as this process knows")
+PLANES_TRACKED = Gauge("atc_planes_tracked", "Planes held in this process's airspace store")
+LIST_CACHE = Counter("atc_list_cache_total", "List page cache lookups by whether the page was cached",
+                     ["list", "outcome"])
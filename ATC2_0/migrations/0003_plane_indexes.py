@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ATC2_0', '0002_outboundwarning'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plane',
+            index=models.Index(condition=models.Q(landing_time__isnull=False), fields=['take_off_airport', 'land_airport', 'landing_time'], name='plane_route_landing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plane',
+            index=models.Index(condition=models.Q(landing_time__isnull=False), fields=['take_off_time', 'landing_time'], name='plane_airborne_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plane',
+            index=models.Index(fields=['gate', 'arrive_at_gate_time'], name='plane_gate_arrival_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plane',
+            index=models.Index(condition=models.Q(arrive_at_runway_time__isnull=True), fields=['gate'], name='plane_at_gate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plane',
+            index=models.Index(fields=['runway', 'arrive_at_runway_time'], name='plane_runway_arrival_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ATC2_0', '0003_plane_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AirspaceChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=64)),
+                ('object_pk', models.IntegerField(null=True)),
+                ('source', models.CharField(max_length=32)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
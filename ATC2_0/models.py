@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User, Permission
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django_prometheus.models import ExportModelOperationsMixin
 
 SIZES = [
@@ -76,6 +77,18 @@ class Plane(ExportModelOperationsMixin('plane'), models.Model):
     arrive_at_gate_time = models.DateTimeField(null=True)
     arrive_at_runway_time = models.DateTimeField(null=True)
 
+    class Meta:
+        # the access paths of the conflict checks, see the benchmark_queries command
+        indexes = [
+            models.Index(fields=["take_off_airport", "land_airport", "landing_time"], name="plane_route_landing_idx",
+                         condition=models.Q(landing_time__isnull=False)),
+            models.Index(fields=["take_off_time", "landing_time"], name="plane_airborne_idx",
+                         condition=models.Q(landing_time__isnull=False)),
+            models.Index(fields=["gate", "arrive_at_gate_time"], name="plane_gate_arrival_idx"),
+            models.Index(fields=["gate"], name="plane_at_gate_idx", condition=models.Q(arrive_at_runway_time__isnull=True)),
+            models.Index(fields=["runway", "arrive_at_runway_time"], name="plane_runway_arrival_idx"),
+        ]
+
     def clean(self):
         if self.gate is not None and not is_size_valid(self.size, self.gate.size):
             raise ValidationError("gate size must be equal or large to plane size")
@@ -86,3 +99,24 @@ class Plane(ExportModelOperationsMixin('plane'), models.Model):
 
     def __str__(self):
         return self.identifier
+
+
+class OutboundWarning(ExportModelOperationsMixin('outbound_warning'), models.Model):
+    payload = models.TextField()
+    created = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.payload
+
+
+class AirspaceChange(ExportModelOperationsMixin('airspace_change'), models.Model):
+    """A write to a row the airspace store keeps, read back by the stores of the other processes to catch up."""
+    kind = models.CharField(max_length=64)
+    object_pk = models.IntegerField(null=True)
+    source = models.CharField(max_length=32)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.object_pk}"
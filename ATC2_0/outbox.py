@@ -0,0 +1,250 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from threading import Event, Lock, Thread, local
+from time import monotonic
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import OutboundWarning
+from .reporter import ErrorReporter
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ERROR_REPORT_BATCH_SIZE": 1,
+    "WARNING_OUTBOX_SIZE": 100000,
+    "WARNING_WORKERS": 4,
+    "WARNING_BATCH_SIZE": 50,
+    "WARNING_MAX_ATTEMPTS": 10,
+    "WARNING_RETRY_BACKOFF": 1,
+    "WARNING_RETRY_BACKOFF_MAX": 300,
+    "WARNING_BREAKER_THRESHOLD": 5,
+    "WARNING_BREAKER_COOLDOWN": 30,
+    "WARNING_POLL_INTERVAL": 5,
+}
+
+# a claimed warning is not handed out again for this long, in case its worker dies mid-delivery
+LEASE = timedelta(minutes=1)
+
+
+def setting(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+class CircuitBreaker:
+    """Stops calling the error report after `threshold` failures in a row, then lets one probe through every
+    `cooldown` seconds until a call succeeds again."""
+
+    def __init__(self, threshold, cooldown, clock=monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._lock = Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at >= self.cooldown:
+                # half open: this caller probes, everyone else waits out another cooldown
+                self.opened_at = self.clock()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+        metrics.WARNING_BREAKER_OPEN.set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = self.clock()
+                metrics.WARNING_BREAKER_OPEN.set(1)
+
+
+class Outbox:
+    """Durable queue of outbound warnings, stored as OutboundWarning rows and posted by a background worker pool.
+
+    send_warning only inserts a row. The dispatcher thread claims due rows in batches, posts them concurrently,
+    deletes what was accepted and reschedules the rest with exponential backoff until WARNING_MAX_ATTEMPTS.
+    """
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(setting("WARNING_BREAKER_THRESHOLD"), setting("WARNING_BREAKER_COOLDOWN"))
+        self.depth = None
+        self._reporter = None
+        self._lock = Lock()
+        self._wake = Event()
+        self._stop = Event()
+        self._thread = None
+        self._executor = None
+        self._held = local()
+
+    @property
+    def reporter(self):
+        if self._reporter is None:
+            self._reporter = ErrorReporter()
+        return self._reporter
+
+    def refresh_depth(self):
+        self.depth = OutboundWarning.objects.count()
+        metrics.WARNING_OUTBOX_DEPTH.set(self.depth)
+        return self.depth
+
+    @contextmanager
+    def held(self):
+        """Hold back the warnings this thread enqueues inside the block until it exits, then enqueue them, unless it
+        raised: whatever raised them is to be done again, and will raise them again."""
+        if getattr(self._held, "warnings", None) is not None:
+            yield
+            return
+        self._held.warnings = warnings = []
+        try:
+            yield
+        finally:
+            self._held.warnings = None
+        for data in warnings:
+            self.enqueue(data)
+
+    def enqueue(self, data):
+        held = getattr(self._held, "warnings", None)
+        if held is not None:
+            held.append(data)
+            return True
+        if self.depth is None:
+            self.refresh_depth()
+        if self.depth >= setting("WARNING_OUTBOX_SIZE"):
+            metrics.WARNINGS.labels("dropped").inc()
+            logger.error("warning outbox full, dropping %s", data)
+            return False
+        OutboundWarning.objects.create(payload=json.dumps(data))
+        self.depth += 1
+        metrics.WARNING_OUTBOX_DEPTH.set(self.depth)
+        metrics.WARNINGS.labels("queued").inc()
+        self.start()
+        self._wake.set()
+        return True
+
+    def claim(self, limit):
+        now = timezone.now()
+        with transaction.atomic():
+            due = OutboundWarning.objects.filter(next_attempt__lte=now).order_by("id")
+            if connection.features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            warnings = list(due[:limit])
+            OutboundWarning.objects.filter(pk__in=[warning.pk for warning in warnings]).update(next_attempt=now + LEASE)
+        return warnings
+
+    def post(self, warnings):
+        """Posts the warnings in one request. True when delivered, False when they should be retried, None when the
+        error report rejected them."""
+        started = monotonic()
+        try:
+            if len(warnings) == 1:
+                response = self.reporter.post(warnings[0].payload)
+            else:
+                response = self.reporter.post_many([warning.payload for warning in warnings])
+        except requests.RequestException as e:
+            logger.warning("error report failed: %s", e)
+            self.breaker.record_failure()
+            return False
+        finally:
+            metrics.WARNING_REQUEST_LATENCY.observe(monotonic() - started)
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            return False
+        self.breaker.record_success()
+        if response.status_code >= 400:
+            logger.error("error report rejected %s: %s", [warning.payload for warning in warnings],
+                         response.status_code)
+            return None
+        delivered = timezone.now()
+        for warning in warnings:
+            metrics.WARNING_DELIVERY_LATENCY.observe((delivered - warning.created).total_seconds())
+        return True
+
+    def deliver_pending(self):
+        """One round of delivery, returns how many warnings were attempted."""
+        if not self.breaker.allow():
+            return 0
+        warnings = self.claim(setting("WARNING_BATCH_SIZE"))
+        if not warnings:
+            return 0
+        size = setting("ERROR_REPORT_BATCH_SIZE")
+        chunks = [warnings[start:start + size] for start in range(0, len(warnings), size)]
+        if self._executor is not None:
+            results = list(self._executor.map(self.post, chunks))
+        else:
+            results = [self.post(chunk) for chunk in chunks]
+
+        done = []
+        for warning, delivered in ((warning, delivered) for chunk, delivered in zip(chunks, results)
+                                   for warning in chunk):
+            if delivered:
+                metrics.WARNINGS.labels("delivered").inc()
+                done.append(warning.pk)
+            elif delivered is None or warning.attempts + 1 >= setting("WARNING_MAX_ATTEMPTS"):
+                metrics.WARNINGS.labels("failed").inc()
+                done.append(warning.pk)
+            else:
+                metrics.WARNINGS.labels("retried").inc()
+                backoff = min(setting("WARNING_RETRY_BACKOFF") * 2 ** warning.attempts,
+                              setting("WARNING_RETRY_BACKOFF_MAX"))
+                OutboundWarning.objects.filter(pk=warning.pk).update(
+                    attempts=warning.attempts + 1, next_attempt=timezone.now() + timedelta(seconds=backoff))
+        OutboundWarning.objects.filter(pk__in=done).delete()
+        self.refresh_depth()
+        return len(warnings)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or setting("WARNING_WORKERS") <= 0:
+                return
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(max_workers=setting("WARNING_WORKERS"),
+                                                thread_name_prefix="warning-worker")
+            self._thread = Thread(target=self._run, name="warning-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        thread.join(timeout)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                attempted = self.deliver_pending()
+            except Exception:
+                logger.exception("warning dispatch failed")
+                attempted = 0
+            if not attempted:
+                self._wake.wait(setting("WARNING_POLL_INTERVAL"))
+                self._wake.clear()
+        close_old_connections()
+
+
+outbox = Outbox()
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.views.generic import ListView
+
+
+class KeysetListView(ListView):
+    """A ListView that pages by `key`, a unique field, instead of by offset.
+
+    ?after=<key> shows the page following that key and ?before=<key> the one preceding it, so a page costs one
+    indexed range query however deep it is. ?size= picks the page size, up to LIST_MAX_PAGE_SIZE.
+    """
+    key = None
+    related = ()
+
+    def page_size(self):
+        default = getattr(settings, "LIST_PAGE_SIZE", 100)
+        try:
+            size = int(self.request.GET.get("size", default))
+        except ValueError:
+            size = default
+        return max(1, min(size, getattr(settings, "LIST_MAX_PAGE_SIZE", 1000)))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.related:
+            queryset = queryset.select_related(*self.related)
+        size = self.page_size()
+        after = self.request.GET.get("after")
+        before = self.request.GET.get("before")
+        if before is not None:
+            page = list(queryset.filter(**{f"{self.key}__lt": before}).order_by(f"-{self.key}")[:size + 1])
+            self.has_previous, self.has_next = len(page) > size, True
+            page = page[:size][::-1]
+        else:
+            if after is not None:
+                queryset = queryset.filter(**{f"{self.key}__gt": after})
+            page = list(queryset.order_by(self.key)[:size + 1])
+            self.has_previous, self.has_next = after is not None, len(page) > size
+            page = page[:size]
+        return page
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = self.object_list
+        query = self.request.GET.copy()
+        for name in ("after", "before"):
+            query.pop(name, None)
+        context["page_size"] = self.page_size()
+        if page and self.has_next:
+            query["after"] = getattr(page[-1], self.key)
+            context["next_page"] = "?" + query.urlencode()
+            query.pop("after")
+        if page and self.has_previous:
+            query["before"] = getattr(page[0], self.key)
+            context["previous_page"] = "?" + query.urlencode()
+        return context
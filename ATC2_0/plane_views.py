@@ -1,7 +1,10 @@
-from django.views.generic import CreateView, DeleteView, UpdateView, ListView
+from django.views.generic import CreateView, DeleteView, UpdateView
 from django.forms import ModelForm, ModelChoiceField
 from django.urls import reverse_lazy
-from .models import Plane, Airline, Gate, Runway
+from .airspace import airspace
+from .list_cache import CachedList
+from .pagination import KeysetListView
+from .models import Plane, Airline, Airport, Gate, Runway
 
 FIELDS = ["identifier", "size", "airline", "gate", "runway", "maxPassengerCount", "currentPassengerCount"]
 
@@ -25,10 +28,18 @@ class PlaneForm(ModelForm):
     runway = ModelChoiceField(required=False, queryset=Runway.objects.all())
 
 
-class PlaneList(ListView):
-    queryset = Plane.objects.order_by("identifier")
+class PlaneList(CachedList, KeysetListView):
+    model = Plane
+    depends_on = (Plane, Airline, Airport, Gate, Runway)
+    key = "identifier"
+    related = ("airline", "take_off_airport", "land_airport", "gate", "runway")
     template_name = "plane/index.html"
 
+    def page_versions(self):
+        # planes are mostly written by the ingest processes, which need not share this process's cache; the change
+        # log they write to is shared
+        return super().page_versions() + [airspace.version()]
+
 
 class PlaneCreate(CreateView):
     model = Plane
@@ -0,0 +1,184 @@
+import json
+import logging
+import multiprocessing
+import queue
+from collections import Counter, namedtuple
+from zlib import crc32
+
+import requests
+from django.db import close_old_connections, connections
+
+from .airspace import airspace, PLANE_FIELDS
+from .messages import MessageError, decode
+from .models import Plane
+from .views import PUBLISHERS
+
+logger = logging.getLogger(__name__)
+
+
+class Message(namedtuple("Message", ["kind", "body"])):
+    """One publish, `kind` being a PUBLISHERS key and `body` what its endpoint is posted."""
+
+    @property
+    def plane(self):
+        return self.body.get("plane") if isinstance(self.body, dict) else None
+
+
+# planes a worker saved, as (pk, {field: value}), for the other workers to apply to their stores
+Sync = namedtuple("Sync", ["planes"])
+
+
+def process(message):
+    """Runs one message through the publish logic, False if it had to be skipped."""
+    try:
+        airspace.sync()
+        PUBLISHERS[message.kind](decode(message.kind, message.body))
+    except MessageError as error:
+        logger.error("skipping %s message %s: %s", message.kind, message.body, error)
+        return False
+    except Exception:
+        logger.exception("skipping %s message %s", message.kind, message.body)
+        return False
+    return True
+
+
+def partition(message, partitions):
+    # crc32 rather than hash() so a plane goes to the same worker in every run
+    return crc32(str(message.plane).encode()) % partitions
+
+
+# sources, any iterable of Message will do; the endpoints in views.py are the push side of HTTP
+
+def queue_source(inbox, sentinel=None):
+    while True:
+        message = inbox.get()
+        if message is sentinel:
+            return
+        yield Message(*message)
+
+
+def jsonl_source(lines):
+    """Messages from lines of {"kind": ..., "body": ...}, skipping the ones that are not."""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode()
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            yield Message(record["kind"], record["body"])
+        except (ValueError, KeyError, TypeError):
+            logger.error("skipping line %s: %s", number, line)
+
+
+def http_source(url, timeout=10):
+    """Messages from a JSONL stream served over HTTP."""
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        yield from jsonl_source(response.iter_lines())
+
+
+class InlineProcessor:
+    """Handles every message in the calling thread, in the order given."""
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def submit(self, message):
+        self.counts["processed" if process(message) else "skipped"] += 1
+
+    def close(self):
+        return dict(self.counts)
+
+
+def work(inbox, peers, results, batch_size):
+    """Worker process loop: handles its partition's messages a batch at a time with the writes flushed together,
+    then sends the planes it saved to its peers."""
+    airspace.clear()
+    for peer in peers:
+        # peers stop reading at shutdown, that must not keep this process from exiting
+        peer.cancel_join_thread()
+    counts = Counter()
+    done = False
+    while not done:
+        batch = [inbox.get()]
+        while len(batch) < batch_size:
+            try:
+                batch.append(inbox.get_nowait())
+            except queue.Empty:
+                break
+        close_old_connections()
+        saved = set()
+        with airspace.deferred_writes():
+            for item in batch:
+                if item is None:
+                    done = True
+                elif isinstance(item, Sync):
+                    for pk, fields in item.planes:
+                        airspace.plane_changed(Plane(pk=pk, **fields))
+                else:
+                    counts["processed" if process(item) else "skipped"] += 1
+                    saved.add(item.plane)
+        planes = [airspace.plane(identifier) for identifier in saved if isinstance(identifier, str)]
+        sync = Sync([(plane.pk, {field: getattr(plane, field) for field in PLANE_FIELDS})
+                     for plane in planes if plane is not None])
+        if sync.planes:
+            for peer in peers:
+                peer.put(sync)
+    close_old_connections()
+    results.put(dict(counts))
+
+
+class PartitionedPool:
+    """Fans messages out over worker processes by plane, so messages for one plane are handled in order by one
+    worker while different planes are handled in parallel.
+
+    Every worker keeps its own airspace store. After each batch a worker sends the planes it saved to the others,
+    which apply them the way a post_save signal would, so conflict checks see planes owned by other workers as of
+    their last batch.
+    """
+
+    def __init__(self, workers, batch_size=100, context=None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.context = context or multiprocessing.get_context("fork")
+        self.inboxes = []
+        self.processes = []
+        self.results = None
+
+    def start(self):
+        # children must not share the parent's database connections
+        connections.close_all()
+        self.inboxes = [self.context.Queue() for _ in range(self.workers)]
+        self.results = self.context.Queue()
+        for index, inbox in enumerate(self.inboxes):
+            peers = self.inboxes[:index] + self.inboxes[index + 1:]
+            process = self.context.Process(target=work, args=(inbox, peers, self.results, self.batch_size),
+                                           name=f"ingest-worker-{index}", daemon=True)
+            process.start()
+            self.processes.append(process)
+        return self
+
+    def submit(self, message):
+        self.inboxes[partition(message, self.workers)].put(message)
+
+    def close(self):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        counts = Counter()
+        for _ in self.processes:
+            counts.update(self.results.get())
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        return dict(counts)
+
+
+def run(source, processor):
+    """Feeds every message from `source` to `processor` and returns its processed/skipped counts."""
+    try:
+        for message in source:
+            processor.submit(message)
+    finally:
+        counts = processor.close()
+    return counts
@@ -0,0 +1,44 @@
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+DEFAULTS = {
+    "ERROR_REPORT_URL": "https://evently.bjucps.dev/app/error_report",
+    "ERROR_REPORT_CONNECT_TIMEOUT": 2,
+    "ERROR_REPORT_TIMEOUT": 5,
+    "ERROR_REPORT_POOL_SIZE": 4,
+}
+
+
+def setting(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+class ErrorReporter:
+    """HTTP client for the error report sink.
+
+    Keeps a pool of keep-alive connections (one session shared by the outbox workers) so warnings after the first
+    skip the TCP and TLS handshakes. Payloads are JSON strings; post_many sends several as one JSON array for sinks
+    that accept batches.
+    """
+
+    def __init__(self, url=None, connect_timeout=None, read_timeout=None, pool_size=None):
+        self.url = url or setting("ERROR_REPORT_URL")
+        self.timeout = (connect_timeout or setting("ERROR_REPORT_CONNECT_TIMEOUT"),
+                        read_timeout or setting("ERROR_REPORT_TIMEOUT"))
+        pool_size = pool_size or setting("ERROR_REPORT_POOL_SIZE")
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+        # retries are the outbox's job, it knows about backoff and the circuit breaker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, payload: str):
+        return self.session.post(self.url, data=payload, timeout=self.timeout)
+
+    def post_many(self, payloads):
+        return self.post("[" + ",".join(payloads) + "]")
+
+    def close(self):
+        self.session.close()
@@ -1,6 +1,8 @@
-from django.views.generic import CreateView, DeleteView, UpdateView, ListView
+from django.views.generic import CreateView, DeleteView, UpdateView
 from django.forms import ModelForm, ModelChoiceField
 from django.urls import reverse_lazy
+from .list_cache import CachedList
+from .pagination import KeysetListView
 from .models import Runway, Airport
 
 FIELDS = ["identifier", "size", "airport"]
@@ -14,8 +16,11 @@ class RunwayForm(ModelForm):
     airport = ModelChoiceField(required=True, queryset=Airport.objects.all())
 
 
-class RunwayList(ListView):
-    queryset = Runway.objects.order_by("identifier")
+class RunwayList(CachedList, KeysetListView):
+    model = Runway
+    depends_on = (Runway, Airport)
+    key = "identifier"
+    related = ("airport",)
     template_name = "runway/index.html"
 
 
@@ -0,0 +1,84 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Plane, Airline, Airport, Gate, Runway
+from .airspace import airspace
+from .geometry import geometry
+from .list_cache import changed
+
+
+@receiver(post_save, sender=Plane)
+def plane_saved(sender, instance, **kwargs):
+    changed(Plane)
+    airspace.plane_changed(instance)
+    airspace.log(Plane, instance.pk)
+
+
+@receiver(post_delete, sender=Plane)
+def plane_deleted(sender, instance, **kwargs):
+    changed(Plane)
+    airspace.plane_deleted(instance.pk)
+    airspace.log(Plane, instance.pk)
+
+
+@receiver(post_save, sender=Airport)
+def airport_saved(sender, instance, **kwargs):
+    changed(Airport)
+    airspace.airport_changed(instance)
+    airspace.log(Airport, instance.pk)
+    geometry.clear()
+
+
+@receiver(post_delete, sender=Airport)
+def airport_deleted(sender, instance, **kwargs):
+    changed(Airport)
+    airspace.airport_deleted(instance.pk)
+    airspace.log(Airport, instance.pk)
+    geometry.clear()
+
+
+@receiver(m2m_changed, sender=Airport.airlines.through)
+def airport_airlines_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    changed(sender)
+    airspace.log(sender)
+    if not reverse:
+        airspace.airlines_changed([instance.pk])
+    else:
+        # changed from the airline side, pk_set holds airports (or is None after a clear)
+        airspace.airlines_changed(None if pk_set is None else list(pk_set))
+
+
+@receiver(post_save, sender=Airline)
+@receiver(post_delete, sender=Airline)
+def airline_changed(sender, **kwargs):
+    changed(Airline)
+
+
+@receiver(post_save, sender=Gate)
+def gate_saved(sender, instance, **kwargs):
+    changed(Gate)
+    airspace.gate_changed(instance)
+    airspace.log(Gate, instance.pk)
+
+
+@receiver(post_delete, sender=Gate)
+def gate_deleted(sender, instance, **kwargs):
+    changed(Gate)
+    airspace.gate_deleted(instance.pk)
+    airspace.log(Gate, instance.pk)
+
+
+@receiver(post_save, sender=Runway)
+def runway_saved(sender, instance, **kwargs):
+    changed(Runway)
+    airspace.runway_changed(instance)
+    airspace.log(Runway, instance.pk)
+
+
+@receiver(post_delete, sender=Runway)
+def runway_deleted(sender, instance, **kwargs):
+    changed(Runway)
+    airspace.runway_deleted(instance.pk)
+    airspace.log(Runway, instance.pk)
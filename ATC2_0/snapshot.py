@@ -0,0 +1,46 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
+
+from .airspace import airspace
+
+# the last full snapshot served, (version, body), so that it is only encoded once per version
+latest = (None, None)
+
+
+def matches(request, etag):
+    return etag in (tag.strip() for tag in request.META.get("HTTP_IF_NONE_MATCH", "").split(","))
+
+
+@require_GET
+def snapshot(request):
+    """Every plane as JSON, with the version in "version" and the ETag.
+
+    With If-None-Match holding the current ETag the answer is a bodiless 304. ?since=<version> only returns the
+    planes changed after that version and the identifiers of the ones deleted, unless the version is too old to
+    tell, in which case "full" is true and every plane is there as without it. Versions come from the change log
+    in the database (see AirspaceStore.sync), so any process can answer for a version another one handed out.
+    """
+    global latest
+    etag = f'"{airspace.version()}"'
+    if matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        since = request.GET.get("since")
+        if since is None and latest[0] == etag:
+            body = latest[1]
+        else:
+            version, planes, removed, full = airspace.snapshot(since)
+            etag = f'"{version}"'
+            body = json.dumps({"version": version, "full": full, "planes": planes, "removed": removed},
+                              cls=DjangoJSONEncoder)
+            if full:
+                latest = (etag, body)
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    # clients may keep it, but have to ask whether it is still current every time
+    patch_cache_control(response, no_cache=True)
+    return response
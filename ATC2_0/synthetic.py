@@ -0,0 +1,307 @@
+import csv
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from math import ceil, sqrt
+from types import SimpleNamespace
+
+import numpy as np
+
+from .helpers import calc_distance, calc_heading, check_size
+from .traffic import TIME_FORMAT
+
+SIZE_NAMES = ("SMALL", "MEDIUM", "LARGE")
+# spots a plane of each size fits, biggest first so the LARGE ones are used up last
+FITS = {size: [spot for spot in reversed(SIZE_NAMES) if check_size(size, spot)] for size in SIZE_NAMES}
+CONFLICTS = ("HEAD_ON", "REAR", "WRONG_AIRPORT", "DUPLICATE_GATE", "DUPLICATE_RUNWAY", "TOO_MANY_PASSENGERS")
+GRID = 1000
+
+
+class SyntheticAirspace:
+    """A made up airspace of any size, consistent between the datasets/ CSVs and a message stream for them.
+
+    Airports sit one to a GRID sized cell so no two share coordinates, every airline serves at least one airport and
+    every name is derived from an index, so the stream is generated without reading the CSVs back.
+    """
+
+    def __init__(self, airports=1000, airlines=50, planes=100000, gates_per_airport=8, runways_per_airport=3,
+                 airlines_per_airport=5, seed=0):
+        rng = np.random.RandomState(seed)
+        self.seed = seed
+        columns = ceil(sqrt(airports))
+        cells = np.arange(airports)
+        self.x = (cells % columns) * GRID + rng.randint(0, GRID, airports)
+        self.y = (cells // columns) * GRID + rng.randint(0, GRID, airports)
+        self.airlines = airlines
+
+        per_airport = min(airlines_per_airport, airlines)
+        self.links = np.empty((airports, per_airport), dtype=np.int64)
+        for airport in range(airports):
+            others = rng.choice(airlines - 1, per_airport - 1, replace=False) if per_airport > 1 else []
+            first = airport % airlines
+            self.links[airport] = [first] + [other + (other >= first) for other in others]
+        self.served = [[] for _ in range(airlines)]
+        for airport, airline in zip(np.repeat(cells, per_airport), self.links.ravel()):
+            self.served[airline].append(int(airport))
+        self.served_sets = [set(airports) for airports in self.served]
+
+        self.plane_airline = rng.randint(0, airlines, planes)
+        self.plane_size = rng.randint(0, len(SIZE_NAMES), planes)
+        self.plane_max = rng.randint(50, 500, planes)
+        self.gate_airport = np.repeat(cells, gates_per_airport)
+        self.gate_size = rng.randint(0, len(SIZE_NAMES), len(self.gate_airport))
+        self.runway_airport = np.repeat(cells, runways_per_airport)
+        self.runway_size = rng.randint(0, len(SIZE_NAMES), len(self.runway_airport))
+
+    @property
+    def airports(self):
+        return len(self.x)
+
+    @property
+    def planes(self):
+        return len(self.plane_airline)
+
+    @staticmethod
+    def airport_name(index):
+        return f"airport{index}"
+
+    @staticmethod
+    def airline_name(index):
+        return f"airline{index}"
+
+    @staticmethod
+    def gate_name(index):
+        return f"gate{index}"
+
+    @staticmethod
+    def runway_name(index):
+        return f"runway{index}"
+
+    @staticmethod
+    def plane_name(index):
+        return f"plane{index}"
+
+    def write_datasets(self, directory):
+        """Writes the six CSVs load_data reads, in the same layout as datasets/."""
+        os.makedirs(directory, exist_ok=True)
+
+        def write(name, header, rows):
+            with open(os.path.join(directory, f"{name}.csv"), "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(header)
+                writer.writerows(rows)
+
+        write("airport", ["name", "x", "y"], ((self.airport_name(index), int(x), int(y))
+                                              for index, (x, y) in enumerate(zip(self.x, self.y))))
+        write("airline", ["name"], ((self.airline_name(index),) for index in range(self.airlines)))
+        write("airport_airline", ["airline", "airport"], ((self.airline_name(airline), self.airport_name(airport))
+                                                          for airport, airlines in enumerate(self.links)
+                                                          for airline in airlines))
+        write("gate", ["id", "airport", "size"], ((self.gate_name(index), self.airport_name(airport), SIZE_NAMES[size])
+                                                  for index, (airport, size)
+                                                  in enumerate(zip(self.gate_airport, self.gate_size))))
+        write("runway", ["id", "airport", "size"], ((self.runway_name(index), self.airport_name(airport),
+                                                     SIZE_NAMES[size]) for index, (airport, size)
+                                                    in enumerate(zip(self.runway_airport, self.runway_size))))
+        write("plane", ["id", "airline", "size", "maxPassenger"], (
+            (self.plane_name(index), self.airline_name(airline), SIZE_NAMES[size], int(most))
+            for index, (airline, size, most) in enumerate(zip(self.plane_airline, self.plane_size, self.plane_max))))
+
+    def stream(self, start=None):
+        return MessageStream(self, random.Random(self.seed), start)
+
+    def write_capture(self, path, count, conflict_rate=0.01, rate=1000.0, start=None):
+        """Writes `count` messages as a capture ingest and replay_traffic read, `rate` messages a second, and
+        returns the conflicts injected by type."""
+        stream = self.stream(start)
+        with open(path, "w") as file:
+            for index, (kind, body) in enumerate(stream.generate(count, conflict_rate)):
+                file.write(json.dumps({"at": index / rate, "kind": kind, "body": body}) + "\n")
+        return stream.injected
+
+
+class MessageStream:
+    """(kind, body) messages for a SyntheticAirspace.
+
+    About `conflict_rate` of the messages generate() yields belong to a deliberate conflict, each a pair of messages
+    (or a single one for WRONG_AIRPORT and TOO_MANY_PASSENGERS) that produces one warning type; `injected` counts
+    them. The rest avoid conflicting: their routes, gates and runway slots are not reused while unused ones are left,
+    airlines only fly to airports that serve them and passenger counts stay under the limit. Crossing routes are not
+    avoided, so the rest can still turn up the occasional INTERSECTION.
+    """
+
+    def __init__(self, airspace, rng, start=None):
+        self.airspace = airspace
+        self.rng = rng
+        self.start = start or datetime.now().replace(second=0, microsecond=0)
+        self.injected = dict.fromkeys(CONFLICTS, 0)
+        self.routes = set()
+        self.gates = {size: self._shuffled(np.flatnonzero(airspace.gate_size == index))
+                      for index, size in enumerate(SIZE_NAMES)}
+        self.runways = {size: np.flatnonzero(airspace.runway_size == index) for index, size in enumerate(SIZE_NAMES)}
+        self.runway_slots = {}
+        self.by_airline = np.argsort(airspace.plane_airline, kind="stable")
+        self.airline_start = np.searchsorted(airspace.plane_airline[self.by_airline], np.arange(airspace.airlines + 1))
+
+    def _shuffled(self, values):
+        values = list(map(int, values))
+        self.rng.shuffle(values)
+        return values
+
+    def generate(self, count, conflict_rate):
+        emitted = in_conflicts = 0
+        while emitted < count:
+            batch = None
+            if in_conflicts < conflict_rate * (emitted + 1):
+                kind = self.rng.choice(CONFLICTS)
+                batch = getattr(self, kind.lower())()
+                if batch is not None and emitted + len(batch) <= count:
+                    self.injected[kind] += 1
+                    in_conflicts += len(batch)
+                else:
+                    batch = None
+            for message in batch or [self.background()]:
+                emitted += 1
+                yield message
+
+    # picking
+
+    def plane(self):
+        return self.rng.randrange(self.airspace.planes)
+
+    def plane_of(self, airline):
+        start, end = self.airline_start[airline], self.airline_start[airline + 1]
+        return int(self.by_airline[self.rng.randrange(start, end)]) if end > start else None
+
+    def airline(self, plane):
+        return int(self.airspace.plane_airline[plane])
+
+    def size(self, plane):
+        return SIZE_NAMES[self.airspace.plane_size[plane]]
+
+    def moment(self):
+        return self.start + timedelta(minutes=self.rng.randrange(0, 24 * 60))
+
+    def route(self, origins, destinations, tries=20):
+        """An origin and destination from the given airports, preferring a pair no other flight has used."""
+        for attempt in range(tries):
+            origin, destination = self.rng.choice(origins), self.rng.choice(destinations)
+            if origin != destination and (frozenset((origin, destination)) not in self.routes or attempt == tries - 1):
+                self.routes.add(frozenset((origin, destination)))
+                return origin, destination
+        return None
+
+    def gate(self, size):
+        for fits in FITS[size]:
+            if self.gates[fits]:
+                return self.gates[fits].pop()
+        return None
+
+    def runway(self, size):
+        for fits in FITS[size]:
+            if len(self.runways[fits]):
+                return int(self.rng.choice(self.runways[fits]))
+        return None
+
+    def slot(self, runway):
+        # three minutes apart on each runway, well clear of the one minute a DUPLICATE_RUNWAY needs
+        slot = self.runway_slots.get(runway, self.rng.randrange(0, 60))
+        self.runway_slots[runway] = slot + 1
+        return self.start + timedelta(minutes=3 * slot)
+
+    # messages
+
+    def heading(self, plane, origin, destination, take_off, hours):
+        airspace = self.airspace
+        origin_at = SimpleNamespace(x=float(airspace.x[origin]), y=float(airspace.y[origin]))
+        destination_at = SimpleNamespace(x=float(airspace.x[destination]), y=float(airspace.y[destination]))
+        return "headings", {
+            "plane": airspace.plane_name(plane),
+            "direction": calc_heading(origin_at, destination_at),
+            "speed": calc_distance(origin_at, destination_at) / hours,
+            "origin": airspace.airport_name(origin),
+            "destination": airspace.airport_name(destination),
+            "take_off_time": take_off.strftime(TIME_FORMAT),
+            "landing_time": (take_off + timedelta(hours=hours)).strftime(TIME_FORMAT)
+        }
+
+    def gate_arrival(self, plane, gate, moment):
+        return "gates", {"plane": self.airspace.plane_name(plane), "gate": self.airspace.gate_name(gate),
+                         "arrive_at_time": moment.strftime(TIME_FORMAT)}
+
+    def runway_arrival(self, plane, runway, moment):
+        return "runways", {"plane": self.airspace.plane_name(plane), "runway": self.airspace.runway_name(runway),
+                           "arrive_at_time": moment.strftime(TIME_FORMAT)}
+
+    def count(self, plane, passengers):
+        return "counts", {"plane": self.airspace.plane_name(plane), "passenger_count": passengers}
+
+    def background(self):
+        plane = self.plane()
+        roll = self.rng.random()
+        if roll < .55:
+            route = self.route(range(self.airspace.airports), self.airspace.served[self.airline(plane)])
+            if route is not None:
+                return self.heading(plane, *route, self.moment(), self.rng.choice([1, 1.5, 2, 3]))
+        if roll < .7:
+            gate = self.gate(self.size(plane))
+            if gate is not None:
+                return self.gate_arrival(plane, gate, self.moment())
+        if roll < .85:
+            runway = self.runway(self.size(plane))
+            if runway is not None:
+                return self.runway_arrival(plane, runway, self.slot(runway))
+        return self.count(plane, self.rng.randrange(0, int(self.airspace.plane_max[plane]) + 1))
+
+    def head_on(self):
+        first, second = self.plane(), self.plane()
+        route = self.route(self.airspace.served[self.airline(second)], self.airspace.served[self.airline(first)])
+        if first == second or route is None:
+            return None
+        origin, destination = route
+        take_off = self.moment()
+        return [self.heading(first, origin, destination, take_off, 1),
+                self.heading(second, destination, origin, take_off, 1)]
+
+    def rear(self):
+        first = self.plane()
+        second = self.plane_of(self.airline(first))
+        route = self.route(range(self.airspace.airports), self.airspace.served[self.airline(first)])
+        if second in (None, first) or route is None:
+            return None
+        take_off = self.moment()
+        # behind() looks for planes on the route landing after the publishing one, so the slower plane goes first
+        return [self.heading(second, *route, take_off, 2), self.heading(first, *route, take_off, 1)]
+
+    def wrong_airport(self):
+        plane = self.plane()
+        served = self.airspace.served_sets[self.airline(plane)]
+        if len(served) == self.airspace.airports:
+            return None
+        unserved = [airport for airport in (self.rng.randrange(self.airspace.airports) for _ in range(20))
+                    if airport not in served]
+        route = unserved and self.route(range(self.airspace.airports), unserved)
+        if not route:
+            return None
+        return [self.heading(plane, *route, self.moment(), 1)]
+
+    def duplicate_gate(self):
+        first, second = self.plane(), self.plane()
+        gate = self.gate("LARGE")
+        if first == second or gate is None:
+            return None
+        moment = self.moment()
+        return [self.gate_arrival(first, gate, moment), self.gate_arrival(second, gate, moment)]
+
+    def duplicate_runway(self):
+        first, second = self.plane(), self.plane()
+        runway = self.runway("LARGE")
+        if first == second or runway is None:
+            return None
+        moment = self.slot(runway)
+        return [self.runway_arrival(first, runway, moment), self.runway_arrival(second, runway, moment)]
+
+    def too_many_passengers(self):
+        plane = self.plane()
+        return [self.count(plane, int(self.airspace.plane_max[plane]) + self.rng.randrange(1, 50))]
@@ -1,11 +1,45 @@
-from django.test import Client, TestCase
-from ATC2_0.models import Airline, Airport, Gate, Runway, Plane
-from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import F, Q
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ATC2_0.models import Airline, Airport, Gate, Runway, Plane, OutboundWarning, AirspaceChange
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
 from unittest.mock import patch
 from datetime import datetime, timedelta
-from .helpers import calc_heading, calc_distance
+from dateutil import parser
+from .helpers import calc_heading, calc_distance, arrive_at_intersection_at_same_minute, get_route_intersection_point, \
+    check_time_delta, send_warning
+from .conflicts import RouteBatch, tbone_conflicts
+from .flight_windows import FlightWindowIndex, GateTimeline, OccupancyIndex
+from .airspace import AirspaceStore, airspace, PLANE_FIELDS
+from .authorization import AuthorizationMatrix
+from .geometry import geometry
+from .messages import MessageError, decode, parse_time
+from .outbox import Outbox
+from .coalescer import coalescer, WarningCoalescer
+from .management.commands.process_kafka import consume
+from .processor import Message, Sync, jsonl_source, partition, process, queue_source, work
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+from .ingest_server import IngestServer
+from .synthetic import CONFLICTS, SyntheticAirspace
+from .traffic import ENDPOINTS, Replayer, read_capture, seed_capture
 from django.core import management
+import asyncio
+import csv
 import json
+import multiprocessing
+import queue
+import random
+import tempfile
+from concurrent.futures import Executor, Future
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Event, Thread
+from types import SimpleNamespace
 
 TEMPORARY = 'temporary'
 EMAIL = 'temporary@gmail.com'
@@ -476,6 +510,177 @@ class PlaneTestCases(TestCase):
         self.assertGreaterEqual(response.status_code, 400)
 
 
+@override_settings(LIST_CACHE_TIMEOUT=0)
+class ListPaginationTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        self.client.login(username="joanna", password="jojo")
+
+    def walk(self, url, link):
+        keys = []
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            keys.append([getattr(row, response.context["view"].key) for row in response.context["object_list"]])
+            url = response.context.get(link) and url.split("?")[0] + response.context[link]
+        return keys
+
+    def test_walks_every_list(self):
+        for end, model, key in [(PLANE_END, Plane, "identifier"), (GATE_END, Gate, "identifier"),
+                                (RUNWAY_END, Runway, "identifier"), (AIRPORT_END, Airport, "name"),
+                                (AIRLINE_END, Airline, "name")]:
+            expected = list(model.objects.order_by(key).values_list(key, flat=True))
+            pages = self.walk(end + "?size=3", "next_page")
+            self.assertGreater(len(pages), 1)
+            self.assertTrue(all(len(page) == 3 for page in pages[:-1]))
+            self.assertEqual([key for page in pages for key in page], expected)
+            backwards = self.walk(end + "?size=3&before=" + pages[-1][0], "previous_page")
+            self.assertEqual([key for page in reversed(backwards) for key in page] + pages[-1], expected)
+
+    def test_queries_do_not_grow_with_page_size(self):
+        self.client.get(PLANE_END)
+        Plane.objects.update(take_off_airport=Airport.objects.first(), land_airport=Airport.objects.last(),
+                             gate=Gate.objects.first(), runway=Runway.objects.first())
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(PLANE_END + "?size=2")
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(PLANE_END + "?size=80")
+        self.assertEqual(len(response.context["object_list"]), 80)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertContains(response, Gate.objects.first().identifier)
+
+
+class ListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        management.call_command("load_data")
+        airspace.clear()
+        self.client.login(username="joanna", password="jojo")
+
+    def lookups(self, name):
+        return {outcome: REGISTRY.get_sample_value("atc_list_cache_total", {"list": name, "outcome": outcome}) or 0
+                for outcome in ("hit", "miss")}
+
+    def test_second_request_is_served_from_the_cache(self):
+        before = self.lookups("plane")
+        first = self.client.get(PLANE_END + "?size=5")
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(PLANE_END + "?size=5")
+        self.assertEqual(second.content, first.content)
+        self.assertFalse(any("atc2_0_plane" in query["sql"] for query in queries.captured_queries))
+        after = self.lookups("plane")
+        self.assertEqual((after["hit"] - before["hit"], after["miss"] - before["miss"]), (1, 1))
+        # another page is another entry
+        self.client.get(PLANE_END + "?size=6")
+        self.assertEqual(self.lookups("plane")["miss"] - after["miss"], 1)
+
+    def test_changes_retire_only_the_pages_showing_them(self):
+        for end in (AIRLINE_END, GATE_END, PLANE_END):
+            self.client.get(end)
+        before = {name: self.lookups(name) for name in ("airline", "gate", "plane")}
+        Airline.objects.create(name="aaa first airline")
+        response = self.client.get(AIRLINE_END)
+        self.assertContains(response, "aaa first airline")
+        self.client.get(GATE_END)
+        self.client.get(PLANE_END)
+        after = {name: self.lookups(name) for name in ("airline", "gate", "plane")}
+        self.assertEqual(after["airline"]["miss"] - before["airline"]["miss"], 1)
+        self.assertEqual(after["gate"]["hit"] - before["gate"]["hit"], 1)
+        self.assertEqual(after["plane"]["miss"] - before["plane"]["miss"], 1)
+
+        gate = Gate.objects.order_by("identifier").first()
+        gate.identifier = "0renamed"
+        gate.save()
+        self.assertContains(self.client.get(GATE_END), "0renamed")
+
+    def test_publishes_retire_the_plane_pages(self):
+        plane = Plane.objects.order_by("identifier").first()
+        self.client.get(PLANE_END)
+        gate = Gate.objects.first()
+        with patch("ATC2_0.views.send_warning", autospec=True):
+            Client().post('/atc/api/gates', data=json.dumps({
+                "plane": plane.identifier, "gate": gate.identifier,
+                "arrive_at_time": timezone.localtime().strftime(TIME_FORMAT)
+            }), content_type="application/json")
+        response = self.client.get(PLANE_END)
+        self.assertEqual(response.context["object_list"][0].gate, gate)
+
+    def test_plane_pages_follow_writes_of_other_processes(self):
+        plane = Plane.objects.order_by("identifier").first()
+        self.client.get(PLANE_END)
+        other = AirspaceStore()
+        # the ingest process writes without touching this process's cache
+        with patch("ATC2_0.list_cache._bump"):
+            other.save_plane(other.plane(plane.identifier), currentPassengerCount=plane.maxPassengerCount - 1)
+        before = self.lookups("plane")
+        response = self.client.get(PLANE_END)
+        self.assertEqual(self.lookups("plane")["miss"] - before["miss"], 1)
+        self.assertEqual(response.context["object_list"][0].currentPassengerCount, plane.maxPassengerCount - 1)
+
+    def test_pages_are_kept_per_permission_set(self):
+        viewer = User.objects.create_user("viewer", EMAIL, "viewer")
+        viewer.user_permissions.add(Permission.objects.get(codename="view_airport"))
+        self.assertContains(self.client.get(AIRPORT_END), "New Airport")
+        self.client.logout()
+        self.client.login(username="viewer", password="viewer")
+        response = self.client.get(AIRPORT_END)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "New Airport")
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        self.client.login(username="joanna", password="jojo")
+        self.origin, self.destination = Airport.objects.order_by("name")[:2]
+        self.take_off = timezone.now().replace(microsecond=0)
+        self.flying = list(Plane.objects.order_by("identifier")[:3])
+        Plane.objects.filter(pk__in=[plane.pk for plane in self.flying]).update(
+            take_off_airport=self.origin, land_airport=self.destination, take_off_time=self.take_off,
+            landing_time=self.take_off + timedelta(hours=1))
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_has_every_row(self):
+        for end, model, key in [(PLANE_END, Plane, "identifier"), (GATE_END, Gate, "identifier"),
+                                (RUNWAY_END, Runway, "identifier"), (AIRPORT_END, Airport, "name")]:
+            rows = list(csv.DictReader(StringIO(self.export(end + "/export.csv"))))
+            self.assertEqual([row[key] for row in rows],
+                             list(model.objects.order_by(key).values_list(key, flat=True)))
+        rows = {row["identifier"]: row for row in csv.DictReader(StringIO(self.export(PLANE_END + "/export.csv")))}
+        self.assertEqual(rows[self.flying[0].identifier]["origin"], self.origin.name)
+        self.assertEqual(parser.parse(rows[self.flying[0].identifier]["take_off_time"]), self.take_off)
+
+    def test_ndjson_filters(self):
+        def identifiers(query):
+            return [json.loads(line)["identifier"] for line in self.export(PLANE_END + "/export.ndjson?" + query)
+                    .splitlines()]
+
+        flying = sorted(plane.identifier for plane in self.flying)
+        self.assertEqual(identifiers("airport=" + self.destination.name), flying)
+        later = (self.take_off + timedelta(hours=2)).strftime(TIME_FORMAT)
+        self.assertEqual(identifiers("since=" + self.take_off.strftime(TIME_FORMAT)), flying)
+        self.assertEqual(identifiers("since=" + later), [])
+        airline = self.flying[0].airline
+        self.assertEqual(identifiers("airline=" + airline.name),
+                         list(Plane.objects.filter(airline=airline).order_by("identifier")
+                              .values_list("identifier", flat=True)))
+        airports = [json.loads(line)["name"] for line in self.export(
+            AIRPORT_END + "/export.ndjson?until=" + later).splitlines()]
+        self.assertEqual(airports, [self.origin.name, self.destination.name])
+        gates = [json.loads(line)["identifier"] for line in self.export(
+            GATE_END + "/export.ndjson?airport=" + self.origin.name).splitlines()]
+        self.assertEqual(gates, list(self.origin.gate_set.order_by("identifier").values_list("identifier", flat=True)))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(PLANE_END + "/export.xml").status_code, 404)
+        self.assertEqual(self.client.get(PLANE_END + "/export.csv?since=yesterday-ish").status_code, 400)
+
+
 @patch("ATC2_0.views.send_warning", autospec=True)
 class SimulationTests(TestCase):
     headings_url = '/atc/api/headings'
@@ -486,6 +691,8 @@ class SimulationTests(TestCase):
     def setUp(self):
         management.call_command("load_data")
         management.call_command("load_data")  # should do nothing
+        airspace.clear()
+        geometry.clear()
 
     def test_head_on_collision(self, mock_call_external_api):
         c = Client()
@@ -656,3 +863,1333 @@ class SimulationTests(TestCase):
             "passenger_count": 500
         }), content_type=self.content_type)
         self.assertEqual(mock_call_external_api.called, True)
+
+
+class ConflictEngineTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        geometry.clear()
+
+    def fly_everything(self, seed):
+        rng = random.Random(seed)
+        airports = list(Airport.objects.all())
+        take_off = datetime(2019, 11, 1, 12, 0)
+        for plane in Plane.objects.all():
+            origin, destination = rng.sample(airports, 2)
+            plane.take_off_airport = origin
+            plane.land_airport = destination
+            plane.speed = rng.choice([0, calc_distance(origin, destination), rng.uniform(500, 20000)])
+            plane.take_off_time = take_off + timedelta(minutes=rng.randrange(90), seconds=rng.randrange(60))
+            plane.landing_time = plane.take_off_time + timedelta(hours=1)
+            plane.save()
+
+    def test_matches_per_pair_helper(self):
+        for seed in range(3):
+            self.fly_everything(seed)
+            planes = list(Plane.objects.select_related("take_off_airport", "land_airport"))
+            batch = RouteBatch.from_queryset(Plane.objects.order_by("id"))
+            found = 0
+            for plane in planes:
+                expected = [other.identifier for other in sorted(planes, key=lambda p: p.id)
+                            if arrive_at_intersection_at_same_minute(plane, other)]
+                self.assertEqual(tbone_conflicts(plane, batch), expected)
+                found += len(expected)
+            self.assertGreater(found, 0)
+
+    def test_unrouted_planes_never_conflict(self):
+        plane = Plane.objects.first()
+        batch = RouteBatch.from_queryset(Plane.objects.all())
+        self.assertEqual(tbone_conflicts(plane, batch), [])
+        self.assertEqual(tbone_conflicts(plane, RouteBatch([])), [])
+
+
+class FlightWindowTests(TestCase):
+    def test_overlapping(self):
+        index = FlightWindowIndex()
+        noon = datetime(2019, 11, 1, 12, 0)
+        for key, (start, hours) in enumerate([(0, 1), (2, 1), (5, 10), (-20, 1)]):
+            index.set(key, noon + timedelta(hours=start), noon + timedelta(hours=start + hours))
+        index.set(4, noon, None)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(sorted(index.overlapping(noon, noon + timedelta(minutes=30))), [0])
+        self.assertEqual(sorted(index.overlapping(noon + timedelta(hours=1), noon + timedelta(hours=2))), [0, 1])
+        self.assertEqual(sorted(index.overlapping(noon + timedelta(hours=14), noon + timedelta(hours=20))), [2])
+        self.assertEqual(index.overlapping(noon + timedelta(hours=16), noon + timedelta(hours=17)), [])
+
+        index.discard(2)
+        self.assertEqual(index.overlapping(noon + timedelta(hours=14), noon + timedelta(hours=20)), [])
+        index.set(0, noon + timedelta(hours=14), noon + timedelta(hours=15))
+        self.assertEqual(index.overlapping(noon, noon + timedelta(minutes=30)), [])
+        self.assertEqual(index.overlapping(noon + timedelta(hours=14), noon + timedelta(hours=20)), [0])
+
+
+class OccupancyIndexTests(TestCase):
+    def test_near_matches_check_time_delta(self):
+        rng = random.Random(3)
+        noon = datetime(2019, 11, 1, 12, 0)
+        index = OccupancyIndex()
+        slots = {}
+        for key in range(500):
+            spot = rng.randrange(3)
+            moment = noon + timedelta(seconds=rng.randrange(0, 3600, 15))
+            if rng.random() < .5:
+                moment = timezone.make_aware(moment)
+            index.set(key, spot, moment)
+            slots[key] = (spot, moment)
+        for key in range(0, 500, 7):
+            index.discard(key)
+            del slots[key]
+        self.assertEqual(len(index), len(slots))
+
+        for _ in range(200):
+            spot = rng.randrange(3)
+            moment = noon + timedelta(seconds=rng.randrange(-60, 3660, 15))
+            expected = [key for key, (other_spot, other) in slots.items()
+                        if other_spot == spot and check_time_delta(moment, other, timedelta(minutes=1))]
+            self.assertEqual(sorted(index.near(spot, moment, timedelta(minutes=1))), sorted(expected))
+
+    def test_set_moves_key(self):
+        index = OccupancyIndex()
+        noon = datetime(2019, 11, 1, 12, 0)
+        index.set(1, 1, noon)
+        index.set(1, 2, noon)
+        self.assertEqual(index.near(1, noon, timedelta(minutes=1)), [])
+        self.assertEqual(index.near(2, noon, timedelta(minutes=1)), [1])
+        index.set(1, None, noon)
+        self.assertEqual(len(index), 0)
+
+    def test_gate_timeline(self):
+        timeline = GateTimeline()
+        noon = timezone.make_aware(datetime(2019, 11, 1, 12, 0))
+        timeline.set(1, 1, noon, None)
+        timeline.set(2, 1, noon + timedelta(minutes=5), None)
+        timeline.set(3, 1, noon, noon + timedelta(hours=1))
+        timeline.set(4, 2, None, None)
+        self.assertEqual(timeline.occupying(1), {1, 2})
+        self.assertEqual(sorted(timeline.arriving(1, noon)), [1, 3])
+        self.assertEqual(timeline.occupying(2), {4})
+        # reaching the runway ends the occupancy
+        timeline.set(1, 1, noon, noon + timedelta(minutes=30))
+        self.assertEqual(timeline.occupying(1), {2})
+        timeline.discard(2)
+        self.assertEqual(timeline.occupying(1), set())
+        self.assertEqual(len(timeline), 3)
+
+
+class AuthorizationMatrixTests(TestCase):
+    def test_matches_pairs(self):
+        rng = random.Random(3)
+        pairs = {(rng.randrange(60), rng.randrange(40)) for _ in range(800)}
+        matrix = AuthorizationMatrix()
+        matrix.load(pairs)
+        checks = [(rng.randrange(45), rng.randrange(65)) for _ in range(2000)] + [(None, 1), (1, None)]
+        for airline_id, airport_id in checks:
+            self.assertEqual(matrix.allowed(airline_id, airport_id), (airport_id, airline_id) in pairs)
+        allowed = matrix.allowed_many([airline_id for airline_id, _ in checks], [airport_id for _, airport_id in checks])
+        self.assertEqual(list(allowed), [(airport_id, airline_id) in pairs for airline_id, airport_id in checks])
+
+    def test_set_airport_replaces(self):
+        matrix = AuthorizationMatrix()
+        matrix.set_airport(1, [1, 2])
+        matrix.set_airport(2, [2])
+        matrix.set_airport(1, [3])
+        self.assertEqual(matrix.airline_ids(1), {3})
+        self.assertEqual(matrix.airline_ids(2), {2})
+        matrix.discard_airport(2)
+        self.assertFalse(matrix.allowed(2, 2))
+        self.assertEqual(list(matrix.allowed_many([], [])), [])
+
+
+@patch("ATC2_0.views.send_warning", autospec=True)
+class AirspaceStoreTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        airspace.clear()
+        geometry.clear()
+        self.take_off = datetime(2019, 11, 1, 12, 0)
+
+    def publish_heading(self, identifier, origin, destination):
+        return Client().post('/atc/api/headings', data=json.dumps({
+            "plane": identifier,
+            "direction": 90,
+            "speed": 500,
+            "origin": origin,
+            "destination": destination,
+            "take_off_time": self.take_off.strftime(TIME_FORMAT),
+            "landing_time": (self.take_off + timedelta(hours=1)).strftime(TIME_FORMAT)
+        }), content_type="application/json")
+
+    def test_publishes_write_through(self, mock_call_external_api):
+        self.publish_heading("gnfasudtlm", "kkz", "xhz")
+        plane = Plane.objects.get(identifier="gnfasudtlm")
+        self.assertEqual(plane.take_off_airport.name, "kkz")
+        self.assertEqual(plane.land_airport.name, "xhz")
+        self.assertEqual(plane.speed, 500)
+        self.assertEqual(airspace.windows.overlapping(self.take_off, self.take_off), [plane.pk])
+
+        Client().post('/atc/api/runways', data=json.dumps({
+            "plane": "gnfasudtlm",
+            "runway": "qkegovbsbo"
+        }), content_type="application/json")
+        plane = Plane.objects.get(identifier="gnfasudtlm")
+        self.assertEqual(plane.take_off_airport.name, "xhz")
+        self.assertIsNone(plane.land_airport)
+        self.assertIsNone(plane.landing_time)
+        self.assertEqual(plane.runway.identifier, "qkegovbsbo")
+        self.assertEqual(airspace.windows.overlapping(self.take_off, self.take_off), [])
+
+    def test_heading_publish_only_writes(self, mock_call_external_api):
+        self.publish_heading("gnfasudtlm", "kkz", "xhz")
+        # catching up on the change log, the update and its change row
+        with self.assertNumQueries(3):
+            self.publish_heading("matxovlzow", "xhz", "kkz")
+        self.assertEqual(mock_call_external_api.called, True)
+
+    def test_catches_up_on_other_processes(self, mock_call_external_api):
+        self.publish_heading("gnfasudtlm", "kkz", "xhz")
+        other = AirspaceStore()
+        plane = other.plane("gnfasudtlm")
+        other.save_plane(plane, heading=90.0)
+        with other.deferred_writes():
+            other.save_plane(other.plane("matxovlzow"), speed=250.0)
+        airspace.sync()
+        self.assertEqual(airspace.plane("gnfasudtlm").heading, 90.0)
+        self.assertEqual(airspace.plane("matxovlzow").speed, 250.0)
+        self.assertEqual(airspace.windows.overlapping(self.take_off, self.take_off), [plane.pk])
+
+        # a write held back in this thread is the later one and wins
+        with airspace.deferred_writes():
+            airspace.save_plane(airspace.plane("gnfasudtlm"), heading=180.0)
+            other.save_plane(plane, heading=270.0)
+            airspace.sync()
+            self.assertEqual(airspace.plane("gnfasudtlm").heading, 180.0)
+        self.assertEqual(Plane.objects.get(identifier="gnfasudtlm").heading, 180.0)
+
+        # anything but a plane loads everything again
+        Airport.objects.filter(name="kkz").update(x=F("x") + 1)
+        other.log(Airport)
+        airspace.sync()
+        self.assertEqual(airspace.airport("kkz").x, Airport.objects.get(name="kkz").x)
+
+    def test_change_log_gaps_and_pruning(self, mock_call_external_api):
+        airspace.load()
+        plane = Plane.objects.get(identifier="gnfasudtlm")
+        first, missing, last = (AirspaceChange.objects.create(kind="plane", object_pk=plane.pk, source="other")
+                                for _ in range(3))
+        gap = missing.pk
+        missing.delete()
+        airspace.sync()
+        low, high = airspace.version().split(".")
+        self.assertEqual((int(low), int(high)), (gap - 1, last.pk))
+        # the change committed late is still read
+        Plane.objects.filter(pk=plane.pk).update(speed=321.0)
+        AirspaceChange.objects.create(pk=gap, kind="plane", object_pk=plane.pk, source="other")
+        self.assertEqual(airspace.version(), f"{last.pk}.{last.pk}")
+        self.assertEqual(airspace.plane("gnfasudtlm").speed, 321.0)
+
+        with override_settings(AIRSPACE_CHANGE_RETENTION=0):
+            airspace.sync()
+        self.assertFalse(AirspaceChange.objects.exists())
+
+    def test_follows_model_changes(self, mock_call_external_api):
+        airspace.load()
+        airport = Airport.objects.get(name="kkz")
+        airport.x += 1
+        airport.save()
+        self.assertEqual(airspace.airport("kkz").x, airport.x)
+
+        plane = Plane.objects.get(identifier="gnfasudtlm")
+        xwc = Airport.objects.get(name="xwc")
+        self.assertTrue(airspace.authorized(plane.airline_id, xwc.pk))
+        xwc.airlines.remove(plane.airline)
+        self.assertFalse(airspace.authorized(plane.airline_id, xwc.pk))
+        plane.airline.airport_set.add(xwc)
+        self.assertTrue(airspace.authorized(plane.airline_id, xwc.pk))
+
+        plane.maxPassengerCount = 7
+        plane.save()
+        self.assertEqual(airspace.plane("gnfasudtlm").maxPassengerCount, 7)
+        plane.delete()
+        self.assertIsNone(airspace.plane("gnfasudtlm"))
+
+    def test_duplicate_runway_within_a_minute(self, mock_call_external_api):
+        c = Client()
+        for identifier, arrival in (("gnfasudtlm", "2019-11-01 12:00:00"), ("matxovlzow", "2019-11-01 12:01:00"),
+                                    ("mopyahgbal", "2019-11-01 12:00:59")):
+            c.post('/atc/api/runways', data=json.dumps({
+                "plane": identifier,
+                "runway": "zeneimidui",
+                "arrive_at_time": arrival
+            }), content_type="application/json")
+        duplicates = [call[0][0]["id"] for call in mock_call_external_api.call_args_list
+                      if call[0][0]["error"] == "DUPLICATE_RUNWAY"]
+        # exactly a minute apart is not a duplicate
+        self.assertEqual(sorted(duplicates), ["gnfasudtlm", "matxovlzow", "mopyahgbal"])
+
+        c.post('/atc/api/runways', data=json.dumps({"plane": "mopyahgbal", "runway": "qkegovbsbo"}),
+               content_type="application/json")
+        self.assertEqual(airspace.runway_neighbours(airspace.plane("gnfasudtlm"), timedelta(minutes=1)), [])
+
+    def test_gate_conflicts_match_query(self, mock_call_external_api):
+        rng = random.Random(5)
+        c = Client()
+        planes = list(Plane.objects.values_list("identifier", flat=True)[:40])
+        gates = list(Gate.objects.filter(airport__name="kkz").values_list("identifier", flat=True)[:3])
+        runways = list(Runway.objects.filter(airport__name="kkz").values_list("identifier", flat=True))
+        for _ in range(150):
+            identifier = rng.choice(planes)
+            arrival = (self.take_off + timedelta(minutes=rng.randrange(5))).strftime(TIME_FORMAT)
+            if rng.random() < .6:
+                body = {"plane": identifier, "gate": rng.choice(gates), "arrive_at_time": arrival}
+                c.post('/atc/api/gates', data=json.dumps(body), content_type="application/json")
+                plane = Plane.objects.get(identifier=identifier)
+                # the query check_gate used to run
+                expected = Plane.objects.filter(gate=plane.gate).filter(
+                    Q(arrive_at_gate_time=plane.arrive_at_gate_time) | Q(arrive_at_runway_time=None))
+                self.assertEqual([other.identifier for other in airspace.gate_conflicts(airspace.plane(identifier))],
+                                 list(expected.order_by("pk").values_list("identifier", flat=True)))
+            else:
+                body = {"plane": identifier, "runway": rng.choice(runways)}
+                if rng.random() < .5:
+                    body["arrive_at_time"] = arrival
+                c.post('/atc/api/runways', data=json.dumps(body), content_type="application/json")
+
+
+class RouteGeometryTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        geometry.clear()
+
+    def test_matches_helpers(self):
+        oap, kkz, mfz = (Airport.objects.get(name=name) for name in ("oap", "kkz", "mfz"))
+        route = geometry.route(oap, mfz)
+        self.assertIs(geometry.route(oap, mfz), route)
+        self.assertEqual(route.distance, calc_distance(oap, mfz))
+        self.assertEqual(route.heading, calc_heading(oap, mfz))
+        self.assertAlmostEqual(route.a * mfz.x + route.b * mfz.y, route.c)
+
+        crossing = geometry.crossing(route, geometry.route(kkz, mfz))
+        self.assertEqual((crossing.x, crossing.y), get_route_intersection_point(oap, mfz, kkz, mfz))
+        self.assertAlmostEqual(crossing.x, mfz.x)
+        self.assertAlmostEqual(crossing.y, mfz.y)
+        self.assertAlmostEqual(crossing.distance, route.distance)
+        self.assertIsNone(geometry.crossing(route, geometry.route(mfz, oap)))
+        self.assertIsNone(geometry.route(oap, None))
+
+    def test_airport_changes_invalidate(self):
+        oap, mfz = Airport.objects.get(name="oap"), Airport.objects.get(name="mfz")
+        distance = geometry.route(oap, mfz).distance
+        oap.x += 100
+        oap.save()
+        self.assertNotEqual(geometry.route(oap, mfz).distance, distance)
+        self.assertEqual(geometry.route(oap, mfz).distance, calc_distance(oap, mfz))
+
+    def test_airports_moved_by_another_process(self):
+        airspace.clear()
+        route = geometry.route(airspace.airport("oap"), airspace.airport("mfz"))
+        crossing = geometry.crossing(route, geometry.route(airspace.airport("kkz"), airspace.airport("xhz")))
+        Airport.objects.filter(name="oap").update(x=F("x") + 100)
+        AirspaceStore().log(Airport)
+        airspace.sync()
+        oap, mfz, kkz, xhz = (airspace.airport(name) for name in ("oap", "mfz", "kkz", "xhz"))
+        self.assertEqual(oap.x, Airport.objects.get(name="oap").x)
+        moved = geometry.route(oap, mfz)
+        self.assertNotEqual(moved.distance, route.distance)
+        self.assertEqual(moved.distance, calc_distance(oap, mfz))
+        moved_crossing = geometry.crossing(moved, geometry.route(kkz, xhz))
+        self.assertEqual((moved_crossing.x, moved_crossing.y), get_route_intersection_point(oap, mfz, kkz, xhz))
+        self.assertNotEqual((moved_crossing.x, moved_crossing.y), (crossing.x, crossing.y))
+
+
+@patch("ATC2_0.views.send_warning", autospec=True)
+class HeadingBatchTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        airspace.clear()
+        geometry.clear()
+
+    def headings(self):
+        rng = random.Random(7)
+        airports = list(Airport.objects.order_by("name"))
+        take_off = datetime(2019, 11, 1, 12, 0)
+        headings = []
+        for plane in Plane.objects.order_by("identifier")[:30]:
+            for _ in range(2):
+                origin, destination = rng.sample(airports, 2)
+                start = take_off + timedelta(minutes=rng.randrange(0, 60, 5))
+                headings.append({
+                    "plane": plane.identifier,
+                    "direction": calc_heading(origin, destination),
+                    "speed": calc_distance(origin, destination) / rng.choice([1, 2]),
+                    "origin": origin.name,
+                    "destination": destination.name,
+                    "take_off_time": start.strftime(TIME_FORMAT),
+                    "landing_time": (start + timedelta(hours=2)).strftime(TIME_FORMAT)
+                })
+        rng.shuffle(headings)
+        return headings
+
+    def test_batch_matches_one_by_one(self, mock_call_external_api):
+        c = Client()
+        headings = self.headings()
+        before = list(Plane.objects.all())
+
+        for heading in headings:
+            c.post('/atc/api/headings', data=json.dumps(heading), content_type="application/json")
+        one_by_one = [call[0][0] for call in mock_call_external_api.call_args_list]
+        after = list(Plane.objects.order_by("id").values())
+        self.assertGreater(len(one_by_one), len(headings))
+
+        Plane.objects.bulk_update(before, ["take_off_airport", "land_airport", "take_off_time", "landing_time",
+                                           "heading", "speed", "runway"])
+        airspace.clear()
+        mock_call_external_api.reset_mock()
+        response = c.post('/atc/api/headings/batch', data=json.dumps(headings), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        batched = [call[0][0] for call in mock_call_external_api.call_args_list]
+
+        key = lambda warning: (warning["error"], warning["id"])
+        self.assertEqual(sorted(batched, key=key), sorted(one_by_one, key=key))
+        self.assertEqual(list(Plane.objects.order_by("id").values()), after)
+
+    def test_rejects_non_list(self, mock_call_external_api):
+        response = Client().post('/atc/api/headings/batch', data=json.dumps({"plane": "gnfasudtlm"}),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_plane_applies_nothing(self, mock_call_external_api):
+        headings = self.headings()[:5]
+        headings.insert(3, dict(headings[0], plane="nobody"))
+        before = list(Plane.objects.order_by("id").values())
+        response = Client().post('/atc/api/headings/batch', data=json.dumps(headings),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b"heading 3: unknown plane", response.content)
+        self.assertEqual(list(Plane.objects.order_by("id").values()), before)
+        self.assertEqual(airspace.plane(headings[0]["plane"]).landing_time, None)
+        mock_call_external_api.assert_not_called()
+
+    def test_unknown_airport_is_rejected(self, mock_call_external_api):
+        heading = self.headings()[0]
+        before = list(Plane.objects.order_by("id").values())
+        for field in ("origin", "destination"):
+            response = Client().post('/atc/api/headings', data=json.dumps(dict(heading, **{field: "nowhere"})),
+                                     content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(b"unknown airport 'nowhere'", response.content)
+
+        headings = self.headings()[:5]
+        headings.insert(2, dict(headings[0], destination="nowhere"))
+        response = Client().post('/atc/api/headings/batch', data=json.dumps(headings),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b"heading 2: unknown airport 'nowhere'", response.content)
+        self.assertEqual(list(Plane.objects.order_by("id").values()), before)
+        mock_call_external_api.assert_not_called()
+
+
+@patch("ATC2_0.views.send_warning", autospec=True)
+class SnapshotTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        airspace.clear()
+        self.client.login(username="joanna", password="jojo")
+
+    def get(self, query="", **headers):
+        return self.client.get('/atc/api/snapshot' + query, **headers)
+
+    def publish_gate(self, plane, gate):
+        Client().post('/atc/api/gates', data=json.dumps({
+            "plane": plane.identifier, "gate": gate.identifier,
+            "arrive_at_time": timezone.localtime().strftime(TIME_FORMAT)
+        }), content_type="application/json")
+
+    def test_not_modified_until_a_publish(self, mock_send_warning):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertTrue(body["full"])
+        self.assertEqual(sorted(plane["identifier"] for plane in body["planes"]),
+                         sorted(Plane.objects.values_list("identifier", flat=True)))
+        self.assertEqual(response["ETag"], f'"{body["version"]}"')
+
+        unchanged = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(unchanged.content, b"")
+
+        self.publish_gate(Plane.objects.first(), Gate.objects.first())
+        changed = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+
+    def test_changes_since_a_version(self, mock_send_warning):
+        version = json.loads(self.get().content)["version"]
+        plane, gone = Plane.objects.order_by("identifier")[:2]
+        gate = Gate.objects.first()
+        self.publish_gate(plane, gate)
+        gone.delete()
+        body = json.loads(self.get("?since=" + version).content)
+        self.assertFalse(body["full"])
+        self.assertEqual([(entry["identifier"], entry["gate"]) for entry in body["planes"]],
+                         [(plane.identifier, gate.identifier)])
+        self.assertEqual(body["removed"], [gone.identifier])
+
+        latest = json.loads(self.get("?since=" + body["version"]).content)
+        self.assertEqual((latest["planes"], latest["removed"]), ([], []))
+        # versions are change log ids, so they still hold after a reload, but not from before it
+        airspace.clear()
+        self.assertFalse(json.loads(self.get("?since=" + body["version"]).content)["full"])
+        self.assertTrue(json.loads(self.get("?since=" + version).content)["full"])
+        self.assertTrue(json.loads(self.get("?since=nonsense").content)["full"])
+        gate.size = "LARGE"
+        gate.save()
+        self.assertTrue(json.loads(self.get("?since=" + body["version"]).content)["full"])
+
+    def test_versions_are_shared_by_processes(self, mock_send_warning):
+        response = self.get()
+        other = AirspaceStore()
+        plane = other.plane(Plane.objects.order_by("identifier").first().identifier)
+        other.save_plane(plane, heading=45.0)
+        self.assertEqual(other.version(), airspace.version())
+        changed = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed["ETag"], f'"{other.version()}"')
+        body = json.loads(self.get("?since=" + json.loads(response.content)["version"]).content)
+        self.assertEqual([(entry["identifier"], entry["heading"]) for entry in body["planes"]],
+                         [(plane.identifier, 45.0)])
+
+    def test_requires_view_plane(self, mock_send_warning):
+        self.client.logout()
+        self.assertEqual(self.get().status_code, 302)
+
+
+@patch("ATC2_0.views.send_warning", autospec=True)
+class MessageDecodingTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        airspace.clear()
+
+    def test_parse_time_matches_dateutil(self, mock_call_external_api):
+        for value in ["2019-11-01 12:00", "2019-11-01T12:00:30", "2019-11-01 12:00:30.25", "2019-11-01T12:00Z",
+                      "2019-11-01 12:00:00+02:00", "2019-11-01T12:00-0530", "2019-11-01", "Nov 1 2019 12:00",
+                      "2019-02-28 23:59:59.999999"]:
+            self.assertEqual(parse_time(value), parser.parse(value))
+        with self.assertRaises(ValueError):
+            parse_time("2019-13-01 12:00")
+
+    def test_decode(self, mock_call_external_api):
+        heading = decode("headings", {"plane": "gnfasudtlm", "direction": "90", "speed": 500, "origin": "kkz",
+                                      "destination": "xhz", "take_off_time": "2019-11-01 12:00",
+                                      "landing_time": "2019-11-01 13:00"})
+        self.assertEqual((heading.direction, heading.landing_time), (90.0, datetime(2019, 11, 1, 13, 0)))
+        self.assertIsNone(decode("gates", {"plane": "gnfasudtlm", "gate": "jemhnkkldw"}).arrive_at_time)
+        for kind, body in [("counts", {"plane": "gnfasudtlm"}), ("counts", ["gnfasudtlm", 3]),
+                           ("counts", {"plane": 7, "passenger_count": 3}),
+                           ("counts", {"plane": "gnfasudtlm", "passenger_count": True}),
+                           ("runways", {"plane": "gnfasudtlm", "runway": "qkegovbsbo", "arrive_at_time": "soon"})]:
+            with self.assertRaises(MessageError):
+                decode(kind, body)
+
+    def test_malformed_input_is_a_bad_request(self, mock_call_external_api):
+        c = Client()
+        arrival = {"plane": "gnfasudtlm", "gate": "jemhnkkldw", "arrive_at_time": "2019-11-01 12:00"}
+        for path, body in [('/atc/api/counts', '{"plane": '), ('/atc/api/counts', '{"plane": "gnfasudtlm"}'),
+                           ('/atc/api/counts', '{"plane": "nosuchplane", "passenger_count": 3}'),
+                           ('/atc/api/gates', json.dumps(dict(arrival, gate="nosuchgate"))),
+                           ('/atc/api/gates', json.dumps(dict(arrival, arrive_at_time=12))),
+                           ('/atc/api/runways', '[]'),
+                           ('/atc/api/headings', json.dumps({"plane": "gnfasudtlm", "direction": "north"})),
+                           ('/atc/api/headings/batch', json.dumps([{"plane": "gnfasudtlm"}]))]:
+            response = c.post(path, data=body, content_type="application/json")
+            self.assertEqual(response.status_code, 400, (path, body))
+        self.assertEqual(c.post('/atc/api/gates', data=json.dumps(arrival),
+                                content_type="application/json").status_code, 200)
+        self.assertEqual(Plane.objects.get(identifier="gnfasudtlm").gate.identifier, "jemhnkkldw")
+
+
+@patch("ATC2_0.views.send_warning", autospec=True)
+class PublishMetricsTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        airspace.clear()
+        geometry.clear()
+
+    def scrape(self):
+        response = Client().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return {(sample.name, tuple(sorted(sample.labels.items()))): sample.value
+                for family in text_string_to_metric_families(response.content.decode()) for sample in family.samples}
+
+    def test_stages_and_conflicts_on_metrics(self, mock_call_external_api):
+        take_off = timezone.localtime() - timedelta(minutes=10)
+        before = self.scrape()
+        for identifier, origin, destination in [("gnfasudtlm", "kkz", "xhz"), ("matxovlzow", "xhz", "kkz")]:
+            Client().post('/atc/api/headings', data=json.dumps({
+                "plane": identifier, "direction": 90, "speed": 500, "origin": origin, "destination": destination,
+                "take_off_time": take_off.strftime(TIME_FORMAT),
+                "landing_time": (take_off + timedelta(hours=1)).strftime(TIME_FORMAT)
+            }), content_type="application/json")
+        after = self.scrape()
+
+        def delta(name, **labels):
+            key = (name, tuple(sorted(labels.items())))
+            return after.get(key, 0) - before.get(key, 0)
+
+        for name in ["decode", "lookup", "save", "airport", "head_on", "behind", "crossing", "geometry", "warn"]:
+            self.assertEqual(delta("atc_publish_stage_latency_seconds_count", kind="headings", stage=name), 2, name)
+        self.assertEqual(delta("atc_conflicts_total", type="HEAD_ON"), 1)
+        self.assertEqual(delta("atc_conflict_candidates_count", check="head_on"), 2)
+        self.assertEqual(delta("atc_conflict_candidates_sum", check="head_on"), 1)
+        self.assertGreaterEqual(after[("atc_planes_in_flight", ())], 2)
+        self.assertEqual(after[("atc_planes_tracked", ())], Plane.objects.count())
+
+    def test_spot_conflicts_counted_per_conflicting_plane(self, mock_call_external_api):
+        arrive = timezone.localtime().strftime(TIME_FORMAT)
+        planes = Plane.objects.order_by("identifier")[:3]
+        before = self.scrape()
+        for plane in planes:
+            for end, spot, identifier in [("gates", "gate", Gate.objects.first().identifier),
+                                          ("runways", "runway", Runway.objects.first().identifier)]:
+                Client().post('/atc/api/' + end, data=json.dumps({
+                    "plane": plane.identifier, spot: identifier, "arrive_at_time": arrive
+                }), content_type="application/json")
+        after = self.scrape()
+        # the second plane conflicts with one plane, the third with two
+        for kind in ("DUPLICATE_GATE", "DUPLICATE_RUNWAY"):
+            key = ("atc_conflicts_total", (("type", kind),))
+            self.assertEqual(after.get(key, 0) - before.get(key, 0), 3, kind)
+
+
+class BulkLoadTests(TestCase):
+    def snapshot(self):
+        return {
+            "airports": set(Airport.objects.values_list("name", "x", "y")),
+            "airlines": set(Airline.objects.values_list("name", flat=True)),
+            "links": set(Airport.airlines.through.objects.values_list("airport__name", "airline__name")),
+            "gates": set(Gate.objects.values_list("identifier", "airport__name", "size")),
+            "runways": set(Runway.objects.values_list("identifier", "airport__name", "size")),
+            "planes": set(Plane.objects.values_list("identifier", "airline__name", "size", "currentPassengerCount",
+                                                    "maxPassengerCount")),
+        }
+
+    def datasets(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name in ["airport", "airline", "airport_airline", "gate", "runway", "plane"]:
+            with open(f"datasets/{name}.csv") as source, open(f"{directory.name}/{name}.csv", "w") as target:
+                target.write(source.read())
+        return directory.name
+
+    def test_matches_load_data(self):
+        management.call_command("load_data")
+        expected = self.snapshot()
+        for model in [Plane, Gate, Runway, Airport, Airline]:
+            model.objects.all().delete()
+        management.call_command("load_data", "--bulk", "--batch-size", "7")
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_refresh(self):
+        management.call_command("load_data")
+        Plane.objects.filter(identifier="gnfasudtlm").update(currentPassengerCount=42)
+        directory = self.datasets()
+        with open(f"{directory}/gate.csv", "a") as file:
+            file.write("newgatexyz,kkz,LARGE\n")
+        with open(f"{directory}/plane.csv") as file:
+            planes = file.read().replace("gnfasudtlm,dhrav,LARGE,498", "gnfasudtlm,dhrav,MEDIUM,300")
+        with open(f"{directory}/plane.csv", "w") as file:
+            file.write(planes)
+
+        management.call_command("load_data", "--bulk", "--directory", directory)
+        self.assertTrue(Gate.objects.filter(identifier="newgatexyz", airport__name="kkz").exists())
+        self.assertEqual(Plane.objects.get(identifier="gnfasudtlm").maxPassengerCount, 498)
+
+        management.call_command("load_data", "--upsert", "--directory", directory)
+        plane = Plane.objects.get(identifier="gnfasudtlm")
+        self.assertEqual((plane.size, plane.maxPassengerCount, plane.currentPassengerCount), ("MEDIUM", 300, 42))
+        self.assertEqual(Gate.objects.filter(identifier="newgatexyz").count(), 1)
+
+    def test_unknown_name_loads_nothing(self):
+        directory = self.datasets()
+        with open(f"{directory}/runway.csv", "a") as file:
+            file.write("newrunwayx,nowhere,LARGE\n")
+        with self.assertRaisesMessage(management.CommandError, "unknown airport 'nowhere'"):
+            management.call_command("load_data", "--bulk", "--directory", directory)
+        self.assertEqual(Airport.objects.count(), 0)
+
+
+class ScanConflictsTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        airspace.clear()
+        geometry.clear()
+
+    def fly(self, identifier, origin, destination, take_off, hours=1.0, speed=None):
+        plane = Plane.objects.get(identifier=identifier)
+        plane.take_off_airport = Airport.objects.get(name=origin)
+        plane.land_airport = Airport.objects.get(name=destination)
+        plane.speed = speed or calc_distance(plane.take_off_airport, plane.land_airport) / hours
+        plane.take_off_time = take_off
+        plane.landing_time = take_off + timedelta(hours=hours)
+        plane.save()
+        return plane
+
+    def scan(self):
+        out = StringIO()
+        management.call_command("scan_conflicts", "--json", stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_finds_each_kind(self):
+        take_off = datetime(2019, 11, 1, 12, 0)
+        self.fly("gnfasudtlm", "kkz", "xhz", take_off)
+        self.fly("matxovlzow", "xhz", "kkz", take_off)
+        self.fly("khnndacsrj", "kkz", "xhz", take_off, hours=2)
+        self.fly("mopyahgbal", "oap", "mfz", take_off)
+        self.fly("rzmwdhqblw", "kkz", "mfz", take_off)
+        report = self.scan()
+        conflicts = {tuple(conflict.values()) for conflict in report["conflicts"]}
+        self.assertIn(("HEAD_ON", "gnfasudtlm", "matxovlzow"), conflicts)
+        self.assertIn(("HEAD_ON", "khnndacsrj", "matxovlzow"), conflicts)
+        self.assertIn(("REAR", "gnfasudtlm", "khnndacsrj"), conflicts)
+        self.assertIn(("INTERSECTION", "mopyahgbal", "rzmwdhqblw"), conflicts)
+        self.assertEqual(report["counts"], {"HEAD_ON": 2, "REAR": 1, "INTERSECTION": len(conflicts) - 3})
+
+    def test_intersections_match_brute_force(self):
+        rng = random.Random(3)
+        airports = list(Airport.objects.values_list("name", flat=True))
+        take_off = datetime(2019, 11, 1, 12, 0)
+        for identifier in Plane.objects.values_list("identifier", flat=True):
+            origin, destination = rng.sample(airports, 2)
+            self.fly(identifier, origin, destination, take_off + timedelta(minutes=rng.randrange(0, 240, 3)),
+                     hours=rng.choice([1, 2, 3]))
+        conflicts = {(conflict["first"], conflict["second"]) for conflict in self.scan()["conflicts"]
+                     if conflict["kind"] == "INTERSECTION"}
+
+        planes = airspace.planes()
+        expected = set()
+        for plane in planes:
+            airborne = airspace.windows.overlapping(plane.take_off_time, plane.landing_time)
+            for other in airspace.crossing(plane):
+                if other.pk in airborne and (arrive_at_intersection_at_same_minute(plane, other) or
+                                             arrive_at_intersection_at_same_minute(other, plane)):
+                    expected.add(tuple(sorted((plane.identifier, other.identifier))))
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(conflicts, expected)
+
+    @patch("ATC2_0.management.commands.scan_conflicts.send_warning", autospec=True)
+    def test_send_warnings(self, mock_call_external_api):
+        take_off = datetime(2019, 11, 1, 12, 0)
+        self.fly("gnfasudtlm", "kkz", "xhz", take_off)
+        self.fly("matxovlzow", "xhz", "kkz", take_off)
+        management.call_command("scan_conflicts", "--send-warnings", stdout=StringIO())
+        self.assertEqual(sorted(call[0][0]["id"] for call in mock_call_external_api.call_args_list),
+                         ["gnfasudtlm", "matxovlzow"])
+
+    def test_check_airports(self):
+        rng = random.Random(3)
+        airports = list(Airport.objects.values_list("name", flat=True))
+        take_off = datetime(2019, 11, 1, 12, 0)
+        for identifier in Plane.objects.values_list("identifier", flat=True):
+            self.fly(identifier, *rng.sample(airports, 2), take_off)
+        out = StringIO()
+        management.call_command("scan_conflicts", "--json", "--check-airports", stdout=out)
+        expected = sorted(plane.identifier for plane in Plane.objects.exclude(landing_time=None)
+                          if plane.airline not in plane.land_airport.airlines.all())
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(json.loads(out.getvalue())["wrong_airport"], expected)
+
+
+class InlineExecutor(Executor):
+    """Runs the ingest server's database work in the test's thread, inside its transaction."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def ingest_request(path, body=b"", method="POST", *headers):
+    head = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(body)}"] + list(headers)
+    return ("\r\n".join(head) + "\r\n\r\n").encode() + body
+
+
+async def ingest_response(reader):
+    head = (await reader.readuntil(b"\r\n\r\n")).decode().split("\r\n")
+    headers = {name.lower(): value for name, value in (line.split(": ", 1) for line in head[1:] if line)}
+    body = await reader.readexactly(int(headers["content-length"]))
+    return int(head[0].split(" ")[1]), headers, body
+
+
+@patch("ATC2_0.views.send_warning", autospec=True)
+class IngestServerTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        airspace.clear()
+
+    def exchange(self, data, responses):
+        async def run():
+            server = await IngestServer("127.0.0.1", 0, workers=1, executor=InlineExecutor()).start()
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+            try:
+                writer.write(data)
+                answers = [await ingest_response(reader) for _ in range(responses)]
+                return answers, await reader.read()
+            finally:
+                writer.close()
+                await server.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+    def test_pipelined_requests_are_answered_in_order(self, mock_send_warning):
+        plane, gate = Plane.objects.first(), Gate.objects.first()
+        arrival = json.dumps({"plane": plane.identifier, "gate": gate.identifier,
+                              "arrive_at_time": timezone.localtime().strftime(TIME_FORMAT)}).encode()
+        data = b"".join([
+            ingest_request("/atc/api/gates", arrival),
+            ingest_request("/atc/api/counts", b"{not json"),
+            ingest_request("/atc/api/counts", json.dumps({"plane": "nobody", "passenger_count": 1}).encode()),
+            ingest_request("/atc/api/counts", method="GET"),
+            ingest_request("/atc/plane"),
+            ingest_request("/atc/api/counts", json.dumps({"plane": plane.identifier, "passenger_count": 1}).encode(),
+                           "POST", "Connection: close"),
+        ])
+        answers, rest = self.exchange(data, 6)
+        self.assertEqual([status for status, _, _ in answers], [200, 400, 400, 405, 404, 200])
+        self.assertIn(b"unknown plane", answers[2][2])
+        self.assertEqual(answers[3][1]["allow"], "POST")
+        self.assertEqual(answers[5][1]["connection"], "close")
+        # closed after the request asking for it
+        self.assertEqual(rest, b"")
+        self.assertEqual(Plane.objects.get(pk=plane.pk).gate_id, gate.pk)
+
+    def test_unreadable_requests_close_the_connection(self, mock_send_warning):
+        answers, rest = self.exchange(ingest_request("/atc/api/counts", b"", "POST", "Transfer-Encoding: chunked") +
+                                      ingest_request("/atc/api/counts"), 1)
+        self.assertEqual(answers[0][0], 411)
+        self.assertEqual(rest, b"")
+        answers, rest = self.exchange(b"nonsense\r\n\r\n", 1)
+        self.assertEqual(answers[0][0], 400)
+
+
+class MigrationTests(TransactionTestCase):
+    def test_migrate_from_an_empty_schema(self):
+        management.call_command("migrate", "ATC2_0", "zero", verbosity=0)
+        self.assertNotIn(OutboundWarning._meta.db_table, connection.introspection.table_names())
+        management.call_command("migrate", "ATC2_0", verbosity=0)
+        self.assertIn(OutboundWarning._meta.db_table, connection.introspection.table_names())
+        with override_settings(WARNING_WORKERS=0):
+            self.assertTrue(Outbox().enqueue({"error": "DUPLICATE_GATE", "id": "plane"}))
+        self.assertEqual(OutboundWarning.objects.count(), 1)
+
+    def test_models_match_the_migrations(self):
+        # exits with SystemExit when the models have changes no migration makes
+        management.call_command("makemigrations", "ATC2_0", check=True, dry_run=True, verbosity=0)
+
+    def test_plane_indexes_are_created(self):
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, Plane._meta.db_table)
+        for index in Plane._meta.indexes:
+            self.assertIn(index.name, indexes)
+
+
+class StandInReceiver(ThreadingMixIn, HTTPServer):
+    """Local stand-in for the error report, records what is posted and answers with `status`."""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.received = []
+        self.requests = 0
+        self.connections = set()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(handler):
+                body = json.loads(handler.rfile.read(int(handler.headers["Content-Length"])))
+                self.requests += 1
+                self.connections.add(handler.client_address)
+                if self.status < 400:
+                    self.received.extend(body if isinstance(body, list) else [body])
+                handler.send_response(self.status)
+                handler.send_header("Content-Length", "0")
+                handler.end_headers()
+
+            def log_message(handler, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/app/error_report"
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def warning_for(identifier):
+    return {"team_id": "test", "error": "COLLISION_IMMINENT", "obj_type": "PLANE", "id": identifier}
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.receiver = StandInReceiver()
+        self.settings = override_settings(ERROR_REPORT_URL=self.receiver.url, WARNING_WORKERS=0,
+                                          WARNING_BREAKER_THRESHOLD=2, WARNING_OUTBOX_SIZE=5)
+        self.settings.enable()
+        self.outbox = Outbox()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.outbox.reporter.close()
+        self.receiver.close()
+
+    def test_delivers_queued_warnings(self):
+        for identifier in ("p1", "p2", "p3"):
+            self.assertTrue(self.outbox.enqueue(warning_for(identifier)))
+        self.assertEqual(self.receiver.received, [])
+        self.assertEqual(self.outbox.depth, 3)
+
+        self.assertEqual(self.outbox.deliver_pending(), 3)
+        self.assertEqual(sorted(warning["id"] for warning in self.receiver.received), ["p1", "p2", "p3"])
+        self.assertEqual(OutboundWarning.objects.count(), 0)
+        self.assertEqual(self.outbox.depth, 0)
+
+    def test_bounded(self):
+        for identifier in range(5):
+            self.assertTrue(self.outbox.enqueue(warning_for(identifier)))
+        self.assertFalse(self.outbox.enqueue(warning_for("one too many")))
+        self.assertEqual(OutboundWarning.objects.count(), 5)
+
+    def test_retries_with_backoff_and_breaks(self):
+        self.receiver.status = 503
+        self.outbox.enqueue(warning_for("p1"))
+        self.outbox.enqueue(warning_for("p2"))
+        self.assertEqual(self.outbox.deliver_pending(), 2)
+        self.assertTrue(self.outbox.breaker.is_open)
+        warnings = list(OutboundWarning.objects.all())
+        self.assertEqual([warning.attempts for warning in warnings], [1, 1])
+        self.assertTrue(all(warning.next_attempt > timezone.now() for warning in warnings))
+        # nothing is due and the breaker is open
+        self.assertEqual(self.outbox.deliver_pending(), 0)
+
+        self.receiver.status = 200
+        OutboundWarning.objects.update(next_attempt=timezone.now())
+        self.outbox.breaker.opened_at -= self.outbox.breaker.cooldown
+        self.assertEqual(self.outbox.deliver_pending(), 2)
+        self.assertFalse(self.outbox.breaker.is_open)
+        self.assertEqual(len(self.receiver.received), 2)
+
+    def test_reuses_connections(self):
+        for identifier in range(5):
+            self.outbox.enqueue(warning_for(identifier))
+        self.outbox.deliver_pending()
+        self.assertEqual(self.receiver.requests, 5)
+        self.assertEqual(len(self.receiver.connections), 1)
+
+    @override_settings(ERROR_REPORT_BATCH_SIZE=2)
+    def test_batches_requests(self):
+        for identifier in range(5):
+            self.outbox.enqueue(warning_for(identifier))
+        self.assertEqual(self.outbox.deliver_pending(), 5)
+        self.assertEqual(self.receiver.requests, 3)
+        self.assertEqual(sorted(warning["id"] for warning in self.receiver.received), list(range(5)))
+
+    def test_drops_rejected(self):
+        self.receiver.status = 400
+        self.outbox.enqueue(warning_for("p1"))
+        self.outbox.deliver_pending()
+        self.assertEqual(OutboundWarning.objects.count(), 0)
+        self.assertFalse(self.outbox.breaker.is_open)
+
+
+class WarningCoalescerTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+
+    def test_ttl(self):
+        coalescer = WarningCoalescer(ttl=60, clock=lambda: self.now)
+        self.assertTrue(coalescer.should_send(warning_for("p1")))
+        self.assertFalse(coalescer.should_send(warning_for("p1")))
+        self.assertTrue(coalescer.should_send(warning_for("p2")))
+        self.assertTrue(coalescer.should_send(dict(warning_for("p1"), error="WRONG_AIRPORT")))
+        self.now = 59
+        self.assertFalse(coalescer.should_send(warning_for("p1")))
+        self.now = 61
+        self.assertTrue(coalescer.should_send(warning_for("p1")))
+
+    def test_once_per_publish(self):
+        coalescer = WarningCoalescer(ttl=0, clock=lambda: self.now)
+        self.assertTrue(coalescer.should_send(warning_for("p1")))
+        self.assertTrue(coalescer.should_send(warning_for("p1")))
+        with coalescer.publish():
+            self.assertTrue(coalescer.should_send(warning_for("p1")))
+            self.assertFalse(coalescer.should_send(warning_for("p1")))
+        with coalescer.publish():
+            self.assertTrue(coalescer.should_send(warning_for("p1")))
+
+    @patch("ATC2_0.helpers.outbox", autospec=True)
+    def test_collision_storm(self, mock_outbox):
+        management.call_command("load_data")
+        airspace.clear()
+        coalescer.clear()
+        c = Client()
+        take_off = datetime(2019, 11, 1, 12, 0)
+        for minutes, identifier in enumerate(Plane.objects.values_list("identifier", flat=True)[:10]):
+            # every plane lands before the ones already on the route, so each publish warns all of them again
+            c.post('/atc/api/headings', data=json.dumps({
+                "plane": identifier,
+                "direction": 90,
+                "speed": 500,
+                "origin": "xwc",
+                "destination": "xhz",
+                "take_off_time": take_off.strftime(TIME_FORMAT),
+                "landing_time": (take_off + timedelta(hours=1, minutes=-minutes)).strftime(TIME_FORMAT)
+            }), content_type="application/json")
+        sent = [call[0][0] for call in mock_outbox.enqueue.call_args_list]
+        self.assertEqual(len(sent), len({tuple(warning.values()) for warning in sent}))
+        self.assertEqual(len([warning for warning in sent if warning["error"] == "COLLISION_IMMINENT"]), 10)
+
+
+class FakeConsumer:
+    """In-memory stand-in for KafkaConsumer, hands out `records` `max_records` at a time."""
+
+    def __init__(self, records, stop=None):
+        self.records = [SimpleNamespace(topic=topic, partition=0, offset=offset, value=json.dumps(value).encode())
+                        for offset, (topic, value) in enumerate(records)]
+        self.stop = stop
+        self.position = 0
+        self.commits = []
+        self.closed = False
+
+    def poll(self, timeout_ms=0, max_records=None):
+        if self.position >= len(self.records) and self.stop is not None:
+            self.stop.set()
+        batch = self.records[self.position:self.position + max_records]
+        self.position += len(batch)
+        return {("fake", 0): batch} if batch else {}
+
+    def commit(self):
+        self.commits.append(self.position)
+
+    def close(self, autocommit=True):
+        self.closed = True
+
+
+@patch("ATC2_0.views.send_warning", autospec=True)
+class ProcessKafkaTests(TestCase):
+    kinds = {"counts": "counts", "headings": "headings", "gates": "gates", "runways": "runways"}
+
+    def setUp(self):
+        management.call_command("load_data")
+        airspace.clear()
+        coalescer.clear()
+        self.plane = Plane.objects.order_by("identifier").first()
+        self.gate = Gate.objects.exclude(pk=self.plane.gate_id).first()
+
+    def test_dispatches_to_views(self, mock_call_external_api):
+        stop = Event()
+        consumer = FakeConsumer([
+            ("counts", {"plane": self.plane.identifier, "passenger_count": self.plane.maxPassengerCount + 1}),
+            ("gates", {"plane": self.plane.identifier, "gate": self.gate.identifier}),
+        ], stop)
+        self.assertEqual(consume(consumer, self.kinds, 10, 0, stop), 2)
+        self.assertEqual(mock_call_external_api.call_args[0][0]["error"], "TOO_MANY_PASSENGERS")
+        self.assertEqual(Plane.objects.get(pk=self.plane.pk).gate_id, self.gate.pk)
+
+    def test_commits_after_processing(self, mock_call_external_api):
+        gates = list(Gate.objects.order_by("id").values_list("identifier", flat=True)[:5])
+        committed = []
+        consumer = FakeConsumer([("gates", {"plane": self.plane.identifier, "gate": gate}) for gate in gates])
+        consumer.commit = lambda: committed.append(Plane.objects.get(pk=self.plane.pk).gate.identifier)
+        consume(consumer, self.kinds, 2, 0, Event(), max_batches=3)
+        # each commit happens once the batch's writes are in the database
+        self.assertEqual(committed, [gates[1], gates[3], gates[4]])
+
+    def test_skips_bad_messages(self, mock_call_external_api):
+        stop = Event()
+        consumer = FakeConsumer([("gates", {"plane": "no such plane", "gate": self.gate.identifier}),
+                                 ("gates", {"plane": self.plane.identifier, "gate": self.gate.identifier})], stop)
+        consumer.records[0].value = b"not json"
+        consume(consumer, self.kinds, 10, 0, stop)
+        self.assertEqual(consumer.commits, [2])
+        self.assertEqual(Plane.objects.get(pk=self.plane.pk).gate_id, self.gate.pk)
+
+    def test_no_commit_when_flush_fails(self, mock_call_external_api):
+        consumer = FakeConsumer([("gates", {"plane": self.plane.identifier, "gate": self.gate.identifier})])
+        with patch.object(airspace, "_flush", side_effect=RuntimeError("database went away")):
+            with self.assertRaises(RuntimeError):
+                consume(consumer, self.kinds, 10, 0, Event())
+        self.assertEqual(consumer.commits, [])
+
+    @override_settings(WARNING_WORKERS=0)
+    def test_warnings_queued_only_once_flushed(self, mock_call_external_api):
+        mock_call_external_api.side_effect = send_warning
+        too_many = {"plane": self.plane.identifier, "passenger_count": self.plane.maxPassengerCount + 1}
+        consumer = FakeConsumer([("counts", too_many), ("gates", {"plane": self.plane.identifier,
+                                                                 "gate": self.gate.identifier})])
+        with patch.object(airspace, "_flush", side_effect=RuntimeError("database went away")):
+            with self.assertRaises(RuntimeError):
+                consume(consumer, self.kinds, 10, 0, Event())
+        mock_call_external_api.assert_called()
+        self.assertFalse(OutboundWarning.objects.exists())
+
+        # delivered again, as after a restart
+        coalescer.clear()
+        consumer = FakeConsumer([("counts", too_many)])
+        consume(consumer, self.kinds, 10, 0, Event(), max_batches=1)
+        self.assertEqual([json.loads(warning.payload)["error"] for warning in OutboundWarning.objects.all()],
+                         ["TOO_MANY_PASSENGERS"])
+
+    def test_command_closes_consumer(self, mock_call_external_api):
+        consumer = FakeConsumer([("gates", {"plane": self.plane.identifier, "gate": self.gate.identifier})])
+        out = StringIO()
+        with patch("ATC2_0.management.commands.process_kafka.make_consumer", return_value=consumer):
+            management.call_command("process_kafka", "--max-batches", "1", stdout=out)
+        self.assertTrue(consumer.closed)
+        self.assertEqual(consumer.commits, [1])
+        self.assertIn("processed 1 messages", out.getvalue())
+
+
+@patch("ATC2_0.views.send_warning", autospec=True)
+class ProcessorTests(TestCase):
+    def setUp(self):
+        management.call_command("load_data")
+        airspace.clear()
+        coalescer.clear()
+        self.planes = list(Plane.objects.order_by("identifier")[:2])
+        self.gates = list(Gate.objects.order_by("identifier")[:2])
+
+    def gate_message(self, plane, gate):
+        return Message("gates", {"plane": plane.identifier, "gate": gate.identifier})
+
+    def test_partition_keeps_a_plane_together(self, mock_call_external_api):
+        identifiers = Plane.objects.values_list("identifier", flat=True)
+        partitions = {partition(Message("counts", {"plane": identifier}), 4) for identifier in identifiers}
+        self.assertEqual(partitions, {0, 1, 2, 3})
+        for identifier in identifiers[:10]:
+            self.assertEqual(partition(Message("gates", {"plane": identifier}), 4),
+                             partition(Message("headings", {"plane": identifier}), 4))
+
+    def test_sources(self, mock_call_external_api):
+        lines = ['{"kind": "counts", "body": {"plane": "a"}}', "", "not json", '{"body": {}}',
+                 b'{"kind": "gates", "body": {"plane": "b"}}']
+        self.assertEqual(list(jsonl_source(lines)),
+                         [Message("counts", {"plane": "a"}), Message("gates", {"plane": "b"})])
+        inbox = queue.Queue()
+        for item in (("counts", {"plane": "a"}), Message("gates", {}), None, ("counts", {})):
+            inbox.put(item)
+        self.assertEqual(list(queue_source(inbox)), [Message("counts", {"plane": "a"}), Message("gates", {})])
+
+    def test_ingest_matches_http(self, mock_call_external_api):
+        plane, other = self.planes
+        messages = [self.gate_message(plane, self.gates[0]),
+                    Message("counts", {"plane": other.identifier, "passenger_count": other.maxPassengerCount + 1}),
+                    Message("nope", {}),
+                    self.gate_message(other, self.gates[1])]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as file:
+            file.writelines(json.dumps(message._asdict()) + "\n" for message in messages)
+            file.flush()
+            out = StringIO()
+            management.call_command("ingest", file.name, stdout=out)
+        self.assertIn("processed 3 messages, skipped 1", out.getvalue())
+        self.assertEqual(mock_call_external_api.call_args[0][0]["error"], "TOO_MANY_PASSENGERS")
+        self.assertEqual(Plane.objects.get(pk=plane.pk).gate_id, self.gates[0].pk)
+        self.assertEqual(Plane.objects.get(pk=other.pk).gate_id, self.gates[1].pk)
+
+    def test_worker_syncs_peers(self, mock_call_external_api):
+        plane, other = self.planes
+        inbox, peer, results = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Queue()
+        other_fields = {field: getattr(airspace.plane(other.identifier), field) for field in PLANE_FIELDS}
+        other_fields["gate_id"] = self.gates[1].pk
+        for item in (self.gate_message(plane, self.gates[0]), Sync([(other.pk, other_fields)]), None):
+            inbox.put(item)
+        work(inbox, [peer], results, 10)
+
+        self.assertEqual(results.get(timeout=5), {"processed": 1})
+        # the synced plane is applied to the store but left to its own worker to write
+        self.assertEqual(airspace.plane(other.identifier).gate_id, self.gates[1].pk)
+        self.assertNotEqual(Plane.objects.get(pk=other.pk).gate_id, self.gates[1].pk)
+        sync = peer.get(timeout=5)
+        self.assertEqual([(pk, fields["gate_id"]) for pk, fields in sync.planes], [(plane.pk, self.gates[0].pk)])
+
+
+class TrafficRecorderTests(TestCase):
+    def test_records_publish_endpoints(self):
+        management.call_command("load_data")
+        airspace.clear()
+        with tempfile.NamedTemporaryFile("r", suffix=".jsonl") as capture:
+            with override_settings(TRAFFIC_RECORD_PATH=capture.name), \
+                    patch("ATC2_0.views.send_warning", autospec=True):
+                c = Client()
+                c.post('/atc/api/counts', data=json.dumps({"plane": "khnndacsrj", "passenger_count": 1}),
+                       content_type="application/json")
+                c.get('/atc/api/nope')
+                c.post('/atc/api/headings/batch', data="[]", content_type="application/json")
+            entries = list(read_capture(capture))
+        self.assertEqual([(kind, body) for _, kind, body in entries],
+                         [("counts", {"plane": "khnndacsrj", "passenger_count": 1})])
+        self.assertIsInstance(entries[0][0], float)
+
+    def test_not_installed_by_default(self):
+        with override_settings(TRAFFIC_RECORD_PATH=None), patch("ATC2_0.traffic.TrafficRecorder") as recorder:
+            Client().get('/login')
+        recorder.assert_not_called()
+
+
+class StandInInstance(ThreadingMixIn, HTTPServer):
+    """Local stand-in for a running instance, records what is posted where and counts every counts message as a
+    queued warning on /metrics."""
+
+    def __init__(self):
+        self.posted = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(handler):
+                body = json.loads(handler.rfile.read(int(handler.headers["Content-Length"])))
+                self.posted.append((handler.path, body))
+                self.respond(handler, b"")
+
+            def do_GET(handler):
+                queued = len([path for path, _ in self.posted if path == "/atc/api/counts"])
+                self.respond(handler, f'atc_warnings_total{{outcome="queued"}} {queued}\n'.encode())
+
+            def log_message(handler, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def respond(handler, content):
+        handler.send_response(200)
+        handler.send_header("Content-Length", str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ReplayTests(TestCase):
+    def test_seed_scenarios_warn(self):
+        management.call_command("load_data")
+        airspace.clear()
+        geometry.clear()
+        coalescer.clear()
+        with tempfile.NamedTemporaryFile("r", suffix=".jsonl") as capture, \
+                patch("ATC2_0.views.send_warning", autospec=True) as mock_call_external_api:
+            seed_capture(capture.name, count=0)
+            management.call_command("ingest", capture.name, stdout=StringIO())
+        errors = {warning[0][0]["error"] for warning in mock_call_external_api.call_args_list}
+        self.assertEqual(errors, {"COLLISION_IMMINENT", "DUPLICATE_GATE", "DUPLICATE_RUNWAY", "TOO_SMALL_GATE",
+                                  "TOO_SMALL_RUNWAY", "TOO_MANY_PASSENGERS", "WRONG_AIRPORT"})
+
+    def test_replay(self):
+        instance = StandInInstance()
+        self.addCleanup(instance.close)
+        with tempfile.NamedTemporaryFile("r", suffix=".jsonl") as capture:
+            written = seed_capture(capture.name, count=200, rate=2000)
+            entries = list(read_capture(capture))
+        self.assertEqual(len(entries), written)
+
+        report = Replayer(instance.url, speed=0, concurrency=4).run(entries)
+        self.assertEqual(report["requests"], written)
+        self.assertEqual(sorted(instance.posted, key=json.dumps),
+                         sorted(((ENDPOINTS[kind], body) for _, kind, body in entries), key=json.dumps))
+        self.assertEqual(set(report["endpoints"]), {"counts", "headings", "gates", "runways"})
+        for endpoint in report["endpoints"].values():
+            self.assertEqual(endpoint["errors"], 0)
+            self.assertLessEqual(endpoint["p50"], endpoint["p95"])
+            self.assertLessEqual(endpoint["p95"], endpoint["p99"])
+        self.assertEqual(report["warnings"], {"queued": report["endpoints"]["counts"]["requests"]})
+
+    def test_paced_replay(self):
+        instance = StandInInstance()
+        self.addCleanup(instance.close)
+        entries = [(at, "counts", {"plane": "p", "passenger_count": 1}) for at in (100.0, 100.2, 100.4)]
+        report = Replayer(instance.url, speed=2).run(entries)
+        # 0.4s of recorded traffic at twice the pace
+        self.assertGreaterEqual(report["seconds"], .2)
+        self.assertLess(report["seconds"], .4)
+
+
+class BenchmarkQueriesTests(TestCase):
+    def test_reports_and_rolls_back(self):
+        management.call_command("load_data")
+        planes = Plane.objects.count()
+        out = StringIO()
+        management.call_command("benchmark_queries", planes=400, samples=3, repeat=1, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report), {"without", "with"})
+        self.assertEqual(set(report["with"]), {"head_on", "behind", "crossing", "gate", "runway"})
+        self.assertIn("plane_route_landing_idx", report["with"]["head_on"]["plan"])
+        self.assertNotIn("plane_route_landing_idx", report["without"]["head_on"]["plan"])
+
+        self.assertEqual(Plane.objects.count(), planes)
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Plane._meta.db_table)
+        self.assertTrue({index.name for index in Plane._meta.indexes} <= set(constraints))
+
+
+class SyntheticAirspaceTests(TestCase):
+    def generate(self, conflict_rate):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        out = StringIO()
+        management.call_command("generate_airspace", directory.name, "--start", "2019-11-01 00:00", airports=40,
+                                airlines=6, planes=600, messages=400, conflict_rate=conflict_rate, stdout=out)
+        management.call_command("load_data", "--bulk", "--directory", directory.name)
+        airspace.clear()
+        geometry.clear()
+        coalescer.clear()
+        with patch("ATC2_0.views.send_warning", autospec=True) as mock_call_external_api:
+            management.call_command("ingest", f"{directory.name}/messages.jsonl", stdout=StringIO())
+        return out.getvalue(), {warning[0][0]["error"] for warning in mock_call_external_api.call_args_list}
+
+    def test_datasets_load(self):
+        synthetic = SyntheticAirspace(airports=40, airlines=6, planes=600)
+        self.assertEqual(len(set(zip(synthetic.x, synthetic.y))), 40)
+        self.assertTrue(all(synthetic.served))
+        out, _ = self.generate(0)
+        self.assertIn("wrote 40 airports, 6 airlines, 320 gates, 120 runways and 600 planes", out)
+        self.assertEqual((Airport.objects.count(), Gate.objects.count(), Plane.objects.count()), (40, 320, 600))
+
+    def test_conflict_rate(self):
+        _, errors = self.generate(0)
+        # crossing routes are left to chance
+        self.assertLessEqual(errors, {"COLLISION_IMMINENT"})
+        Plane.objects.all().delete()
+        out, errors = self.generate(0.2)
+        self.assertEqual(errors, {"COLLISION_IMMINENT", "WRONG_AIRPORT", "DUPLICATE_GATE", "DUPLICATE_RUNWAY",
+                                  "TOO_MANY_PASSENGERS"})
+        for kind in CONFLICTS:
+            self.assertIn(f"{kind}: ", out)
+
+    def test_rear_conflicts_warn_for_both_planes(self):
+        synthetic = SyntheticAirspace(airports=40, airlines=6, planes=600)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        synthetic.write_datasets(directory.name)
+        management.call_command("load_data", "--bulk", "--directory", directory.name)
+        airspace.clear()
+        geometry.clear()
+        stream = synthetic.stream(datetime(2019, 11, 1))
+        pairs = [pair for pair in (stream.rear() for _ in range(30)) if pair is not None]
+        self.assertGreater(len(pairs), 20)
+        for pair in pairs:
+            coalescer.clear()
+            with patch("ATC2_0.views.send_warning", autospec=True) as mock_call_external_api:
+                for kind, body in pair:
+                    self.assertTrue(process(Message(kind, body)))
+            warned = {call[0][0]["id"] for call in mock_call_external_api.call_args_list
+                      if call[0][0]["error"] == "COLLISION_IMMINENT"}
+            self.assertLessEqual({body["plane"] for _, body in pair}, warned)
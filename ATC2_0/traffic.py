@@ -0,0 +1,264 @@
+import csv
+import json
+import random
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from math import ceil
+from time import monotonic, sleep, time
+
+import requests
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from prometheus_client.parser import text_string_to_metric_families
+
+from .helpers import calc_distance, calc_heading
+
+ENDPOINTS = {
+    "counts": "/atc/api/counts",
+    "headings": "/atc/api/headings",
+    "gates": "/atc/api/gates",
+    "runways": "/atc/api/runways",
+}
+KINDS = {path: kind for kind, path in ENDPOINTS.items()}
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+# capture files are JSONL of {"at": unix time, "kind": ..., "body": ...}, which processor.jsonl_source reads as is
+
+class TrafficRecorder:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, kind, body, at=None):
+        line = json.dumps({"at": time() if at is None else at, "kind": kind, "body": body})
+        with self._lock, open(self.path, "a") as file:
+            file.write(line + "\n")
+
+
+class TrafficRecorderMiddleware:
+    """Appends every body posted to the four publish endpoints to TRAFFIC_RECORD_PATH, when that is set."""
+
+    def __init__(self, get_response):
+        path = getattr(settings, "TRAFFIC_RECORD_PATH", None)
+        if not path:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.recorder = TrafficRecorder(path)
+
+    def __call__(self, request):
+        kind = KINDS.get(request.path)
+        if kind is not None and request.method == "POST":
+            try:
+                body = json.loads(request.body)
+            except ValueError:
+                body = request.body.decode(errors="replace")
+            self.recorder.record(kind, body)
+        return self.get_response(request)
+
+
+def read_capture(lines):
+    """(at, kind, body) for every line of a capture, `at` being None where it was not recorded."""
+    for line in lines:
+        if line.strip():
+            entry = json.loads(line)
+            yield entry.get("at"), entry["kind"], entry["body"]
+
+
+# seed traffic from the datasets/ CSVs, the scenarios SimulationTests covers plus background traffic
+
+def _read(name):
+    with open(f"datasets/{name}.csv") as file:
+        return list(csv.DictReader(file))
+
+
+class _Airport:
+    def __init__(self, row):
+        self.name = row["name"]
+        self.x = float(row["x"])
+        self.y = float(row["y"])
+
+
+def _heading(plane, origin, destination, take_off, hours=1.0, slowdown=1.0):
+    return "headings", {
+        "plane": plane,
+        "direction": calc_heading(origin, destination),
+        "speed": calc_distance(origin, destination) / hours / slowdown,
+        "origin": origin.name,
+        "destination": destination.name,
+        "take_off_time": take_off.strftime(TIME_FORMAT),
+        "landing_time": (take_off + timedelta(hours=hours * slowdown)).strftime(TIME_FORMAT)
+    }
+
+
+def scenario_messages(start):
+    """The messages of every SimulationTests scenario, each of which produces at least one warning."""
+    airports = {row["name"]: _Airport(row) for row in _read("airport")}
+    arrival = (start + timedelta(hours=1)).strftime(TIME_FORMAT)
+    return [
+        # head on
+        _heading("gnfasudtlm", airports["kkz"], airports["xhz"], start),
+        _heading("matxovlzow", airports["xhz"], airports["kkz"], start),
+        # rear
+        _heading("gnfasudtlm", airports["kkz"], airports["xhz"], start - timedelta(hours=1), slowdown=2.5),
+        _heading("matxovlzow", airports["kkz"], airports["xhz"], start),
+        # t-bone
+        _heading("gnfasudtlm", airports["oap"], airports["mfz"], start),
+        _heading("matxovlzow", airports["kkz"], airports["mfz"], start),
+        # duplicate gate and runway
+        ("gates", {"plane": "mopyahgbal", "gate": "jemhnkkldw", "arrive_at_time": arrival}),
+        ("gates", {"plane": "rzmwdhqblw", "gate": "jemhnkkldw", "arrive_at_time": arrival}),
+        ("runways", {"plane": "mopyahgbal", "runway": "qkegovbsbo", "arrive_at_time": arrival}),
+        ("runways", {"plane": "rzmwdhqblw", "runway": "qkegovbsbo", "arrive_at_time": arrival}),
+        # too small gate and runway, too many passengers
+        ("gates", {"plane": "khnndacsrj", "gate": "poyktqlblw", "arrive_at_time": arrival}),
+        ("runways", {"plane": "khnndacsrj", "runway": "iagriywrss", "arrive_at_time": arrival}),
+        ("counts", {"plane": "khnndacsrj", "passenger_count": 500}),
+    ]
+
+
+def background_messages(start, count, rng):
+    """`count` plausible messages for random planes in the datasets: flights, gate and runway arrivals and
+    passenger counts."""
+    airports = [_Airport(row) for row in _read("airport")]
+    planes = _read("plane")
+    gates = _read("gate")
+    runways = _read("runway")
+    messages = []
+    for _ in range(count):
+        plane = rng.choice(planes)
+        when = start + timedelta(minutes=rng.randrange(0, 24 * 60))
+        roll = rng.random()
+        if roll < .55:
+            origin, destination = rng.sample(airports, 2)
+            messages.append(_heading(plane["id"], origin, destination, when, hours=rng.choice([1, 1.5, 2, 3])))
+        elif roll < .7:
+            messages.append(("gates", {"plane": plane["id"], "gate": rng.choice(gates)["id"],
+                                       "arrive_at_time": when.strftime(TIME_FORMAT)}))
+        elif roll < .85:
+            messages.append(("runways", {"plane": plane["id"], "runway": rng.choice(runways)["id"],
+                                         "arrive_at_time": when.strftime(TIME_FORMAT)}))
+        else:
+            messages.append(("counts", {"plane": plane["id"],
+                                        "passenger_count": rng.randrange(0, int(plane["maxPassenger"]) + 50)}))
+    return messages
+
+
+def seed_capture(path, count=1000, rate=50.0, seed=0, start=None):
+    """Writes the SimulationTests scenarios followed by `count` background messages, `rate` a second."""
+    start = start or datetime.now().replace(second=0, microsecond=0)
+    rng = random.Random(seed)
+    messages = scenario_messages(start) + background_messages(start, count, rng)
+    recorder = TrafficRecorder(path)
+    for index, (kind, body) in enumerate(messages):
+        recorder.record(kind, body, at=index / rate)
+    return len(messages)
+
+
+# replay
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[max(ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def warning_counts(base_url, session):
+    """atc_warnings_total by outcome as scraped from /metrics, or None if it is not exposed."""
+    try:
+        response = session.get(base_url + "/metrics", timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    counts = defaultdict(float)
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            if sample.name == "atc_warnings_total":
+                counts[sample.labels["outcome"]] += sample.value
+    return counts
+
+
+class Replayer:
+    """Posts a capture to a running instance.
+
+    speed is a multiple of the recorded pace, 0 sends as fast as possible. At most `concurrency` requests are in
+    flight, so with a concurrency above 1 messages for the same plane may overtake each other, as they can in
+    production.
+    """
+
+    def __init__(self, base_url, speed=1.0, concurrency=1, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.speed = speed
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._sessions = threading.local()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    @property
+    def session(self):
+        session = getattr(self._sessions, "session", None)
+        if session is None:
+            session = self._sessions.session = requests.Session()
+        return session
+
+    def send(self, kind, body):
+        started = monotonic()
+        try:
+            response = self.session.post(self.base_url + ENDPOINTS[kind], data=json.dumps(body),
+                                         headers={"Content-Type": "application/json"}, timeout=self.timeout)
+            failed = response.status_code >= 400
+        except requests.RequestException:
+            failed = True
+        finally:
+            self._slots.release()
+        with self._lock:
+            self.latencies[kind].append(monotonic() - started)
+            if failed:
+                self.errors[kind] += 1
+
+    def run(self, capture):
+        before = warning_counts(self.base_url, self.session)
+        started = monotonic()
+        first = None
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for at, kind, body in capture:
+                if self.speed > 0 and at is not None:
+                    first = at if first is None else first
+                    delay = started + (at - first) / self.speed - monotonic()
+                    if delay > 0:
+                        sleep(delay)
+                self._slots.acquire()
+                executor.submit(self.send, kind, body)
+        elapsed = monotonic() - started
+        after = warning_counts(self.base_url, self.session)
+        return self.report(elapsed, before, after)
+
+    def report(self, elapsed, before, after):
+        endpoints = {}
+        for kind, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            endpoints[kind] = {
+                "requests": len(ordered),
+                "errors": self.errors[kind],
+                "throughput": len(ordered) / elapsed if elapsed else None,
+                "p50": percentile(ordered, .5),
+                "p95": percentile(ordered, .95),
+                "p99": percentile(ordered, .99),
+            }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        warnings = None
+        if before is not None and after is not None:
+            warnings = {outcome: after[outcome] - before.get(outcome, 0) for outcome in after
+                        if after[outcome] - before.get(outcome, 0)}
+        return {
+            "requests": total,
+            "seconds": elapsed,
+            "throughput": total / elapsed if elapsed else None,
+            "endpoints": endpoints,
+            "warnings": warnings,
+        }
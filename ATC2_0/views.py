@@ -1,12 +1,13 @@
-from django.db.models import Q
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
-from datetime import datetime, timedelta
-from .models import Plane, Gate, Runway, Airport
-from dateutil import parser
-from .helpers import check_size, arrive_at_intersection_at_same_minute, check_time_delta, send_warning
-import json
+from datetime import timedelta
+from . import metrics
+from .helpers import check_size, send_warning
+from .conflicts import RouteBatch, tbone_conflicts
+from .airspace import airspace, pk_of
+from .coalescer import one_publish
+from .messages import MessageError, decode, loads
 
 TEAM_ID = "nSLIoq2eIYMNExLYNALS"  # actual ID: nSLIoq2eIYMNExLYNALS
 
@@ -15,34 +16,66 @@ def index(request):
     return render(request, 'index.html', {})
 
 
+def stage(kind, name):
+    """Times the block as `name` in atc_publish_stage_latency_seconds."""
+    return metrics.PUBLISH_STAGE_LATENCY.labels(kind, name).time()
+
+
+def handle_publish(request, kind):
+    try:
+        with stage(kind, "decode"):
+            message = decode(kind, loads(request.body))
+        airspace.sync()
+        PUBLISHERS[kind](message)
+    except MessageError as error:
+        return HttpResponseBadRequest(str(error))
+    return HttpResponse()
+
+
+def known(record, kind, identifier):
+    if record is None:
+        raise MessageError(f"unknown {kind} {identifier!r}")
+    return record
+
+
 @csrf_exempt
 def handle_passenger_count(request):
-    body = json.loads(request.body)
-    print(body)
-    plane = Plane.objects.filter(identifier=body["plane"]).first()
-    if plane.maxPassengerCount < int(body["passenger_count"]):
+    return handle_publish(request, "counts")
+
+
+@one_publish
+def publish_passenger_count(message):
+    with stage("counts", "lookup"):
+        plane = known(airspace.plane(message.plane), "plane", message.plane)
+    if plane.maxPassengerCount < message.passenger_count:
+        metrics.CONFLICTS.labels("TOO_MANY_PASSENGERS").inc()
         send_warning({
             "team_id": TEAM_ID,
             "error": "TOO_MANY_PASSENGERS",
             "obj_type": "PLANE",
             "id": plane.identifier
         })
-    return HttpResponse()
 
 
-def check_gate(plane, gate, body):
+def check_gate(plane, gate, arrive_at_time):
     if not check_size(plane.size, gate.size):
+        metrics.CONFLICTS.labels("TOO_SMALL_GATE").inc()
         send_warning({
             "team_id": TEAM_ID,
             "error": "TOO_SMALL_GATE",
             "obj_type": "PLANE",
             "id": plane.identifier
         })
-    date = parser.parse(body["arrive_at_time"])
-    plane.arrive_at_gate_time = date
-    plane.save()
-    if gate.plane_set.filter(Q(arrive_at_gate_time=date) | Q(arrive_at_runway_time=None)).count() > 1:
-        for plane in gate.plane_set.filter(Q(arrive_at_gate_time=date) | Q(arrive_at_runway_time=None)).all():
+    with stage("gates", "save"):
+        airspace.save_plane(plane, gate_id=gate.pk, arrive_at_gate_time=arrive_at_time)
+    # planes arriving at the same time and those still at the gate, from the gate's occupancy timeline
+    with stage("gates", "duplicate"):
+        at_gate = airspace.gate_conflicts(plane)
+    metrics.CONFLICT_CANDIDATES.labels("gate").observe(len(at_gate))
+    if len(at_gate) > 1:
+        # one per plane the publishing plane conflicts with, as for the heading checks
+        metrics.CONFLICTS.labels("DUPLICATE_GATE").inc(len(at_gate) - 1)
+        for plane in at_gate:
             send_warning({
                 "team_id": TEAM_ID,
                 "error": "DUPLICATE_GATE",
@@ -53,46 +86,48 @@ def check_gate(plane, gate, body):
 
 @csrf_exempt
 def handle_gate_publish(request):
-    body = json.loads(request.body)
-    print(body)
-    plane = Plane.objects.filter(identifier=body["plane"]).first()
-    gate = Gate.objects.filter(identifier=body["gate"]).first()
-    plane.gate = gate
-    if "arrive_at_time" in body:
-        check_gate(plane, gate, body)
+    return handle_publish(request, "gates")
+
+
+@one_publish
+def publish_gate(message):
+    with stage("gates", "lookup"):
+        plane = known(airspace.plane(message.plane), "plane", message.plane)
+        gate = airspace.gate(message.gate)
+    if message.arrive_at_time is not None:
+        check_gate(plane, known(gate, "gate", message.gate), message.arrive_at_time)
     else:
-        plane.arrive_at_gate_time = None
-        plane.runway = None
-    plane.save()
-    return HttpResponse()
+        with stage("gates", "save"):
+            airspace.save_plane(plane, gate_id=pk_of(gate), arrive_at_gate_time=None, runway_id=None)
 
 
-def check_runway(plane, runway, body):
+def check_runway(plane, runway, arrive_at_time):
     if not check_size(plane.size, runway.size):
+        metrics.CONFLICTS.labels("TOO_SMALL_RUNWAY").inc()
         send_warning({
             "team_id": TEAM_ID,
             "error": "TOO_SMALL_RUNWAY",
             "obj_type": "PLANE",
             "id": plane.identifier
         })
-    date = parser.parse(body["arrive_at_time"])
-    plane.arrive_at_runway_time = date
-    plane.save()
+    with stage("runways", "save"):
+        airspace.save_plane(plane, runway_id=runway.pk, arrive_at_runway_time=arrive_at_time)
     yup_collide = False
-    if runway.plane_set.count() > 1:
-        for other_plane in runway.plane_set.all():
-            if plane != other_plane and check_time_delta(plane.arrive_at_runway_time,
-                                                         other_plane.arrive_at_runway_time, timedelta(minutes=1)):
-                yup_collide = True
-                print("HERE")
-                send_warning({
-                    "team_id": TEAM_ID,
-                    "error": "DUPLICATE_RUNWAY",
-                    "obj_type": "PLANE",
-                    "id": other_plane.identifier
-                })
+    # only the planes due within a minute either side, found in the runway's time-ordered slots
+    with stage("runways", "duplicate"):
+        neighbours = airspace.runway_neighbours(plane, timedelta(minutes=1))
+    metrics.CONFLICT_CANDIDATES.labels("runway").observe(len(neighbours))
+    if neighbours:
+        metrics.CONFLICTS.labels("DUPLICATE_RUNWAY").inc(len(neighbours))
+    for other_plane in neighbours:
+        yup_collide = True
+        send_warning({
+            "team_id": TEAM_ID,
+            "error": "DUPLICATE_RUNWAY",
+            "obj_type": "PLANE",
+            "id": other_plane.identifier
+        })
     if yup_collide:
-        print("HERE")
         send_warning({
             "team_id": TEAM_ID,
             "error": "DUPLICATE_RUNWAY",
@@ -103,28 +138,33 @@ def check_runway(plane, runway, body):
 
 @csrf_exempt
 def handle_runway_publish(request):
-    body = json.loads(request.body)
-    print(body)
-    plane = Plane.objects.filter(identifier=body["plane"]).first()
-    runway = Runway.objects.filter(identifier=body["runway"]).first()
-    plane.runway = runway
-    if "arrive_at_time" in body:
-        check_runway(plane, runway, body)
+    return handle_publish(request, "runways")
+
+
+@one_publish
+def publish_runway(message):
+    with stage("runways", "lookup"):
+        plane = known(airspace.plane(message.plane), "plane", message.plane)
+        runway = airspace.runway(message.runway)
+    if message.arrive_at_time is not None:
+        check_runway(plane, known(runway, "runway", message.runway), message.arrive_at_time)
     else:
-        plane.arrive_at_runway_time = None
-        plane.gate = None
-        plane.heading = 0
-        plane.speed = 0
-        plane.take_off_airport = plane.land_airport
-        plane.land_airport = None
-        plane.take_off_time = None
-        plane.landing_time = None
-    plane.save()
-    return HttpResponse()
+        with stage("runways", "save"):
+            airspace.save_plane(plane,
+                                runway_id=pk_of(runway),
+                                arrive_at_runway_time=None,
+                                gate_id=None,
+                                heading=0,
+                                speed=0,
+                                take_off_airport_id=plane.land_airport_id,
+                                land_airport_id=None,
+                                take_off_time=None,
+                                landing_time=None)
 
 
 def check_airport(plane):
-    if plane.airline not in plane.land_airport.airlines.all():
+    if not airspace.authorized(plane.airline_id, plane.land_airport_id):
+        metrics.CONFLICTS.labels("WRONG_AIRPORT").inc()
         send_warning({
             "team_id": TEAM_ID,
             "error": "WRONG_AIRPORT",
@@ -134,7 +174,7 @@ def check_airport(plane):
 
 
 def check_set1(plane, set1, warned_for_current_plane):
-    if set1.count() > 0:
+    if len(set1) > 0:
         if not warned_for_current_plane:
             warned_for_current_plane = True
             send_warning({
@@ -143,7 +183,7 @@ def check_set1(plane, set1, warned_for_current_plane):
                 "obj_type": "PLANE",
                 "id": plane.identifier
             })
-        for collidy_plane in set1.all():
+        for collidy_plane in set1:
             send_warning({
                 "team_id": TEAM_ID,
                 "error": "COLLISION_IMMINENT",
@@ -153,7 +193,7 @@ def check_set1(plane, set1, warned_for_current_plane):
 
 
 def check_set2(plane, set2, warned_for_current_plane):
-    if set2.count() > 0:
+    if len(set2) > 0:
         if not warned_for_current_plane:
             warned_for_current_plane = True
             send_warning({
@@ -162,7 +202,7 @@ def check_set2(plane, set2, warned_for_current_plane):
                 "obj_type": "PLANE",
                 "id": plane.identifier
             })
-        for collidy_plane in set2.all():
+        for collidy_plane in set2:
             send_warning({
                 "team_id": TEAM_ID,
                 "error": "COLLISION_IMMINENT",
@@ -172,61 +212,108 @@ def check_set2(plane, set2, warned_for_current_plane):
 
 
 def check_set3(plane, set3, warned_for_current_plane):
-    if set3.count() > 0:
-        for collidy_plane in set3.all():
-            if arrive_at_intersection_at_same_minute(plane, collidy_plane):
-                if not warned_for_current_plane:
-                    warned_for_current_plane = True
-                    send_warning({
-                        "team_id": TEAM_ID,
-                        "error": "COLLISION_IMMINENT",
-                        "obj_type": "PLANE",
-                        "id": plane.identifier
-                    })
-                send_warning({
-                    "team_id": TEAM_ID,
-                    "error": "COLLISION_IMMINENT",
-                    "obj_type": "PLANE",
-                    "id": collidy_plane.identifier
-                })
+    for identifier in set3:
+        if not warned_for_current_plane:
+            warned_for_current_plane = True
+            send_warning({
+                "team_id": TEAM_ID,
+                "error": "COLLISION_IMMINENT",
+                "obj_type": "PLANE",
+                "id": plane.identifier
+            })
+        send_warning({
+            "team_id": TEAM_ID,
+            "error": "COLLISION_IMMINENT",
+            "obj_type": "PLANE",
+            "id": identifier
+        })
 
 
 @csrf_exempt
 def handle_heading_publish(request):
-    body = json.loads(request.body)
-    print(body)
-    plane = Plane.objects.filter(identifier=body["plane"]).first()
-    direction = float(body["direction"])
-    speed = float(body["speed"])
-    origin = Airport.objects.filter(name=body["origin"]).first()
-    destination = Airport.objects.filter(name=body["destination"]).first()
-    take_off_time = parser.parse(body["take_off_time"])
-    landing_time = parser.parse(body["landing_time"])
-
-    plane.take_off_airport = origin
-    plane.land_airport = destination
-    plane.take_off_time = take_off_time
-    plane.landing_time = landing_time
-    plane.heading = direction
-    plane.speed = speed
-    plane.runway = None
-    plane.save()
-
-    check_airport(plane)
-
-    warned_for_current_plane = False
-    set1 = Plane.objects.exclude(landing_time=None).filter(take_off_airport=plane.land_airport,
-                                                           land_airport=plane.take_off_airport)
-    check_set1(plane, set1, warned_for_current_plane)
-
-    set2 = Plane.objects.exclude(landing_time=None).filter(take_off_airport=plane.take_off_airport,
-                                                           land_airport=plane.land_airport,
-                                                           landing_time__gt=plane.landing_time)
-    check_set2(plane, set2, warned_for_current_plane)
-
-    # now check for intersecting planes
-    set3 = Plane.objects.exclude(Q(take_off_airport=plane.take_off_airport, land_airport=plane.land_airport) | Q(
-        take_off_airport=plane.land_airport, land_airport=plane.take_off_airport)).exclude(landing_time=None)
-    check_set3(plane, set3, warned_for_current_plane)
+    return handle_publish(request, "headings")
+
 
+@csrf_exempt
+def handle_heading_batch_publish(request):
+    try:
+        with stage("headings", "decode"):
+            body = loads(request.body)
+            if not isinstance(body, list):
+                raise MessageError("expected a list of headings")
+            headings = []
+            for index, heading in enumerate(body):
+                try:
+                    headings.append(decode("headings", heading))
+                except MessageError as error:
+                    raise MessageError(f"heading {index}: {error}")
+        # every plane and airport is looked up before any heading is applied, so that an unknown one fails the whole
+        # batch instead of leaving the headings before it applied
+        airspace.sync()
+        with stage("headings", "lookup"):
+            for index, heading in enumerate(headings):
+                try:
+                    known(airspace.plane(heading.plane), "plane", heading.plane)
+                    known(airspace.airport(heading.origin), "airport", heading.origin)
+                    known(airspace.airport(heading.destination), "airport", heading.destination)
+                except MessageError as error:
+                    raise MessageError(f"heading {index}: {error}")
+        # every message is still checked against the state left by the ones before it, so the warnings are the same
+        # as publishing them one at a time; only the database writes are batched
+        with airspace.deferred_writes():
+            for heading in headings:
+                publish_heading(heading)
+    except MessageError as error:
+        return HttpResponseBadRequest(str(error))
     return HttpResponse()
+
+
+@one_publish
+def publish_heading(message):
+    with stage("headings", "lookup"):
+        plane = known(airspace.plane(message.plane), "plane", message.plane)
+        origin = known(airspace.airport(message.origin), "airport", message.origin)
+        destination = known(airspace.airport(message.destination), "airport", message.destination)
+    with stage("headings", "save"):
+        airspace.save_plane(plane,
+                            take_off_airport_id=pk_of(origin),
+                            land_airport_id=pk_of(destination),
+                            take_off_time=message.take_off_time,
+                            landing_time=message.landing_time,
+                            heading=message.direction,
+                            speed=message.speed,
+                            runway_id=None)
+
+    with stage("headings", "airport"):
+        check_airport(plane)
+
+    # the candidates are gathered before any warning goes out, each stage timed on its own
+    with stage("headings", "head_on"):
+        set1 = airspace.head_on(plane)
+    with stage("headings", "behind"):
+        set2 = airspace.behind(plane)
+    with stage("headings", "crossing"):
+        crossing = airspace.crossing(plane)
+    # now check for intersecting planes, only those airborne at the same time can meet
+    with stage("headings", "geometry"):
+        set3 = list(tbone_conflicts(plane, RouteBatch.from_planes(crossing)))
+    for check, candidates in (("head_on", set1), ("behind", set2), ("crossing", crossing)):
+        metrics.CONFLICT_CANDIDATES.labels(check).observe(len(candidates))
+    for kind, conflicts in (("HEAD_ON", set1), ("REAR", set2), ("INTERSECTION", set3)):
+        if conflicts:
+            metrics.CONFLICTS.labels(kind).inc(len(conflicts))
+
+    with stage("headings", "warn"):
+        warned_for_current_plane = False
+        check_set1(plane, set1, warned_for_current_plane)
+        check_set2(plane, set2, warned_for_current_plane)
+        check_set3(plane, set3, warned_for_current_plane)
+
+
+# message kind -> handler of its decoded messages, shared by the HTTP endpoints and the process_kafka consumer
+PUBLISHERS = {
+    "counts": publish_passenger_count,
+    "headings": publish_heading,
+    "gates": publish_gate,
+    "runways": publish_runway,
+}
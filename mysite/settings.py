@@ -56,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ATC2_0.traffic.TrafficRecorderMiddleware',
     'django_prometheus.middleware.PrometheusAfterMiddleware',
 ]
 
@@ -104,13 +105,71 @@ DATABASES = {
     }
 }
 
-# Do we need this???
-#CACHES = {
-#    'default': {
-#        'BACKEND': 'django_prometheus.cache.backends',
-#        'LOCATION': '????',
-#    }
-#}
+# Rendered list pages are cached, see ATC2_0/list_cache.py. Every process gets its own local memory cache unless
+# CACHE_DIR points the processes on a host at a shared file based one, which also lets the changes made by
+# management commands reach the web processes right away. Plane pages are also keyed on the AirspaceChange log (see
+# AIRSPACE_CHANGE_RETENTION below), so the ingest processes' writes retire them with either cache.
+if os.environ.get("CACHE_DIR"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_prometheus.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ["CACHE_DIR"],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_prometheus.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'atc',
+        }
+    }
+LIST_CACHE_TIMEOUT = 300  # seconds a page is kept, 0 turns the list cache off
+
+# Every process keeps its own copy of the planes, see ATC2_0/airspace.py. Each write is also logged as an AirspaceChange
+# row that the other processes catch up from before every publish; rows older than this many seconds are deleted, and
+# a process that has not caught up for half of it loads everything again.
+AIRSPACE_CHANGE_RETENTION = 3600
+
+# Warnings are queued in the OutboundWarning table and posted to the error report by background workers,
+# see ATC2_0/outbox.py
+
+ERROR_REPORT_URL = os.environ.get("ERROR_REPORT_URL", "https://evently.bjucps.dev/app/error_report")
+ERROR_REPORT_CONNECT_TIMEOUT = 2  # seconds
+ERROR_REPORT_TIMEOUT = 5  # seconds to wait for a response
+ERROR_REPORT_POOL_SIZE = 4  # keep-alive connections, one per worker
+ERROR_REPORT_BATCH_SIZE = 1  # warnings per request, only raise it if the sink accepts a JSON array
+WARNING_OUTBOX_SIZE = 100000
+WARNING_WORKERS = 4
+WARNING_BATCH_SIZE = 50
+WARNING_MAX_ATTEMPTS = 10
+WARNING_RETRY_BACKOFF = 1  # seconds, doubled on every attempt
+WARNING_RETRY_BACKOFF_MAX = 300
+WARNING_BREAKER_THRESHOLD = 5  # failures in a row
+WARNING_BREAKER_COOLDOWN = 30  # seconds
+WARNING_COALESCE_TTL = 60  # seconds the same warning for the same plane is sent at most once in
+
+KAFKA_BOOTSTRAP_SERVERS = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092").split(",")
+KAFKA_GROUP_ID = os.environ.get("KAFKA_GROUP_ID", "atc")
+KAFKA_TOPICS = {  # message kind -> topic
+    "counts": "counts",
+    "headings": "headings",
+    "gates": "gates",
+    "runways": "runways",
+}
+KAFKA_BATCH_SIZE = 500  # records per poll, processed and committed together
+KAFKA_POLL_TIMEOUT = 1000  # milliseconds, also bounds how long a shutdown waits
+
+# the serve_ingest command, an asyncio server for just the publish endpoints, see ATC2_0/ingest_server.py
+INGEST_PORT = 8001
+INGEST_WORKERS = 4  # threads doing the database work, batches processed at once
+INGEST_BATCH_SIZE = 100  # most pipelined requests of one connection handled together
+
+# set to a file to capture what is posted to the publish endpoints, for replay_traffic
+TRAFFIC_RECORD_PATH = os.environ.get("TRAFFIC_RECORD_PATH")
+
+# rows per page of the plane, gate, runway, airport and airline lists, ?size= can ask for up to the maximum
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 1000
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -11,4 +11,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# start delivering warnings left in the outbox by the previous process
+from ATC2_0.outbox import outbox  # noqa: E402
+outbox.start()